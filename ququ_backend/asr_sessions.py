@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分块上传的转录会话
+客户端边录音边上传PCM分块，服务器在累积的缓冲区上做VAD，语音段一结束就用离线模型解码；
+结束录音（finalize）时只剩最后一段需要解码，等待时间基本不随录音长度增长
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from typing import Optional, Dict, Any, List, Callable, Tuple
+
+import numpy as np
+
+from audio_io import pcm_bytes_to_array, pcm_frame_size
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLimitError(RuntimeError):
+    """同时打开的会话数已达上限"""
+
+
+class SessionFailedError(RuntimeError):
+    """会话解码连续失败，已放弃"""
+
+
+class ASRSession:
+    """
+    一个转录会话
+
+    pending缓冲区只保存尚未解码的音频：已闭合的语音段解码后即从缓冲区丢弃，
+    内存占用取决于当前未结束的语音段长度，而不是录音总长度。
+    """
+
+    def __init__(self, session_id: str, backend, sample_rate: int = 16000,
+                 fmt: str = "s16le", channels: int = 1,
+                 options: Optional[Dict[str, Any]] = None,
+                 scan_step_s: float = 1.0, max_segment_s: float = 30.0, max_retries: int = 2):
+        """
+        Args:
+            session_id: 会话ID
+            backend: 提供detect_segments/transcribe_audio的ASR后端
+            sample_rate: 上传PCM的采样率
+            fmt: 上传PCM的采样格式（见audio_io.PCM_FORMATS）
+            channels: 上传PCM的声道数
+            options: 转录选项（use_vad/use_punc/hotword/priority）
+            scan_step_s: 新到达的音频累计超过该时长（秒）后才重新做VAD
+            max_segment_s: 语音段超过该时长仍未结束时强制解码
+            max_retries: 解码失败后重试的次数，连续失败超过该次数后会话失败，之后的分块返回错误
+        """
+        self.session_id = session_id
+        self.backend = backend
+        self.sample_rate = sample_rate
+        self.fmt = fmt
+        self.channels = channels
+        self.options = {"use_vad": True, "use_punc": True, "hotword": "", "priority": "interactive"}
+        self.options.update(options or {})
+
+        self.scan_step = int(scan_step_s * sample_rate)
+        self.max_segment = int(max_segment_s * sample_rate)
+        # 结束位置距离缓冲区末尾不足该长度的语音段可能仍在继续
+        self.tail_guard = int(0.3 * sample_rate)
+
+        self.frame_size = pcm_frame_size(fmt, channels)
+        # 上一分块末尾不足一帧的字节，拼到下一分块开头（分块边界不保证按采样点对齐）
+        self._leftover = b""
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.pending_start = 0  # pending缓冲区起点在整个录音中的采样点位置
+        self.received_samples = 0
+        self.chunk_count = 0
+        self.segments: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self.max_retries = max_retries
+        self.failures = 0
+        self.failed = False
+        self.finalized = False
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+        self._unscanned = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # ==================== 音频接收 ====================
+
+    def append(self, data: bytes) -> int:
+        """追加一个PCM分块，返回本分块的采样点数；累计足够的新音频时在后台解码"""
+        if self.failed:
+            raise SessionFailedError(f"会话解码失败: {self.error}")
+        if self.finalized:
+            raise RuntimeError("会话已结束")
+
+        data = self._leftover + data
+        usable = len(data) - len(data) % self.frame_size
+        self._leftover = data[usable:]
+        samples = pcm_bytes_to_array(data[:usable], self.fmt, self.channels)
+        self.pending = np.concatenate([self.pending, samples]) if self.pending.size else samples
+        self.received_samples += len(samples)
+        self.chunk_count += 1
+        self._unscanned += len(samples)
+        self.updated_at = time.time()
+
+        if self._unscanned >= self.scan_step:
+            self._schedule()
+        return len(samples)
+
+    def _schedule(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._process(final=False))
+
+    # ==================== 解码 ====================
+
+    async def _process(self, final: bool):
+        """对当前缓冲区做一次VAD并解码已闭合的语音段"""
+        async with self._lock:
+            snapshot = self.pending
+            self._unscanned = 0
+            if not snapshot.size:
+                return
+
+            try:
+                cut, decoded = await asyncio.to_thread(self._decode_closed, snapshot, final)
+            except Exception as e:
+                # 未解码的音频保留在缓冲区中，下次扫描时重试；连续失败超过上限后放弃会话并释放缓冲区
+                self.error = str(e)
+                self.failures += 1
+                if self.failures > self.max_retries:
+                    self.failed = True
+                    self.pending = np.zeros(0, dtype=np.float32)
+                    logger.error(f"会话 {self.session_id} 解码连续失败{self.failures}次，放弃: {self.error}")
+                else:
+                    logger.warning(f"会话 {self.session_id} 解码失败（第{self.failures}次），稍后重试: {self.error}")
+                return
+
+            self.error = None
+            self.failures = 0
+
+            # 处理期间可能又收到了新分块，只丢弃已解码的部分
+            base = self.pending_start
+            self.pending = self.pending[cut:]
+            self.pending_start += cut
+            for begin, end, text in decoded:
+                self.segments.append({
+                    "start": round((base + begin) / self.sample_rate, 2),
+                    "end": round((base + end) / self.sample_rate, 2),
+                    "text": text,
+                })
+
+        if not final and self._unscanned >= self.scan_step:
+            self._schedule()
+
+    def _find_cut(self, samples: np.ndarray, final: bool) -> Tuple[int, List[Tuple[int, int]]]:
+        """确定本次可以解码到的位置和要解码的语音段"""
+        length = len(samples)
+        segments = None
+        if self.options["use_vad"]:
+            segments = self.backend.detect_segments(samples, self.sample_rate, priority=self.options["priority"])
+
+        if segments is None:
+            # 无VAD：按固定长度切分
+            if final or length >= self.max_segment:
+                return length, [(0, length)]
+            return 0, []
+
+        if final:
+            return length, segments
+
+        closed = [seg for seg in segments if seg[1] < length - self.tail_guard]
+        if closed:
+            return closed[-1][1], closed
+        if not segments:
+            # 全是静音：丢弃，只保留末尾一小段以免切断刚开始的语音
+            return max(0, length - self.tail_guard), []
+        if length >= self.max_segment:
+            return length, segments
+        return 0, []
+
+    def _decode_closed(self, samples: np.ndarray, final: bool):
+        """在线程中执行：VAD + 逐段识别，返回(切分位置, [(开始, 结束, 文本), ...])"""
+        cut, segments = self._find_cut(samples, final)
+        options = {
+            "use_vad": False,
+            "use_punc": self.options["use_punc"],
+            "hotword": self.options["hotword"],
+            "priority": self.options["priority"],
+            "sample_rate": self.sample_rate,
+        }
+
+        decoded = []
+        for begin, end in segments:
+            result = self.backend.transcribe_audio(samples[begin:end], options)
+            if not result.get("success"):
+                raise RuntimeError(result.get("error", "转录失败"))
+            if result["text"].strip():
+                decoded.append((begin, end, result["text"].strip()))
+        return cut, decoded
+
+    async def finalize(self) -> Dict[str, Any]:
+        """结束会话：解码剩余的尾部音频并返回完整结果"""
+        self.finalized = True
+        started = time.time()
+        # 解码失败时在重试次数内重试
+        for _ in range(self.max_retries + 1):
+            await self._process(final=True)
+            if not self.error or self.failed:
+                break
+
+        if self.error:
+            return {"success": False, "session_id": self.session_id, "error": self.error,
+                    "type": "transcription_error"}
+
+        return {
+            "success": True,
+            "session_id": self.session_id,
+            "text": "".join(seg["text"] for seg in self.segments),
+            "segments": self.segments,
+            "duration": self.received_samples / float(self.sample_rate),
+            "chunks": self.chunk_count,
+            "finalize_latency": round(time.time() - started, 4),
+            "language": "zh-CN",
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "received_seconds": round(self.received_samples / float(self.sample_rate), 2),
+            "pending_seconds": round(len(self.pending) / float(self.sample_rate), 2),
+            "chunks": self.chunk_count,
+            "decoded_segments": len(self.segments),
+            "partial_text": "".join(seg["text"] for seg in self.segments),
+            "finalized": self.finalized,
+            "failed": self.failed,
+            "error": self.error,
+        }
+
+    def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+
+class SessionManager:
+    """会话表，超过TTL未活动的会话自动丢弃"""
+
+    def __init__(self, backend_getter: Callable[[], Any], ttl: Optional[float] = None,
+                 max_sessions: Optional[int] = None):
+        """
+        Args:
+            backend_getter: 返回当前ASR后端的函数（后端在后台初始化完成后才确定）
+            ttl: 会话空闲超时（秒），默认读取ASR_SESSION_TTL
+            max_sessions: 同时打开的会话上限，默认读取ASR_MAX_SESSIONS
+        """
+        self.backend_getter = backend_getter
+        self.ttl = ttl if ttl is not None else float(os.getenv("ASR_SESSION_TTL", "300"))
+        self.max_sessions = max_sessions or int(os.getenv("ASR_MAX_SESSIONS", "32"))
+        self.max_retries = int(os.getenv("ASR_SESSION_MAX_RETRIES", "2"))
+        self._sessions: Dict[str, ASRSession] = {}
+
+    def _reap_expired(self):
+        now = time.time()
+        for session_id, session in list(self._sessions.items()):
+            if now - session.updated_at > self.ttl:
+                logger.info(f"会话 {session_id} 空闲超时，已丢弃")
+                session.cancel()
+                del self._sessions[session_id]
+
+    def create(self, **kwargs) -> ASRSession:
+        self._reap_expired()
+        if len(self._sessions) >= self.max_sessions:
+            raise SessionLimitError(f"同时打开的会话数已达上限 ({self.max_sessions})")
+
+        session_id = uuid.uuid4().hex
+        kwargs.setdefault("max_retries", self.max_retries)
+        session = ASRSession(session_id, self.backend_getter(), **kwargs)
+        self._sessions[session_id] = session
+        logger.info(f"创建转录会话: {session_id}")
+        return session
+
+    def get(self, session_id: str) -> Optional[ASRSession]:
+        self._reap_expired()
+        return self._sessions.get(session_id)
+
+    def remove(self, session_id: str) -> Optional[ASRSession]:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.cancel()
+        return session
+
+    async def handle(self, op: str, session_id: Optional[str] = None, data: Optional[bytes] = None,
+                     **params) -> Dict[str, Any]:
+        """
+        执行一个会话操作，返回结果字典
+
+        单进程模式下由server.py直接调用；分离部署模式下会话保存在模型宿主中，各HTTP worker
+        经IPC转发到这里，因此同一会话的请求落到任意worker上都能找到会话。
+
+        Args:
+            op: create/append/status/finalize/delete
+            session_id: 会话ID（create以外必需）
+            data: append的PCM分块
+            params: create的参数（sample_rate/fmt/channels/options）
+        """
+        if op == "create":
+            try:
+                session = self.create(**params)
+            except SessionLimitError as e:
+                return {"success": False, "error": str(e), "type": "session_limit"}
+            return {"success": True, "session_id": session.session_id, "ttl": self.ttl}
+
+        session = self.get(session_id)
+        if session is None:
+            return {"success": False, "error": f"会话不存在或已过期: {session_id}", "type": "not_found"}
+
+        if op == "append":
+            try:
+                session.append(data or b"")
+            except SessionFailedError as e:
+                return {"success": False, "error": str(e), "type": "session_failed"}
+            except RuntimeError as e:
+                return {"success": False, "error": str(e), "type": "session_closed"}
+            return {"success": True, **session.get_status()}
+        if op == "status":
+            return {"success": True, **session.get_status()}
+        if op == "finalize":
+            result = await session.finalize()
+            self.remove(session_id)
+            return result
+        if op == "delete":
+            self.remove(session_id)
+            return {"success": True, "session_id": session_id}
+        return {"success": False, "error": f"未知的会话操作: {op}"}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"active_sessions": len(self._sessions), "max_sessions": self.max_sessions,
+                "ttl": self.ttl}
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+音频数据辅助函数
+在内存中把常见的PCM数据转换为FunASR可直接使用的float32数组，避免写临时文件
+"""
+
+import io
+import os
+import wave
+import subprocess
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+# 支持的原始PCM格式 -> (numpy dtype, 归一化系数)
+PCM_FORMATS = {
+    "s16le": ("<i2", 32768.0),
+    "s32le": ("<i4", 2147483648.0),
+    "f32le": ("<f4", 1.0),
+}
+
+
+def pcm_frame_size(fmt: str = "s16le", channels: int = 1) -> int:
+    """一帧（所有声道各一个采样点）的字节数"""
+    if fmt not in PCM_FORMATS:
+        raise ValueError(f"不支持的PCM格式: {fmt}")
+    return np.dtype(PCM_FORMATS[fmt][0]).itemsize * channels
+
+
+def pcm_bytes_to_array(data: bytes, fmt: str = "s16le", channels: int = 1) -> np.ndarray:
+    """
+    把原始PCM字节转换为单声道float32数组
+
+    Args:
+        data: PCM数据
+        fmt: 采样格式 (s16le/s32le/f32le)
+        channels: 声道数，多声道取平均
+
+    Returns:
+        float32数组，取值范围[-1, 1]；末尾不足一帧的字节被忽略（分块上传时由调用方保留到下一块）
+    """
+    frame = pcm_frame_size(fmt, channels)
+    dtype, scale = PCM_FORMATS[fmt]
+    usable = len(data) - len(data) % frame
+    samples = np.frombuffer(data[:usable], dtype=dtype)
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+
+    if scale == 1.0:
+        return samples.astype(np.float32, copy=False)
+    return (samples / scale).astype(np.float32)
+
+
+def is_wav_bytes(data: bytes) -> bool:
+    """数据是否以RIFF/WAVE文件头开始"""
+    return len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WAVE"
+
+
+def wav_bytes_to_pcm(data: bytes) -> Optional[Tuple[np.ndarray, int]]:
+    """
+    在内存中解码WAV文件
+
+    16/32位PCM用标准库wave解码；其他编码（IEEE float、8/24位PCM等）在安装了soundfile时由soundfile解码。
+
+    Returns:
+        (float32数组, 采样率)；不是WAV或无法解码时返回None，由调用方回退到文件方式或拒绝请求
+    """
+    if not is_wav_bytes(data):
+        return None
+
+    try:
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            fmt = {2: "s16le", 4: "s32le"}.get(wav.getsampwidth())
+            if fmt is not None:
+                channels = wav.getnchannels()
+                sample_rate = wav.getframerate()
+                frames = wav.readframes(wav.getnframes())
+                return pcm_bytes_to_array(frames, fmt, channels), sample_rate
+    except (wave.Error, EOFError):
+        # 非PCM编码（如IEEE float、ADPCM）由wave模块拒绝
+        pass
+
+    try:
+        import soundfile
+
+        samples, sample_rate = soundfile.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    except Exception:
+        return None
+    return samples.mean(axis=1).astype(np.float32), int(sample_rate)
+
+
+def estimate_duration(data: bytes) -> Optional[float]:
+    """只读取文件头估算音频时长（秒），无法识别时返回None"""
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        try:
+            with wave.open(io.BytesIO(data), "rb") as wav:
+                return wav.getnframes() / float(wav.getframerate())
+        except (wave.Error, EOFError):
+            pass
+
+    try:
+        import soundfile
+
+        return soundfile.info(io.BytesIO(data)).duration
+    except Exception:
+        return None
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """读取音频文件时长（秒），不解码整个文件；无法获取时返回None"""
+    try:
+        with wave.open(os.fspath(path), "rb") as wav:
+            return wav.getnframes() / float(wav.getframerate())
+    except (wave.Error, EOFError, OSError):
+        pass
+
+    try:
+        import soundfile
+
+        return soundfile.info(path).duration
+    except Exception:
+        pass
+
+    try:
+        import librosa
+
+        return librosa.get_duration(path=path)
+    except Exception:
+        return None
+
+
+def _resample(samples: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    if orig_sr == target_sr:
+        return samples
+    import librosa
+
+    return librosa.resample(samples, orig_sr=orig_sr, target_sr=target_sr).astype(np.float32)
+
+
+def _iter_wave_blocks(path: str, window_s: float, target_sr: int) -> Iterator[np.ndarray]:
+    with wave.open(path, "rb") as wav:
+        fmt = {2: "s16le", 4: "s32le"}[wav.getsampwidth()]
+        channels = wav.getnchannels()
+        sample_rate = wav.getframerate()
+        blocksize = max(1, int(window_s * sample_rate))
+        while True:
+            frames = wav.readframes(blocksize)
+            if not frames:
+                break
+            yield _resample(pcm_bytes_to_array(frames, fmt, channels), sample_rate, target_sr)
+
+
+def _iter_soundfile_blocks(path: str, window_s: float, target_sr: int) -> Iterator[np.ndarray]:
+    import soundfile
+
+    with soundfile.SoundFile(path) as f:
+        blocksize = max(1, int(window_s * f.samplerate))
+        while True:
+            block = f.read(blocksize, dtype="float32", always_2d=True)
+            if len(block) == 0:
+                break
+            yield _resample(block.mean(axis=1), f.samplerate, target_sr)
+
+
+def _iter_ffmpeg_blocks(path: str, window_s: float, target_sr: int) -> Iterator[np.ndarray]:
+    """soundfile无法读取的格式（m4a等）通过ffmpeg管道流式解码为16k单声道float32"""
+    process = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-v", "error", "-i", path,
+         "-f", "f32le", "-ac", "1", "-ar", str(target_sr), "-"],
+        stdout=subprocess.PIPE,
+    )
+    blocksize = max(1, int(window_s * target_sr)) * 4
+    try:
+        while True:
+            data = process.stdout.read(blocksize)
+            if not data:
+                break
+            yield pcm_bytes_to_array(data, "f32le")
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def iter_audio_windows(audio, window_s: float, sample_rate: int = 16000,
+                       target_sr: int = 16000) -> Iterator[Tuple[np.ndarray, bool]]:
+    """
+    按固定时长窗口逐段读取音频，内存占用只与窗口长度有关
+
+    Args:
+        audio: 文件路径或float32数组
+        window_s: 窗口时长（秒）
+        sample_rate: audio为数组时的采样率
+        target_sr: 输出采样率
+
+    Yields:
+        (float32单声道数组, 是否为最后一个窗口)
+    """
+    if isinstance(audio, np.ndarray):
+        step = max(1, int(window_s * sample_rate))
+        blocks = (
+            _resample(audio[i:i + step], sample_rate, target_sr)
+            for i in range(0, len(audio), step)
+        )
+    else:
+        path = os.fspath(audio)
+        try:
+            # PCM WAV用标准库读取，其他格式优先soundfile
+            with wave.open(path, "rb") as wav:
+                if wav.getsampwidth() not in (2, 4):
+                    raise wave.Error("unsupported sample width")
+            blocks = _iter_wave_blocks(path, window_s, target_sr)
+        except (wave.Error, EOFError, OSError):
+            try:
+                import soundfile
+
+                soundfile.info(path)
+                blocks = _iter_soundfile_blocks(path, window_s, target_sr)
+            except Exception:
+                blocks = _iter_ffmpeg_blocks(path, window_s, target_sr)
+
+    # 预读一个窗口以判断是否为最后一个
+    previous = None
+    for block in blocks:
+        if previous is not None:
+            yield previous, False
+        previous = block
+    if previous is not None:
+        yield previous, True
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ASR推理后端路由
+主后端（GPU）繁忙时把溢出的请求分流到CPU后端（ONNX int8），增加一份可用的执行资源
+"""
+
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict
+
+from inference_scheduler import DEFAULT_PRIORITY
+
+logger = logging.getLogger(__name__)
+
+
+class OverflowRouter:
+    """
+    溢出路由策略
+
+    主后端的进行中请求数未达到上限时使用主后端；达到上限且溢出后端已就绪时使用溢出后端。
+    两个后端都满时仍排队等待主后端（GPU单次推理通常比CPU快）。
+    """
+
+    def __init__(self, primary, overflow=None, primary_max_inflight: int = 2,
+                 overflow_max_inflight: int = 1):
+        self.primary = primary
+        self.overflow = overflow
+        self.primary_max_inflight = primary_max_inflight
+        self.overflow_max_inflight = overflow_max_inflight
+        self._lock = threading.Lock()
+        self._inflight = {"primary": 0, "overflow": 0}
+        self._routed = {"primary": 0, "overflow": 0}
+
+    def _choose(self) -> str:
+        overflow_ready = self.overflow is not None and self.overflow.initialized
+        if (
+            overflow_ready
+            and self._inflight["primary"] >= self.primary_max_inflight
+            and self._inflight["overflow"] < self.overflow_max_inflight
+        ):
+            return "overflow"
+        return "primary"
+
+    @contextmanager
+    def route(self):
+        """选择后端并在使用期间计入进行中请求数"""
+        with self._lock:
+            target = self._choose()
+            self._inflight[target] += 1
+            self._routed[target] += 1
+
+        if target == "overflow":
+            logger.info("主后端繁忙，请求分流到CPU后端")
+
+        try:
+            yield getattr(self, target)
+        finally:
+            with self._lock:
+                self._inflight[target] -= 1
+
+    def transcribe_audio(self, audio, options=None) -> Dict[str, Any]:
+        with self.route() as backend:
+            return backend.transcribe_audio(audio, options)
+
+    def transcribe_batch(self, audios, options=None):
+        # 批处理任务只在主后端（GPU）上执行，CPU后端留给交互请求分流
+        return self.primary.transcribe_batch(audios, options)
+
+    def detect_segments(self, samples, sample_rate=16000, priority=DEFAULT_PRIORITY):
+        with self.route() as backend:
+            return backend.detect_segments(samples, sample_rate, priority=priority)
+
+    def transcribe_long_audio(self, audio, options=None):
+        with self.route() as backend:
+            yield from backend.transcribe_long_audio(audio, options)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "overflow_enabled": self.overflow is not None,
+                "overflow_ready": self.overflow is not None and self.overflow.initialized,
+                "primary_max_inflight": self.primary_max_inflight,
+                "overflow_max_inflight": self.overflow_max_inflight,
+                "inflight": dict(self._inflight),
+                "routed": dict(self._routed),
+            }
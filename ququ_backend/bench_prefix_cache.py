@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM前缀缓存基准测试
+用prompts.py的文本优化模板向Ollama /api/chat发送流式请求，测量首token时间（TTFT）：
+- prefix：模板原样发送，连续请求共享静态前缀，Ollama复用KV缓存
+- cold：在系统提示词最前面加入随机串，每个请求的前缀都不同，无法复用
+
+用法:
+    python bench_prefix_cache.py --base-url http://192.168.100.38:11434 --model gpt-oss:20b --runs 10
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import statistics
+
+import httpx
+
+from prompts import correction_messages
+from hotwords_with_variants import format_hotwords_for_llm
+
+SAMPLE_TEXTS = [
+    "嗯帮我查一下deep sik最新的模型有没有开源",
+    "那个把这段代码提交到get hub上然后发个消息给他",
+    "我想试一下千问三的效果跟杰玛比怎么样",
+    "啊今天下午三点的会改到明天上午十点",
+    "用派托吃训练的时候显存总是不够用怎么办",
+    "打开home assistant把客厅的灯关掉",
+]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def run_once(client, base_url, model, messages, num_ctx, keep_alive):
+    """发送一个流式请求，返回(TTFT秒, 总耗时秒, prompt_eval_count, prompt_eval_duration秒)"""
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+        "think": False,
+        "keep_alive": keep_alive,
+        "options": {"num_predict": 64, "temperature": 0.3, "num_ctx": num_ctx, "stop": ["\n\n"]},
+    }
+    start = time.perf_counter()
+    ttft = None
+    final = {}
+    with client.stream("POST", f"{base_url}/api/chat", json=payload) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            message = chunk.get("message", {})
+            if ttft is None and (message.get("content") or message.get("thinking")):
+                ttft = time.perf_counter() - start
+            if chunk.get("done"):
+                final = chunk
+    total = time.perf_counter() - start
+    return (
+        ttft if ttft is not None else total,
+        total,
+        final.get("prompt_eval_count", 0),
+        final.get("prompt_eval_duration", 0) / 1e9,
+    )
+
+
+def bench(client, args, hotwords_context, cold):
+    ttfts, prompt_tokens, prompt_times = [], [], []
+    for i in range(args.runs):
+        messages = correction_messages(SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)], "optimize", None, hotwords_context)
+        if cold:
+            messages[0] = {"role": "system", "content": f"[{uuid.uuid4().hex}] {messages[0]['content']}"}
+        ttft, total, count, duration = run_once(
+            client, args.base_url, args.model, messages, args.num_ctx, args.keep_alive
+        )
+        ttfts.append(ttft)
+        prompt_tokens.append(count)
+        prompt_times.append(duration)
+        print(f"  #{i + 1:02d} TTFT {ttft * 1000:7.1f}ms  总耗时 {total * 1000:7.1f}ms  "
+              f"prefill {count:4d} tokens / {duration * 1000:6.1f}ms")
+    return {
+        "ttft_p50": statistics.median(ttfts),
+        "ttft_p95": percentile(ttfts, 0.95),
+        "prompt_tokens": statistics.mean(prompt_tokens),
+        "prompt_eval": statistics.mean(prompt_times),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM前缀缓存TTFT基准测试")
+    parser.add_argument("--base-url", default=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+                        help="Ollama地址（不含/v1）")
+    parser.add_argument("--model", default=os.getenv("OLLAMA_MODEL", "gpt-oss:20b"))
+    parser.add_argument("--runs", type=int, default=10, help="每种模式的请求数")
+    parser.add_argument("--num-ctx", type=int, default=int(os.getenv("OLLAMA_NUM_CTX", "4096")))
+    parser.add_argument("--keep-alive", default=os.getenv("OLLAMA_KEEP_ALIVE", "30m"))
+    args = parser.parse_args()
+    args.base_url = args.base_url.rstrip("/")
+    if args.base_url.endswith("/v1"):
+        args.base_url = args.base_url[:-3]
+
+    hotwords_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hotwords.txt")
+    hotwords = []
+    if os.path.exists(hotwords_file):
+        with open(hotwords_file, encoding="utf-8") as f:
+            hotwords = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    hotwords_context = format_hotwords_for_llm(hotwords, max_words=50) or None
+
+    print(f"🌐 {args.base_url}  模型: {args.model}  每种模式 {args.runs} 次")
+    with httpx.Client(timeout=300.0) as client:
+        # 预热：确保模型已加载，且共享前缀已在缓存中
+        try:
+            run_once(client, args.base_url, args.model,
+                     correction_messages(SAMPLE_TEXTS[0], "optimize", None, hotwords_context),
+                     args.num_ctx, args.keep_alive)
+        except httpx.HTTPError as e:
+            print(f"❌ 无法连接Ollama: {e}")
+            sys.exit(1)
+
+        print("\n▶ cold（每次请求前缀不同）")
+        cold = bench(client, args, hotwords_context, cold=True)
+        print("\n▶ prefix（共享静态前缀）")
+        prefix = bench(client, args, hotwords_context, cold=False)
+
+    print("\n" + "-" * 60)
+    print(f"{'模式':<8}{'TTFT p50':>12}{'TTFT p95':>12}{'prefill tokens':>16}{'prefill耗时':>12}")
+    for name, result in (("cold", cold), ("prefix", prefix)):
+        print(f"{name:<8}{result['ttft_p50'] * 1000:>10.1f}ms{result['ttft_p95'] * 1000:>10.1f}ms"
+              f"{result['prompt_tokens']:>16.0f}{result['prompt_eval'] * 1000:>10.1f}ms")
+    if prefix["ttft_p50"] > 0:
+        print(f"\nTTFT p50加速: {cold['ttft_p50'] / prefix['ttft_p50']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求取消的传递
+客户端断开后，asyncio一侧的取消（CancelledError）到不了推理线程池中排队的任务，也到不了模型宿主进程。
+取消令牌保存在contextvar中，asyncio.to_thread复制上下文，推理线程可以读到；调度器在等待执行权时
+发现令牌已取消即放弃排队，不再占用GPU；分离部署模式下令牌取消时向模型宿主发送cancel命令，
+宿主取消对应命令的令牌
+"""
+
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+from metrics import REGISTRY
+
+_cancelled = REGISTRY.counter(
+    "ququ_cancelled_total",
+    "Work abandoned because the client went away (request, stream, asr, llm)",
+    ("stage",),
+)
+
+_current_token: contextvars.ContextVar[Optional["CancelToken"]] = contextvars.ContextVar(
+    "cancel_token", default=None
+)
+
+
+class InferenceCancelled(Exception):
+    """请求已取消，放弃尚未开始的推理"""
+
+
+class CancelToken:
+    """线程安全的取消标志；取消时依次调用注册的回调（在调用cancel的线程中）"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]):
+        """注册取消回调；已取消时立即调用"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def check(self):
+        """已取消时抛出InferenceCancelled"""
+        if self._event.is_set():
+            raise InferenceCancelled(f"请求已取消: {self.reason}")
+
+
+def current_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+
+@contextmanager
+def use_token(token: CancelToken) -> Iterator[CancelToken]:
+    """在当前上下文中绑定取消令牌（线程或独立的asyncio任务中使用）"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+@contextmanager
+def cancel_scope(reason: str = "cancelled") -> Iterator[CancelToken]:
+    """
+    绑定一个新的取消令牌，with块因任务被取消（CancelledError）或生成器被关闭（GeneratorExit）
+    而退出时取消令牌，正在线程中等待执行权的推理随之放弃
+    """
+    token = CancelToken()
+    with use_token(token):
+        try:
+            yield token
+        except (asyncio.CancelledError, GeneratorExit):
+            token.cancel(reason)
+            raise
+
+
+def record_cancelled(stage: str):
+    """计入一次因客户端离开而放弃的工作"""
+    _cancelled.inc(stage=stage)
@@ -11,12 +11,20 @@ import os
 import logging
 import traceback
 import signal
-import contextlib
-import io
 import argparse
 import glob
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from inference_scheduler import InferenceScheduler, DEFAULT_PRIORITY
+from memory_manager import MEMORY_MANAGER
+from logging_setup import redact_text
+from tracing import TRACER, span
+from cancellation import CancelToken, InferenceCancelled, use_token
+
 # 设置日志
 import tempfile
 import os
@@ -36,37 +44,76 @@ def get_log_path():
     return os.path.join(log_dir, "funasr_server.log")
 
 
-log_file_path = get_log_path()
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(log_file_path, encoding="utf-8"),
-        logging.StreamHandler(),  # 同时输出到控制台
-    ],
-)
 logger = logging.getLogger(__name__)
 
-# 记录日志文件位置
-logger.info(f"FunASR服务器日志文件: {log_file_path}")
 
+def setup_logging():
+    """
+    配置独立worker进程的日志
+
+    只在作为脚本运行时调用；被server.py导入时不在导入阶段配置日志，由宿主进程统一配置。
+    """
+    from logging_setup import setup_logging as setup_queue_logging
+
+    log_file_path = get_log_path()
+    # stdout用于IPC，控制台日志写stderr
+    setup_queue_logging(log_file_path, console_stream=sys.stderr)
+
+    # 记录日志文件位置
+    logger.info(f"FunASR服务器日志文件: {log_file_path}")
+
+
+def open_ipc_channel():
+    """
+    把进程的真实stdout(fd 1)复制为私有IPC通道，并把fd 1重定向到stderr
+
+    之后FunASR等库无论从Python层还是C层写stdout都只会进入stderr，
+    不会污染IPC数据流，也不需要在每次调用时替换sys.stdout。
+
+    Returns:
+        IPC通道的二进制文件对象
+    """
+    sys.stdout.flush()
+    ipc_fd = os.dup(1)
+    os.dup2(2, 1)
+    return os.fdopen(ipc_fd, "wb")
+
+
+# PyTorch模型仓库（ONNX后端的模型见onnx_backend.ONNX_MODELS）
+PYTORCH_MODELS = {
+    "asr": "damo/speech_paraformer-large_asr_nat-zh-cn-16k-common-vocab8404-pytorch",
+    "vad": "damo/speech_fsmn_vad_zh-cn-16k-common-pytorch",
+    "punc": "damo/punc_ct-transformer_zh-cn-common-vocab272727-pytorch",
+}
+
+
+# 会在同一请求上分多次返回结果的IPC命令
+STREAM_ACTIONS = ("transcribe_long",)
+
+# 不做推理的控制命令：在单独的小线程池中执行，不排在占用推理线程的长时间任务之后
+CONTROL_ACTIONS = ("status", "progress", "readiness", "stats", "unload", "cleanup",
+                   "session_create", "session_append", "session_status", "session_delete")
 
-@contextlib.contextmanager
-def suppress_stdout():
-    """上下文管理器：临时重定向stdout到devnull，避免FunASR库的非JSON输出干扰IPC通信"""
-    old_stdout = sys.stdout
-    devnull = open(os.devnull, "w")
-    try:
-        sys.stdout = devnull
-        yield
-    finally:
-        sys.stdout = old_stdout
-        devnull.close()
+# 分块上传会话的命令；创建/追加/查询/删除立即返回（解码在会话自己的事件循环上排队），
+# 只有finalize等待解码，走推理线程池
+SESSION_ACTIONS = ("session_create", "session_append", "session_status", "session_finalize", "session_delete")
 
 
 class FunASRServer:
-    def __init__(self, damo_root=None):
+    def __init__(self, damo_root=None, backend=None, device=None):
+        """
+        Args:
+            damo_root: 模型根目录
+            backend: 推理后端，torch（FunASR AutoModel）或 onnx（int8量化，CPU），默认读取FUNASR_BACKEND
+            device: torch后端使用的设备，默认读取FUNASR_DEVICE（cuda:0）
+        """
+        self.backend = backend or os.getenv("FUNASR_BACKEND", "torch")
+        if self.backend not in ("torch", "onnx"):
+            raise ValueError(f"未知的推理后端: {self.backend}")
+        self.device = "cpu" if self.backend == "onnx" else (device or os.getenv("FUNASR_DEVICE", "cuda:0"))
+        self.cpu_threads = int(os.getenv("FUNASR_CPU_THREADS", "4"))
+        self.backend_label = "onnx-int8-cpu" if self.backend == "onnx" else f"pytorch-{self.device}"
+
         self.asr_model = None
         self.vad_model = None
         self.punc_model = None
@@ -74,12 +121,66 @@ class FunASRServer:
         self.running = True
         self.transcription_count = 0
         self.total_audio_duration = 0.0
+        # 模型推理串行执行，按优先级类别和预计时长调度；帧协议下状态查询等命令可以与推理并发、乱序返回
+        self.scheduler = InferenceScheduler()
+        # 超过该时长（秒）的音频即使走普通转录接口也按语音段分别调度，可被交互请求抢占
+        self.long_audio_seconds = float(os.getenv("FUNASR_LONG_AUDIO_SECONDS", "120"))
+        # 批量转录中每次generate调用的音频总时长上限（秒）
+        self.batch_max_seconds = float(os.getenv("FUNASR_BATCH_MAX_SECONDS", "300"))
+
+        # 按模型懒加载：首次使用时加载，空闲超过TTL后卸载（0表示常驻）
+        self._model_loaders = {
+            "asr": ("asr_model", self._load_asr_model),
+            "vad": ("vad_model", self._load_vad_model),
+            "punc": ("punc_model", self._load_punc_model),
+        }
+        self._model_locks = {name: threading.Lock() for name in self._model_loaders}
+        self._model_info = {
+            name: {"load_count": 0, "unload_count": 0, "last_used": 0.0,
+                   "loaded_at": 0.0, "load_time": 0.0, "resident_bytes": 0}
+            for name in self._model_loaders
+        }
+        self.model_events = deque(maxlen=50)
+        self.preload_models = [
+            name.strip() for name in os.getenv("FUNASR_PRELOAD_MODELS", "asr,vad,punc").split(",")
+            if name.strip() in self._model_loaders
+        ]
+        self.model_idle_ttl = float(os.getenv("FUNASR_MODEL_IDLE_TTL", "0"))
+        self._reaper_thread = None
+        self._reaper_stop = threading.Event()
+        # 按内存水位线在后台清理，转录请求路径上不做GC
+        self.memory_manager = MEMORY_MANAGER
+
+        # 预热：初始化后用合成音频跑一遍各模型，完成后才算就绪（ready）
+        self.ready = False
+        self.warmup_enabled = os.getenv("FUNASR_WARMUP", "1") != "0"
+        self.warmup_seconds = [
+            float(x) for x in os.getenv("FUNASR_WARMUP_SECONDS", "1,5,15").split(",") if x.strip()
+        ]
+        self.warmup_stats = {}
+
+        # 长音频分窗口处理：每个窗口的时长（秒），VAD边界未闭合的语音段顺延到下一窗口
+        self.long_window_s = float(os.getenv("FUNASR_LONG_WINDOW_S", "60"))
+
+        # 结构化初始化进度，供/api/health在后台初始化期间查询
+        self._init_lock = threading.Lock()
+        self.init_progress = {
+            "stage": "pending",  # pending/importing/loading_models/warming_up/ready/failed
+            "models": {name: "pending" for name in self._model_loaders},
+            "import_times": {},
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+        }
+
+        # 分块上传会话（模型宿主模式下由各HTTP worker共享），首次使用时创建
+        self._sessions = None
+        self._sessions_loop = None
+        self._sessions_lock = threading.Lock()
 
         # 外部传入的 damo 根目录（例如 /Volumes/APFS/AI/models/damo）
         self.damo_root = damo_root or os.environ.get("DAMO_ROOT")
 
-        signal.signal(signal.SIGTERM, self._signal_handler)
-        signal.signal(signal.SIGINT, self._signal_handler)
         self._setup_runtime_environment()
 
     def _setup_runtime_environment(self):
@@ -88,29 +189,42 @@ class FunASRServer:
             import os
 
             # 设置线程数优化
-            os.environ["OMP_NUM_THREADS"] = "4"
+            os.environ["OMP_NUM_THREADS"] = str(self.cpu_threads)
             logger.info("运行时环境变量设置完成")
         except Exception as e:
             logger.warning(f"环境设置失败: {str(e)}")
 
+    def install_signal_handlers(self):
+        """注册退出信号处理（仅独立worker/模型宿主进程的主线程调用，嵌入server.py时由uvicorn处理信号）"""
+        signal.signal(signal.SIGTERM, self._signal_handler)
+        signal.signal(signal.SIGINT, self._signal_handler)
+
     def _signal_handler(self, signum, frame):
         """处理退出信号"""
         logger.info(f"收到信号 {signum}，准备退出...")
         self.running = False
 
+    def _create_model(self, name):
+        """按推理后端创建模型"""
+        if self.backend == "onnx":
+            from onnx_backend import load_onnx_model
+
+            return load_onnx_model(name, self.cpu_threads)
+
+        from funasr import AutoModel
+
+        return AutoModel(
+            model=PYTORCH_MODELS[name],
+            model_revision="v2.0.4",
+            disable_update=True,
+            device=self.device,  # 默认cuda:0 GPU加速
+        )
+
     def _load_asr_model(self):
         """加载ASR模型"""
         try:
-            logger.info("开始加载ASR模型...")
-            with suppress_stdout():
-                from funasr import AutoModel
-
-                self.asr_model = AutoModel(
-                    model="damo/speech_paraformer-large_asr_nat-zh-cn-16k-common-vocab8404-pytorch",
-                    model_revision="v2.0.4",
-                    disable_update=True,
-                    device="cuda:0",  # GPU加速
-                )
+            logger.info(f"开始加载ASR模型 (后端: {self.backend_label})...")
+            self.asr_model = self._create_model("asr")
             logger.info("ASR模型加载完成")
             return True
         except Exception as e:
@@ -120,16 +234,8 @@ class FunASRServer:
     def _load_vad_model(self):
         """加载VAD模型"""
         try:
-            logger.info("开始加载VAD模型...")
-            with suppress_stdout():
-                from funasr import AutoModel
-
-                self.vad_model = AutoModel(
-                    model="damo/speech_fsmn_vad_zh-cn-16k-common-pytorch",
-                    model_revision="v2.0.4",
-                    disable_update=True,
-                    device="cuda:0",  # GPU加速
-                )
+            logger.info(f"开始加载VAD模型 (后端: {self.backend_label})...")
+            self.vad_model = self._create_model("vad")
             logger.info("VAD模型加载完成")
             return True
         except Exception as e:
@@ -139,71 +245,283 @@ class FunASRServer:
     def _load_punc_model(self):
         """加载标点恢复模型"""
         try:
-            import time
-
             start_time = time.time()
-            logger.info("开始加载标点恢复模型...")
+            logger.info(f"开始加载标点恢复模型 (后端: {self.backend_label})...")
 
-            # 记录导入时间
-            import_start = time.time()
-            with suppress_stdout():
-                from funasr import AutoModel
-            import_time = time.time() - import_start
-            logger.info(f"FunASR导入耗时: {import_time:.2f}秒")
-
-            # 记录模型创建时间
-            model_start = time.time()
-            with suppress_stdout():
-                self.punc_model = AutoModel(
-                    model="damo/punc_ct-transformer_zh-cn-common-vocab272727-pytorch",
-                    model_revision="v2.0.4",
-                    disable_update=True,
-                    device="cuda:0",  # GPU加速
-                )
-            model_time = time.time() - model_start
+            self.punc_model = self._create_model("punc")
             total_time = time.time() - start_time
 
-            logger.info(
-                f"标点恢复模型加载完成 - 模型创建耗时: {model_time:.2f}秒, 总耗时: {total_time:.2f}秒"
-            )
+            logger.info(f"标点恢复模型加载完成 - 总耗时: {total_time:.2f}秒")
             return True
         except Exception as e:
             logger.error(f"标点恢复模型加载失败: {str(e)}")
             return False
 
+    # ==================== 初始化进度 ====================
+
+    def _set_init_stage(self, stage, error=None):
+        self.init_progress["stage"] = stage
+        if stage in ("ready", "failed"):
+            self.init_progress["finished_at"] = time.time()
+        if error:
+            self.init_progress["error"] = error
+
+    def get_init_progress(self):
+        """初始化进度快照"""
+        progress = dict(self.init_progress, models=dict(self.init_progress["models"]))
+        started_at = progress["started_at"]
+        if started_at:
+            end = progress["finished_at"] or time.time()
+            progress["elapsed"] = round(end - started_at, 2)
+        return progress
+
+    def _import_dependencies(self):
+        """
+        导入重量级依赖（torch、modelscope、funasr；ONNX后端为onnxruntime、funasr_onnx）
+
+        这些导入需要数秒，放在初始化任务中执行，而不是在模块导入时，
+        这样server.py可以先开始监听端口。librosa只在需要时才导入。
+        """
+        import importlib
+
+        if self.backend == "onnx":
+            modules = ("onnxruntime", "modelscope", "funasr_onnx")
+        else:
+            modules = ("torch", "modelscope", "funasr")
+
+        for module in modules:
+            import_start = time.time()
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                if module == "modelscope":
+                    continue
+                raise
+            self.init_progress["import_times"][module] = round(time.time() - import_start, 2)
+            logger.info(f"{module}导入耗时: {time.time() - import_start:.2f}秒")
+
+    # ==================== 预热与就绪 ====================
+
+    @staticmethod
+    def _synthetic_audio(seconds, sample_rate=16000):
+        """生成类语音的合成音频：带音节包络的谐波信号加少量噪声，使VAD判定为语音"""
+        import numpy as np
+
+        rng = np.random.default_rng(0)
+        t = np.arange(int(seconds * sample_rate)) / sample_rate
+        f0 = 120 + 30 * np.sin(2 * np.pi * 0.5 * t)  # 缓慢变化的基频
+        phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+        voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+        envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t))  # 约每秒4个音节
+        audio = 0.3 * voice * envelope + 0.01 * rng.standard_normal(len(t))
+        return audio.astype(np.float32)
+
+    def warmup(self):
+        """
+        用多种长度的合成音频预热已加载的模型
+
+        每个长度运行两次：第一次包含CUDA内核选择、显存分配器扩容和库内部懒初始化等
+        一次性开销（cold），第二次为稳态耗时（warm）。预热完成后才标记为就绪。
+        """
+        if not self.warmup_enabled:
+            self.ready = True
+            self._set_init_stage("ready")
+            return self.warmup_stats
+
+        self._set_init_stage("warming_up")
+
+        logger.info(f"开始模型预热，合成音频长度: {self.warmup_seconds}秒")
+        start_time = time.time()
+        stats = {"lengths": {}, "punc": None}
+
+        try:
+            if self.asr_model is not None:
+                options = {
+                    "batch_size_s": 60,
+                    "hotword": "",
+                    "use_vad": self.vad_model is not None,
+                    "use_punc": False,
+                }
+                for seconds in self.warmup_seconds:
+                    audio = self._synthetic_audio(seconds)
+                    runs = []
+                    for _ in range(2):
+                        run_start = time.time()
+                        stages = self._run_stages(audio, options, {"fs": 16000})
+                        runs.append({"total": round(time.time() - run_start, 4), **stages["timings"]})
+                    stats["lengths"][f"{seconds:g}s"] = {"cold": runs[0], "warm": runs[1]}
+                    logger.info(
+                        f"预热 {seconds:g}秒音频: cold {runs[0]['total']:.3f}s, warm {runs[1]['total']:.3f}s"
+                    )
+
+            if self.punc_model is not None:
+                sample_text = "今天下午三点在会议室讨论项目进度请大家准时参加"
+                runs = [self._restore_punctuation(sample_text)[1] for _ in range(2)]
+                stats["punc"] = {"cold": runs[0], "warm": runs[1]}
+
+        except Exception as e:
+            stats["error"] = str(e)
+            stats["total_time"] = round(time.time() - start_time, 2)
+            self.warmup_stats = stats
+            self._set_init_stage("failed", f"模型预热失败: {str(e)}")
+            logger.error(f"模型预热失败，保持未就绪状态: {str(e)}")
+            logger.error(traceback.format_exc())
+            return stats
+
+        stats["total_time"] = round(time.time() - start_time, 2)
+        self.warmup_stats = stats
+        self.ready = True
+        self._set_init_stage("ready")
+        logger.info(f"模型预热完成，耗时: {stats['total_time']:.2f}秒")
+        return stats
+
+    def get_readiness(self):
+        """就绪状态：模型已初始化且预热完成"""
+        return {
+            "ready": self.ready,
+            "initialized": self.initialized,
+            "warmup": self.warmup_stats,
+        }
+
+    # ==================== 模型生命周期 ====================
+
+    def _record_model_event(self, name, event, **details):
+        """记录模型加载/卸载事件"""
+        self.model_events.append({
+            "model": name,
+            "event": event,
+            "time": round(time.time(), 3),
+            **details,
+        })
+
+    @staticmethod
+    def _model_resident_bytes(model):
+        """估算模型参数和缓冲区占用的内存（字节）"""
+        try:
+            module = getattr(model, "model", None)
+            if module is None or not hasattr(module, "parameters"):
+                return 0
+            total = sum(p.numel() * p.element_size() for p in module.parameters())
+            total += sum(b.numel() * b.element_size() for b in module.buffers())
+            return int(total)
+        except Exception:
+            return 0
+
+    def _ensure_model(self, name):
+        """确保模型已加载（必要时加载），返回模型对象，加载失败返回None"""
+        attr, loader = self._model_loaders[name]
+        model = getattr(self, attr)
+        if model is not None:
+            self._model_info[name]["last_used"] = time.time()
+            return model
+
+        with self._model_locks[name]:
+            model = getattr(self, attr)
+            if model is None:
+                start_time = time.time()
+                self.init_progress["models"][name] = "loading"
+                if not loader():
+                    self.init_progress["models"][name] = "failed"
+                    self._record_model_event(name, "load_failed")
+                    return None
+                self.init_progress["models"][name] = "loaded"
+                model = getattr(self, attr)
+                info = self._model_info[name]
+                info["load_count"] += 1
+                info["loaded_at"] = time.time()
+                info["load_time"] = round(time.time() - start_time, 2)
+                info["resident_bytes"] = self._model_resident_bytes(model)
+                self._record_model_event(
+                    name, "loaded",
+                    load_time=info["load_time"],
+                    resident_mb=round(info["resident_bytes"] / 1024 ** 2, 1),
+                )
+            self._model_info[name]["last_used"] = time.time()
+            return model
+
+    def unload_model(self, name, reason="manual"):
+        """卸载模型并把内存归还系统"""
+        attr, _ = self._model_loaders[name]
+        with self._model_locks[name]:
+            if getattr(self, attr) is None:
+                return False
+            # 正在推理的调用持有模型的局部引用，推理结束后才会真正释放
+            setattr(self, attr, None)
+            self.init_progress["models"][name] = "unloaded"
+            info = self._model_info[name]
+            info["unload_count"] += 1
+            freed = info["resident_bytes"]
+            info["resident_bytes"] = 0
+
+        self._release_memory()
+        self._record_model_event(name, "unloaded", reason=reason,
+                                 freed_mb=round(freed / 1024 ** 2, 1))
+        logger.info(f"{name}模型已卸载 (原因: {reason})")
+        return True
+
+    def _release_memory(self):
+        """回收Python对象、CUDA缓存和C堆上的空闲内存"""
+        self.memory_manager.release(reason="model_unload")
+
+    def _start_idle_reaper(self):
+        """启动空闲模型回收线程"""
+        if self.model_idle_ttl <= 0 or self._reaper_thread is not None:
+            return
+
+        def reap():
+            interval = max(1.0, min(self.model_idle_ttl / 4, 30.0))
+            while not self._reaper_stop.wait(interval):
+                now = time.time()
+                for name, (attr, _) in self._model_loaders.items():
+                    idle = now - self._model_info[name]["last_used"]
+                    if getattr(self, attr) is not None and idle > self.model_idle_ttl:
+                        self.unload_model(name, reason=f"idle {idle:.0f}s")
+
+        self._reaper_thread = threading.Thread(target=reap, name="funasr-model-reaper", daemon=True)
+        self._reaper_thread.start()
+        logger.info(f"空闲模型回收已启用，TTL: {self.model_idle_ttl:.0f}秒")
+
     def initialize(self):
-        """并行初始化FunASR模型"""
+        """
+        初始化FunASR：并行预加载FUNASR_PRELOAD_MODELS指定的模型（默认全部），
+        其余模型在首次使用时加载
+        """
+        with self._init_lock:
+            # 并发调用（例如后台初始化进行中时有请求触发初始化）等待同一次初始化完成
+            result = self._initialize_locked()
+        if not result["success"]:
+            self._set_init_stage("failed", result.get("error"))
+        return result
+
+    def _initialize_locked(self):
         if self.initialized:
             return {"success": True, "message": "模型已初始化"}
 
         try:
-            import threading
-            import time
-
-            logger.info("正在并行初始化FunASR模型...")
+            self.init_progress["started_at"] = time.time()
+            self.init_progress["finished_at"] = None
+            self.init_progress["error"] = None
+            self._set_init_stage("importing")
+            self._import_dependencies()
+
+            self._set_init_stage("loading_models")
+            logger.info(f"正在并行初始化FunASR模型，预加载: {self.preload_models or '无（全部懒加载）'}")
             start_time = time.time()
 
             # 创建加载结果存储
             results = {}
 
-            def load_model_thread(model_name, load_func):
+            def load_model_thread(model_name):
                 """模型加载线程包装函数"""
                 thread_start = time.time()
-                results[model_name] = load_func()
+                results[model_name] = self._ensure_model(model_name) is not None
                 thread_time = time.time() - thread_start
                 logger.info(f"{model_name}模型加载线程耗时: {thread_time:.2f}秒")
 
-            # 创建并启动三个并行线程
+            # 每个预加载模型一个线程
             threads = [
-                threading.Thread(
-                    target=load_model_thread, args=("asr", self._load_asr_model)
-                ),
-                threading.Thread(
-                    target=load_model_thread, args=("vad", self._load_vad_model)
-                ),
-                threading.Thread(
-                    target=load_model_thread, args=("punc", self._load_punc_model)
-                ),
+                threading.Thread(target=load_model_thread, args=(name,))
+                for name in self.preload_models
             ]
 
             # 启动所有线程
@@ -231,12 +549,17 @@ class FunASRServer:
 
             total_time = time.time() - start_time
             self.initialized = True
+            self._start_idle_reaper()
+            self.memory_manager.start()
             logger.info(
                 f"所有FunASR模型并行初始化完成，总耗时: {total_time:.2f}秒"
             )
+
+            self.warmup()
             return {
                 "success": True,
                 "message": f"FunASR模型并行初始化成功，耗时: {total_time:.2f}秒",
+                "ready": self.ready,
             }
 
         except ImportError as e:
@@ -250,19 +573,30 @@ class FunASRServer:
             logger.error(traceback.format_exc())
             return {"success": False, "error": error_msg, "type": "init_error"}
 
-    def transcribe_audio(self, audio_path, options=None):
-        """转录音频文件"""
+    def transcribe_audio(self, audio, options=None):
+        """
+        转录音频
+
+        Args:
+            audio: 音频文件路径，或单声道float32 numpy数组（采样率由options["sample_rate"]给出）
+            options: 转录选项
+        """
         if not self.initialized:
             init_result = self.initialize()
             if not init_result["success"]:
                 return init_result
 
         try:
+            is_path = isinstance(audio, (str, os.PathLike))
+
             # 检查音频文件是否存在
-            if not os.path.exists(audio_path):
-                return {"success": False, "error": f"音频文件不存在: {audio_path}"}
+            if is_path and not os.path.exists(audio):
+                return {"success": False, "error": f"音频文件不存在: {audio}"}
 
-            logger.info(f"开始转录音频文件: {audio_path}")
+            if is_path:
+                logger.info(f"开始转录音频文件: {audio}")
+            else:
+                logger.info(f"开始转录内存音频: {len(audio)} 采样点")
 
             # 设置默认选项
             default_options = {
@@ -271,57 +605,42 @@ class FunASRServer:
                 "use_vad": True,
                 "use_punc": True,  # 使用FunASR自带的标点恢复
                 "language": "zh",
+                "sample_rate": 16000,
+                "priority": DEFAULT_PRIORITY,
             }
 
             if options:
                 default_options.update(options)
 
-            # 执行语音识别（使用suppress_stdout避免FunASR的输出干扰）
-            if default_options["use_vad"]:
-                with suppress_stdout():
-                    vad_result = self.vad_model.generate(
-                        input=audio_path, batch_size_s=default_options["batch_size_s"]
-                    )
-                logger.info("VAD处理完成")
+            from audio_io import probe_duration
 
-            # 执行ASR识别（使用suppress_stdout避免FunASR的输出干扰）
-            with suppress_stdout():
-                asr_result = self.asr_model.generate(
-                    input=audio_path,
-                    batch_size_s=default_options["batch_size_s"],
-                    hotword=default_options["hotword"],
-                    cache={},
-                )
+            expected = (
+                probe_duration(audio) if is_path
+                else len(audio) / float(default_options["sample_rate"])
+            ) or 0.0
+            default_options["expected_seconds"] = expected
 
-            # 提取识别文本
-            if isinstance(asr_result, list) and len(asr_result) > 0:
-                if isinstance(asr_result[0], dict) and "text" in asr_result[0]:
-                    raw_text = asr_result[0]["text"]
-                else:
-                    raw_text = str(asr_result[0])
-            else:
-                raw_text = str(asr_result)
+            if expected > self.long_audio_seconds:
+                # 长音频整段推理会长时间独占模型，改为按语音段调度
+                logger.info(f"音频时长 {expected:.1f}秒，按语音段分别调度")
+                result = {"success": False, "error": "长音频转录未返回结果"}
+                for event in self.transcribe_long_audio(audio, default_options):
+                    if event.get("event") == "final":
+                        result = {k: v for k, v in event.items() if k != "event"}
+                return result
 
-            logger.info(f"ASR识别完成，原始文本: {raw_text[:100]}...")
+            input_kwargs = {} if is_path else {"fs": default_options["sample_rate"]}
 
-            # 使用FunASR进行标点恢复
-            final_text = raw_text
-            if default_options["use_punc"] and self.punc_model and raw_text.strip():
-                try:
-                    punc_result = self.punc_model.generate(input=raw_text)
-                    if isinstance(punc_result, list) and len(punc_result) > 0:
-                        if (
-                            isinstance(punc_result[0], dict)
-                            and "text" in punc_result[0]
-                        ):
-                            final_text = punc_result[0]["text"]
-                        else:
-                            final_text = str(punc_result[0])
-                    logger.info("FunASR标点恢复完成")
-                except Exception as e:
-                    logger.warning(f"FunASR标点恢复失败，使用原始文本: {str(e)}")
-
-            duration = self._get_audio_duration(audio_path)
+            stages = self._run_stages(audio, default_options, input_kwargs)
+            asr_result = stages["asr_result"]
+            raw_text = stages["raw_text"]
+            final_text = stages["text"]
+
+            if is_path:
+                duration = self._get_audio_duration(audio)
+            else:
+                duration = len(audio) / float(default_options["sample_rate"])
+                self.total_audio_duration += duration
             self.transcription_count += 1
 
             result = {
@@ -335,23 +654,422 @@ class FunASRServer:
                 ),
                 "duration": duration,
                 "language": "zh-CN",
-                "model_type": "pytorch",  # 标识使用的是pytorch版本
+                "model_type": "onnx-int8" if self.backend == "onnx" else "pytorch",  # 标识推理后端
+                "timings": stages["timings"],
             }
 
-            # 生产环境：每10次转录后进行内存清理
-            if self.transcription_count % 10 == 0:
-                self._cleanup_memory()
-                logger.info(f"已完成 {self.transcription_count} 次转录，执行内存清理")
-
-            logger.info(f"转录完成，最终文本: {final_text[:100]}...")
+            logger.info(
+                f"转录完成，最终文本: {redact_text(final_text)}",
+                extra={"audio_duration": round(duration, 2), "timings": stages["timings"]},
+            )
             return result
 
+        except InferenceCancelled as e:
+            logger.info(f"转录已取消，未执行的推理已放弃: {str(e)}")
+            return {"success": False, "error": str(e), "type": "cancelled"}
         except Exception as e:
             error_msg = f"音频转录失败: {str(e)}"
             logger.error(error_msg)
             logger.error(traceback.format_exc())
             return {"success": False, "error": error_msg, "type": "transcription_error"}
 
+    def transcribe_batch(self, audios, options=None):
+        """
+        批量转录多个短音频
+
+        时长不超过FUNASR_LONG_AUDIO_SECONDS的文件按总时长（FUNASR_BATCH_MAX_SECONDS）分组，
+        每组在一次ASR generate调用中完成（GPU批处理），再逐条做标点恢复；超过阈值或无法获取时长的文件
+        单独转录（长音频按语音段调度），不会整段塞进批处理。
+        返回与输入等长、格式与transcribe_audio相同的结果列表
+
+        Args:
+            audios: 音频文件路径列表
+            options: 转录选项（整批共用）
+        """
+        from audio_io import probe_duration
+
+        if not self.initialized:
+            init_result = self.initialize()
+            if not init_result["success"]:
+                return [init_result for _ in audios]
+
+        opts = {"hotword": "", "use_punc": True, "priority": "batch"}
+        opts.update(options or {})
+        audios = [str(audio) for audio in audios]
+
+        results = [None] * len(audios)
+        batchable = []  # (输入序号, 路径, 时长)
+        for index, audio in enumerate(audios):
+            if not os.path.exists(audio):
+                results[index] = {"success": False, "error": f"音频文件不存在: {audio}"}
+                continue
+            duration = probe_duration(audio)
+            if duration is None or duration > self.long_audio_seconds:
+                results[index] = self.transcribe_audio(audio, opts)
+            else:
+                batchable.append((index, audio, duration))
+
+        for group in self._group_by_duration(batchable):
+            group_results = self._generate_batch([audio for _, audio, _ in group],
+                                                 [duration for _, _, duration in group], opts)
+            for (index, _, _), result in zip(group, group_results):
+                results[index] = result
+        return results
+
+    def _group_by_duration(self, items):
+        """按输入顺序分组，每组总时长不超过batch_max_seconds（单个文件超过上限时自成一组）"""
+        groups, current, total = [], [], 0.0
+        for item in items:
+            duration = item[2]
+            if current and total + duration > self.batch_max_seconds:
+                groups.append(current)
+                current, total = [], 0.0
+            current.append(item)
+            total += duration
+        if current:
+            groups.append(current)
+        return groups
+
+    def _generate_batch(self, audios, durations, opts):
+        """一次ASR generate调用识别一组短音频，失败时逐条转录"""
+        try:
+            asr_model = self._ensure_model("asr")
+            if asr_model is None:
+                raise RuntimeError("ASR模型加载失败")
+
+            stage_start = time.time()
+            with self.scheduler.slot(opts["priority"], sum(durations)):
+                asr_results = asr_model.generate(
+                    input=audios,
+                    batch_size=len(audios),
+                    hotword=opts["hotword"],
+                    cache={},
+                    disable_pbar=True,
+                )
+            asr_time = time.time() - stage_start
+            if not isinstance(asr_results, list) or len(asr_results) != len(audios):
+                raise RuntimeError("批量识别结果数量与输入不一致")
+        except Exception as e:
+            # 整批失败时逐条处理，避免一个文件影响整批
+            logger.warning(f"批量识别失败，改为逐条转录: {str(e)}")
+            return [self.transcribe_audio(audio, opts) for audio in audios]
+
+        logger.info(f"批量识别完成: {len(audios)} 个文件, 共 {sum(durations):.1f}秒音频, 耗时 {asr_time:.2f}秒")
+
+        results = []
+        for audio, duration, asr_result in zip(audios, durations, asr_results):
+            raw_text = self._extract_text([asr_result])
+            timings = {"asr": round(asr_time / len(audios), 4), "asr_batch": round(asr_time, 4)}
+            final_text = raw_text
+            if opts["use_punc"] and raw_text.strip():
+                final_text, timings["punc"] = self._restore_punctuation(raw_text, opts["priority"])
+
+            self.transcription_count += 1
+            self.total_audio_duration += duration
+            results.append({
+                "success": True,
+                "text": final_text,
+                "raw_text": raw_text,
+                "confidence": 0.0,
+                "duration": duration,
+                "language": "zh-CN",
+                "model_type": "onnx-int8" if self.backend == "onnx" else "pytorch",
+                "timings": timings,
+                "batch_size": len(audios),
+            })
+        return results
+
+    @staticmethod
+    def _extract_text(result):
+        """从FunASR generate结果中提取文本"""
+        if isinstance(result, list) and len(result) > 0:
+            if isinstance(result[0], dict) and "text" in result[0]:
+                return result[0]["text"]
+            return str(result[0])
+        return str(result)
+
+    def _run_stages(self, audio, options, input_kwargs):
+        """
+        依次执行VAD、ASR和标点恢复
+
+        Returns:
+            包含asr_result、raw_text、text和各阶段耗时timings（秒）的字典
+        """
+        timings = {}
+
+        # 按需加载模型；持有局部引用，空闲回收不会影响进行中的推理
+        asr_model = self._ensure_model("asr")
+        if asr_model is None:
+            raise RuntimeError("ASR模型加载失败")
+        vad_model = self._ensure_model("vad") if options["use_vad"] else None
+        if options["use_vad"] and vad_model is None:
+            logger.warning("VAD模型不可用，跳过VAD")
+
+        # FunASR的进度条输出通过disable_pbar关闭，不再临时替换sys.stdout
+        with self.scheduler.slot(options.get("priority", DEFAULT_PRIORITY), options.get("expected_seconds", 0.0)):
+            if vad_model is not None:
+                stage_start = time.time()
+                with span("vad"):
+                    vad_model.generate(
+                        input=audio,
+                        batch_size_s=options["batch_size_s"],
+                        disable_pbar=True,
+                        **input_kwargs,
+                    )
+                timings["vad"] = round(time.time() - stage_start, 4)
+                logger.info("VAD处理完成")
+
+            # 执行ASR识别
+            stage_start = time.time()
+            with span("asr", backend=self.backend_label):
+                asr_result = asr_model.generate(
+                    input=audio,
+                    batch_size_s=options["batch_size_s"],
+                    hotword=options["hotword"],
+                    cache={},
+                    disable_pbar=True,
+                    **input_kwargs,
+                )
+            timings["asr"] = round(time.time() - stage_start, 4)
+
+        raw_text = self._extract_text(asr_result)
+        logger.info(f"ASR识别完成，原始文本: {redact_text(raw_text)}")
+
+        # 使用FunASR进行标点恢复
+        final_text = raw_text
+        if options["use_punc"] and raw_text.strip():
+            final_text, timings["punc"] = self._restore_punctuation(
+                raw_text, options.get("priority", DEFAULT_PRIORITY)
+            )
+
+        return {
+            "asr_result": asr_result,
+            "raw_text": raw_text,
+            "text": final_text,
+            "timings": timings,
+        }
+
+    def _restore_punctuation(self, text, priority=DEFAULT_PRIORITY):
+        """标点恢复，失败时返回原文；返回(文本, 耗时秒)"""
+        punc_model = self._ensure_model("punc")
+        if punc_model is None:
+            return text, 0.0
+
+        stage_start = time.time()
+        try:
+            with self.scheduler.slot(priority), span("punc"):
+                punc_result = punc_model.generate(input=text, disable_pbar=True)
+            if isinstance(punc_result, list) and len(punc_result) > 0:
+                text = self._extract_text(punc_result)
+            logger.info("FunASR标点恢复完成")
+        except Exception as e:
+            logger.warning(f"FunASR标点恢复失败，使用原始文本: {str(e)}")
+        return text, round(time.time() - stage_start, 4)
+
+    # ==================== 长音频分窗口处理 ====================
+
+    def detect_segments(self, samples, sample_rate=16000, vad_model=None, priority=DEFAULT_PRIORITY):
+        """
+        对一段音频做VAD
+
+        Returns:
+            语音段列表[(开始采样点, 结束采样点), ...]；VAD不可用时返回None
+        """
+        vad_model = vad_model or self._ensure_model("vad")
+        if vad_model is None:
+            return None
+
+        with self.scheduler.slot(priority, len(samples) / float(sample_rate)):
+            vad_result = vad_model.generate(input=samples, fs=sample_rate, disable_pbar=True)
+
+        value = vad_result[0].get("value", []) if vad_result else []
+        scale = sample_rate / 1000.0
+        return [
+            (max(0, int(begin * scale)), min(len(samples), int(end * scale)))
+            for begin, end in value
+            if end > begin
+        ]
+
+    def transcribe_segment(self, samples, options, asr_model=None, sample_rate=16000):
+        """识别一个语音段，返回原始文本（不含标点）"""
+        asr_model = asr_model or self._ensure_model("asr")
+        if asr_model is None:
+            raise RuntimeError("ASR模型加载失败")
+
+        # 每个语音段单独申请执行权：长音频在段边界让出模型
+        priority = options.get("priority", DEFAULT_PRIORITY)
+        with self.scheduler.slot(priority, len(samples) / float(sample_rate)):
+            asr_result = asr_model.generate(
+                input=samples,
+                fs=sample_rate,
+                batch_size_s=options["batch_size_s"],
+                hotword=options["hotword"],
+                cache={},
+                disable_pbar=True,
+            )
+        return self._extract_text(asr_result)
+
+    @staticmethod
+    def _join_texts(parts):
+        """拼接各段识别结果：中文直接相连，英文/数字之间补空格"""
+        text = ""
+        for part in parts:
+            part = part.strip()
+            if not part:
+                continue
+            if text and text[-1].isascii() and text[-1].isalnum() and part[0].isascii() and part[0].isalnum():
+                text += " "
+            text += part
+        return text
+
+    def transcribe_long_audio(self, audio, options=None):
+        """
+        长音频分窗口转录（生成器）
+
+        按窗口流式读取音频（soundfile分块读取，不支持的格式通过ffmpeg管道解码），
+        每个窗口做VAD后只解码已闭合的语音段，窗口末尾未结束的语音段与下一窗口拼接后再处理。
+        内存占用只与窗口长度有关，与文件总长度无关；每个窗口完成后立即产出部分结果。
+
+        Args:
+            audio: 音频文件路径，或单声道float32 numpy数组（采样率由options["sample_rate"]给出）
+            options: 转录选项，另支持window_s覆盖窗口时长
+
+        Yields:
+            {"event": "partial", "text", "raw_text", "start", "end", "progress"}，
+            最后一个为{"event": "final", **与transcribe_audio相同的结果字段}
+        """
+        import numpy as np
+        from audio_io import iter_audio_windows, probe_duration
+
+        if not self.initialized:
+            init_result = self.initialize()
+            if not init_result["success"]:
+                yield {"event": "final", **init_result}
+                return
+
+        opts = {
+            "batch_size_s": 60,
+            "hotword": "",
+            "use_vad": True,
+            "use_punc": True,
+            "sample_rate": 16000,
+            "window_s": self.long_window_s,
+            "priority": DEFAULT_PRIORITY,
+        }
+        opts.update(options or {})
+
+        is_path = isinstance(audio, (str, os.PathLike))
+        if is_path and not os.path.exists(audio):
+            yield {"event": "final", "success": False, "error": f"音频文件不存在: {audio}"}
+            return
+
+        sample_rate = 16000
+        window_s = float(opts["window_s"])
+        total_duration = (
+            probe_duration(audio) if is_path else len(audio) / float(opts["sample_rate"])
+        ) or 0.0
+        # 整个窗口都处于同一段语音中时最多顺延到该长度，超过后强制解码
+        max_carry = int(2 * window_s * sample_rate)
+        # 结束位置距离缓冲区末尾不足该长度的语音段可能延续到下一窗口
+        tail_guard = int(0.3 * sample_rate)
+
+        logger.info(f"开始分窗口转录长音频: 时长 {total_duration:.1f}秒, 窗口 {window_s:.0f}秒")
+
+        try:
+            asr_model = self._ensure_model("asr")
+            if asr_model is None:
+                raise RuntimeError("ASR模型加载失败")
+            vad_model = self._ensure_model("vad") if opts["use_vad"] else None
+            if opts["use_vad"] and vad_model is None:
+                logger.warning("VAD模型不可用，按固定窗口切分")
+
+            timings = {"vad": 0.0, "asr": 0.0, "punc": 0.0}
+            carry = np.zeros(0, dtype=np.float32)
+            carry_start = 0.0  # 缓冲区起点在整段音频中的时间（秒）
+            raw_parts, text_parts = [], []
+            window_count = 0
+
+            windows = iter_audio_windows(audio, window_s, sample_rate=opts["sample_rate"],
+                                         target_sr=sample_rate)
+            for window, is_last in windows:
+                window_count += 1
+                buffer = np.concatenate([carry, window]) if carry.size else window
+                cut = len(buffer)
+                segments = [(0, len(buffer))]
+
+                if vad_model is not None:
+                    stage_start = time.time()
+                    segments = self.detect_segments(buffer, sample_rate, vad_model, opts["priority"]) or []
+                    timings["vad"] += time.time() - stage_start
+
+                    if not is_last and segments:
+                        closed = [seg for seg in segments if seg[1] < len(buffer) - tail_guard]
+                        if closed:
+                            segments, cut = closed, closed[-1][1]
+                        elif len(buffer) < max_carry:
+                            segments, cut = [], 0
+
+                stage_start = time.time()
+                window_raw = self._join_texts(
+                    self.transcribe_segment(buffer[begin:end], opts, asr_model, sample_rate)
+                    for begin, end in segments
+                )
+                timings["asr"] += time.time() - stage_start
+
+                window_text = window_raw
+                if opts["use_punc"] and window_raw:
+                    window_text, punc_time = self._restore_punctuation(window_raw, opts["priority"])
+                    timings["punc"] += punc_time
+
+                start, end = carry_start, carry_start + cut / float(sample_rate)
+                carry = buffer[cut:].copy()
+                carry_start = end
+                del buffer, window
+
+                if not window_raw:
+                    continue
+                raw_parts.append(window_raw)
+                text_parts.append(window_text)
+
+                progress = 100.0 if is_last or not total_duration else min(99.9, end / total_duration * 100)
+                yield {
+                    "event": "partial",
+                    "text": window_text,
+                    "raw_text": window_raw,
+                    "start": round(start, 2),
+                    "end": round(end, 2),
+                    "progress": round(progress, 1),
+                }
+
+            duration = total_duration or carry_start
+            self.total_audio_duration += duration
+            self.transcription_count += 1
+
+            final_text = self._join_texts(text_parts)
+            logger.info(f"长音频转录完成: {window_count} 个窗口, 文本长度 {len(final_text)}")
+            yield {
+                "event": "final",
+                "success": True,
+                "text": final_text,
+                "raw_text": self._join_texts(raw_parts),
+                "confidence": 0.0,
+                "duration": duration,
+                "language": "zh-CN",
+                "model_type": "onnx-int8" if self.backend == "onnx" else "pytorch",
+                "timings": {k: round(v, 4) for k, v in timings.items()},
+                "windows": window_count,
+                "progress": 100.0,
+            }
+
+        except InferenceCancelled as e:
+            logger.info(f"长音频转录已取消，剩余窗口不再处理: {str(e)}")
+            yield {"event": "final", "success": False, "error": str(e), "type": "cancelled"}
+        except Exception as e:
+            error_msg = f"长音频转录失败: {str(e)}"
+            logger.error(error_msg)
+            logger.error(traceback.format_exc())
+            yield {"event": "final", "success": False, "error": error_msg, "type": "transcription_error"}
+
     def _get_audio_duration(self, audio_path):
         """获取音频时长"""
         try:
@@ -364,46 +1082,105 @@ class FunASRServer:
             return 0.0
 
     def _cleanup_memory(self):
-        """生产环境内存清理"""
+        """手动内存清理（cleanup命令），不受水位线和冷却时间限制"""
         try:
-            import gc
-
-            gc.collect()
-            logger.info("内存清理完成")
+            info = self.memory_manager.release(reason="manual")
+            logger.info(f"内存清理完成，释放RSS {info['rss_freed_mb']}MB，CUDA缓存 {info['cuda_freed_mb']}MB")
         except Exception as e:
             logger.warning(f"内存清理失败: {str(e)}")
 
+    def get_model_states(self):
+        """各模型的驻留状态与加载/卸载统计"""
+        now = time.time()
+        states = {}
+        for name, (attr, _) in self._model_loaders.items():
+            info = self._model_info[name]
+            loaded = getattr(self, attr) is not None
+            states[name] = {
+                "loaded": loaded,
+                "load_count": info["load_count"],
+                "unload_count": info["unload_count"],
+                "load_time": info["load_time"],
+                "resident_mb": round(info["resident_bytes"] / 1024 ** 2, 1) if loaded else 0.0,
+                "idle_seconds": round(now - info["last_used"], 1) if info["last_used"] else None,
+            }
+        return states
+
     def get_performance_stats(self):
         """获取性能统计信息"""
-        return {
+        stats = {
             "transcription_count": self.transcription_count,
             "total_audio_duration": round(self.total_audio_duration, 2),
             "average_duration": round(
                 self.total_audio_duration / max(1, self.transcription_count), 2
             ),
             "initialized": self.initialized,
+            "ready": self.ready,
+            "backend": self.backend_label,
             "models_loaded": {
                 "asr": self.asr_model is not None,
                 "vad": self.vad_model is not None,
                 "punc": self.punc_model is not None,
             },
+            "models": self.get_model_states(),
+            "model_idle_ttl": self.model_idle_ttl,
+            "model_events": list(self.model_events)[-20:],
+            "scheduler": self.scheduler.get_stats(),
+            "memory": self.memory_manager.get_stats(),
         }
 
+        torch = sys.modules.get("torch")
+        if torch is not None:
+            try:
+                if torch.cuda.is_available():
+                    stats["cuda_memory"] = {
+                        "allocated_mb": round(torch.cuda.memory_allocated() / 1024 ** 2, 1),
+                        "reserved_mb": round(torch.cuda.memory_reserved() / 1024 ** 2, 1),
+                    }
+            except Exception:
+                pass
+
+        return stats
+
+    def get_gpu_info(self):
+        """
+        CUDA可用性
+
+        只读取初始化时已导入的torch，不为状态查询单独导入（HTTP进程和ONNX后端不需要torch）；
+        torch尚未导入时available为False、torch_loaded为False
+        """
+        torch = sys.modules.get("torch")
+        if torch is None:
+            return {"available": False, "torch_loaded": False}
+        try:
+            info = {"available": torch.cuda.is_available(), "torch_loaded": True}
+            if info["available"]:
+                info["device_count"] = torch.cuda.device_count()
+                info["device_name"] = torch.cuda.get_device_name(0)
+            return info
+        except Exception as e:
+            return {"available": False, "torch_loaded": True, "error": str(e)}
+
     def check_status(self):
         """检查FunASR状态"""
         try:
-            import funasr
+            if self.backend == "onnx":
+                import funasr_onnx as funasr
+            else:
+                import funasr
 
             return {
                 "success": True,
                 "installed": True,
                 "initialized": self.initialized,
+                "backend": self.backend_label,
                 "version": getattr(funasr, "__version__", "unknown"),
                 "models": {
                     "asr": self.asr_model is not None,
                     "vad": self.vad_model is not None,
                     "punc": self.punc_model is not None,  # FunASR标点恢复模型状态
                 },
+                "gpu": self.get_gpu_info(),
             }
         except ImportError:
             return {
@@ -413,10 +1190,8 @@ class FunASRServer:
                 "error": "FunASR未安装",
             }
 
-    def run(self):
-        """运行服务器主循环"""
-        logger.info("FunASR服务器启动")
-
+    def _check_models_and_initialize(self):
+        """检查模型文件是否已下载，已下载则初始化"""
         # 解析 damo 根目录
         def _default_damo_root():
             # 允许通过 MODELSCOPE_CACHE 指定根；常见是 ~/.cache/modelscope/hub/damo
@@ -435,11 +1210,11 @@ class FunASRServer:
         cache_path = self.damo_root if self.damo_root else _default_damo_root()
         logger.info(f"使用的模型根目录(damo root): {cache_path}")
 
-        repos = [
-            "speech_paraformer-large_asr_nat-zh-cn-16k-common-vocab8404-pytorch",
-            "speech_fsmn_vad_zh-cn-16k-common-pytorch",
-            "punc_ct-transformer_zh-cn-common-vocab272727-pytorch",
-        ]
+        if self.backend == "onnx":
+            from onnx_backend import ONNX_MODELS as model_ids
+        else:
+            model_ids = PYTORCH_MODELS
+        repos = [model_id.split("/", 1)[1] for model_id in model_ids.values()]
 
         def _repo_ready(repo_dir):
             # 目录存在且包含任意常见权重/配置文件即认为已就绪
@@ -462,16 +1237,138 @@ class FunASRServer:
 
         if not missing:
             logger.info("模型文件存在，开始初始化")
-            init_result = self.initialize()
+            return self.initialize()
+
+        logger.info(f"模型文件不存在或不完整：{', '.join(missing)}，跳过初始化")
+        self._set_init_stage("failed", "模型文件未下载")
+        return {
+            "success": False,
+            "error": "模型文件未下载，请先下载模型",
+            "type": "models_not_downloaded"
+        }
+
+    def handle_command(self, command):
+        """处理一条IPC命令，返回结果字典"""
+        action = command.get("action")
+
+        if action == "transcribe":
+            options = command.get("options", {})
+            audio_ref = command.get("audio")
+            if audio_ref:
+                # 帧协议：音频在共享内存中，直接取零拷贝视图
+                from shm_audio import attach_audio
+
+                options = dict(options, sample_rate=audio_ref.get("sample_rate", 16000))
+                return self.transcribe_audio(attach_audio(audio_ref), options)
+            return self.transcribe_audio(command.get("audio_path"), options)
+        elif action == "transcribe_batch":
+            return {"success": True,
+                    "results": self.transcribe_batch(command.get("audio_paths", []), command.get("options", {}))}
+        elif action == "vad":
+            from shm_audio import attach_audio
+
+            audio_ref = command["audio"]
+            segments = self.detect_segments(attach_audio(audio_ref), audio_ref.get("sample_rate", 16000),
+                                            priority=command.get("priority", DEFAULT_PRIORITY))
+            return {"success": True, "segments": segments}
+        elif action == "status":
+            return self.check_status()
+        elif action == "progress":
+            return {"success": True, **self.get_init_progress()}
+        elif action == "readiness":
+            return {"success": True, **self.get_readiness()}
+        elif action == "stats":
+            return {"success": True, "stats": self.get_performance_stats()}
+        elif action == "unload":
+            names = command.get("models") or list(self._model_loaders)
+            unloaded = [name for name in names
+                        if name in self._model_loaders and self.unload_model(name)]
+            return {"success": True, "unloaded": unloaded}
+        elif action in SESSION_ACTIONS:
+            return self.handle_session_command(command)
+        elif action == "cleanup":
+            self._cleanup_memory()
+            return {"success": True, "message": "内存清理完成"}
+        elif action == "exit":
+            self.running = False
+            return {"success": True, "message": "服务器退出"}
+
+        return {"success": False, "error": f"未知命令: {action}"}
+
+    def _session_manager(self):
+        """会话表及其事件循环（独立线程），会话的后台解码在该循环上调度"""
+        with self._sessions_lock:
+            if self._sessions is None:
+                import asyncio
+                from asr_sessions import SessionManager
+
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="funasr-sessions", daemon=True).start()
+                self._sessions_loop = loop
+                self._sessions = SessionManager(lambda: self)
+        return self._sessions, self._sessions_loop
+
+    def handle_session_command(self, command):
+        """执行会话命令（session_create/append/status/finalize/delete），分块经共享内存以原始字节传入"""
+        import asyncio
+
+        params = {k: v for k, v in command.items() if k not in ("action", "audio", "trace")}
+        audio_ref = command.get("audio")
+        if audio_ref:
+            from shm_audio import attach_audio
+
+            params["data"] = attach_audio(audio_ref).tobytes()
+        sessions, loop = self._session_manager()
+        op = command["action"][len("session_"):]
+        return asyncio.run_coroutine_threadsafe(sessions.handle(op, **params), loop).result()
+
+    def handle_stream_command(self, command):
+        """
+        处理会分多次返回结果的IPC命令（目前为transcribe_long），逐条产出响应；
+        最后一条响应带done=True
+        """
+        options = command.get("options", {})
+        audio_ref = command.get("audio")
+        if audio_ref:
+            from shm_audio import attach_audio
+
+            audio = attach_audio(audio_ref)
+            options = dict(options, sample_rate=audio_ref.get("sample_rate", 16000))
         else:
-            logger.info(f"模型文件不存在或不完整：{', '.join(missing)}，跳过初始化")
-            init_result = {
-                "success": False,
-                "error": "模型文件未下载，请先下载模型",
-                "type": "models_not_downloaded"
-            }
-        print(json.dumps(init_result, ensure_ascii=False))
-        sys.stdout.flush()
+            audio = command.get("audio_path")
+
+        for event in self.transcribe_long_audio(audio, options):
+            event["done"] = event.get("event") == "final"
+            yield event
+
+    def run(self, ipc="json"):
+        """
+        运行服务器主循环
+
+        Args:
+            ipc: 通信协议。json为逐行JSON（兼容旧客户端），
+                 framed为带请求ID的长度前缀二进制帧（见ipc_protocol.py）
+        """
+        logger.info(f"FunASR服务器启动 (IPC协议: {ipc})")
+
+        channel = open_ipc_channel()
+        init_result = self._check_models_and_initialize()
+
+        if ipc == "framed":
+            self._serve_framed(sys.stdin.buffer, channel, init_result)
+        else:
+            self._serve_json_lines(channel, init_result)
+
+        logger.info("FunASR服务器退出")
+
+    def _serve_json_lines(self, channel, init_result):
+        """逐行JSON协议主循环"""
+
+        def send(result):
+            channel.write((json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8"))
+            channel.flush()
+
+        send(init_result)
 
         while self.running:
             try:
@@ -487,56 +1384,227 @@ class FunASRServer:
                 try:
                     command = json.loads(line)
                 except json.JSONDecodeError:
-                    result = {"success": False, "error": "无效的JSON命令"}
-                    print(json.dumps(result, ensure_ascii=False))
-                    sys.stdout.flush()
+                    send({"success": False, "error": "无效的JSON命令"})
                     continue
 
-                # 处理命令
-                if command.get("action") == "transcribe":
-                    audio_path = command.get("audio_path")
-                    options = command.get("options", {})
-                    result = self.transcribe_audio(audio_path, options)
-                elif command.get("action") == "status":
-                    result = self.check_status()
-                elif command.get("action") == "stats":
-                    result = {"success": True, "stats": self.get_performance_stats()}
-                elif command.get("action") == "cleanup":
-                    self._cleanup_memory()
-                    result = {"success": True, "message": "内存清理完成"}
-                elif command.get("action") == "exit":
-                    result = {"success": True, "message": "服务器退出"}
-                    print(json.dumps(result, ensure_ascii=False))
-                    sys.stdout.flush()
-                    break
+                if command.get("action") in STREAM_ACTIONS:
+                    for event in self.handle_stream_command(command):
+                        send(event)
                 else:
-                    result = {
-                        "success": False,
-                        "error": f"未知命令: {command.get('action')}",
-                    }
-
-                # 输出结果
-                print(json.dumps(result, ensure_ascii=False))
-                sys.stdout.flush()
+                    send(self.handle_command(command))
 
             except KeyboardInterrupt:
                 break
             except Exception as e:
-                error_result = {
+                send({
+                    "success": False,
+                    "error": str(e),
+                    "traceback": traceback.format_exc(),
+                })
+
+    def _serve_framed(self, reader, writer, init_result, pool=None, control_pool=None, owns_process=True):
+        """
+        帧协议主循环
+
+        读取在当前线程进行，推理命令分发到推理线程池，控制命令（CONTROL_ACTIONS）分发到单独的
+        小线程池；响应按完成顺序写回并携带请求ID，因此推理线程全部被长音频或批量任务占用时，
+        状态查询仍能立即得到回复。
+
+        Args:
+            pool: 共享的推理线程池，为None时为本连接单独创建
+            control_pool: 共享的控制命令线程池，为None时为本连接单独创建
+            owns_process: 为False时（模型宿主的一个连接）exit命令只关闭本连接
+        """
+        from ipc_protocol import read_frame, write_frame, FrameError, INIT_REQUEST_ID
+
+        write_lock = threading.Lock()
+        connected = [True]
+        # 请求ID -> 取消令牌；前端发来cancel命令时取消，正在排队的推理随之放弃
+        tokens = {}
+        tokens_lock = threading.Lock()
+
+        def send(request_id, result):
+            with write_lock:
+                write_frame(writer, request_id, result)
+
+        def execute(request_id, command, token):
+            try:
+                if token.cancelled:
+                    result = {"success": False, "error": f"请求已取消: {token.reason}",
+                              "type": "cancelled", "done": True}
+                elif command.get("trace") and command.get("action") not in STREAM_ACTIONS:
+                    # 带追踪上下文的命令：宿主中的span随响应带回
+                    with TRACER.remote(f"model_host.{command.get('action')}", command["trace"]) as spans:
+                        result = self.handle_command(command)
+                    result = dict(result, spans=spans)
+                elif command.get("action") in STREAM_ACTIONS:
+                    # 同一请求ID上连续发送多条响应，最后一条带done=True
+                    result = {"success": False, "error": "流式命令未返回结果", "done": True}
+                    for event in self.handle_stream_command(command):
+                        if event.get("done"):
+                            result = event
+                            break
+                        send(request_id, event)
+                else:
+                    result = self.handle_command(command)
+            except Exception as e:
+                result = {
                     "success": False,
                     "error": str(e),
                     "traceback": traceback.format_exc(),
                 }
-                print(json.dumps(error_result, ensure_ascii=False))
-                sys.stdout.flush()
+            finally:
+                with tokens_lock:
+                    tokens.pop(request_id, None)
+            try:
+                send(request_id, result)
+            except (OSError, ValueError):
+                connected[0] = False
+
+        def run(request_id, command, token):
+            with use_token(token):
+                execute(request_id, command, token)
+
+        send(INIT_REQUEST_ID, init_result)
+
+        own_pool = pool is None
+        if own_pool:
+            pool = self._create_worker_pool()
+        own_control_pool = control_pool is None
+        if own_control_pool:
+            control_pool = self._create_control_pool()
+
+        try:
+            while self.running and connected[0]:
+                try:
+                    frame = read_frame(reader)
+                except FrameError as e:
+                    logger.error(f"IPC帧错误，断开连接: {str(e)}")
+                    break
+                except (KeyboardInterrupt, OSError):
+                    break
+
+                if frame is None:
+                    break
+
+                request_id, command = frame
+                if command.get("action") == "cancel":
+                    # 不回复：前端只是不再等待该请求的结果
+                    with tokens_lock:
+                        token = tokens.get(command.get("request_id"))
+                    if token is not None:
+                        token.cancel("client_cancelled")
+                    continue
+                if command.get("action") == "exit":
+                    if owns_process:
+                        send(request_id, self.handle_command(command))
+                    else:
+                        send(request_id, {"success": True, "message": "连接关闭"})
+                    break
+                token = CancelToken()
+                with tokens_lock:
+                    tokens[request_id] = token
+                target = control_pool if command.get("action") in CONTROL_ACTIONS else pool
+                target.submit(run, request_id, command, token)
+        finally:
+            # 连接断开后没有人等待结果，取消本连接上仍在排队的推理
+            with tokens_lock:
+                pending = list(tokens.values())
+            for token in pending:
+                token.cancel("connection_closed")
+            if own_pool:
+                pool.shutdown(wait=True)
+            if own_control_pool:
+                control_pool.shutdown(wait=True)
+
+    @staticmethod
+    def _create_worker_pool():
+        max_workers = int(os.getenv("FUNASR_WORKER_THREADS", "8"))
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="funasr-ipc")
+
+    @staticmethod
+    def _create_control_pool():
+        max_workers = int(os.getenv("FUNASR_CONTROL_THREADS", "2"))
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="funasr-ctl")
+
+    def serve_model_host(self, socket_path):
+        """
+        模型宿主模式：在Unix域套接字上用帧协议服务多个前端进程
+
+        所有uvicorn worker共享这一个进程中的模型，GPU显存只占用一份。
+        """
+        import socket
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(socket_path)
+        # 先监听再加载模型：前端可以提前连接，在连接上等待初始化结果
+        listener.listen(64)
+        listener.settimeout(1.0)
+        logger.info(f"模型宿主监听: {socket_path}")
+
+        init_result = self._check_models_and_initialize()
+
+        pool = self._create_worker_pool()
+        control_pool = self._create_control_pool()
+
+        def serve_connection(conn):
+            reader = conn.makefile("rb")
+            writer = conn.makefile("wb")
+            try:
+                self._serve_framed(reader, writer, init_result, pool=pool, control_pool=control_pool,
+                                   owns_process=False)
+            except OSError as e:
+                logger.warning(f"模型宿主连接异常: {str(e)}")
+            finally:
+                for f in (reader, writer):
+                    try:
+                        f.close()
+                    except OSError:
+                        pass
+                conn.close()
+                logger.info("前端连接已关闭")
+
+        try:
+            while self.running:
+                try:
+                    conn, _ = listener.accept()
+                except socket.timeout:
+                    continue
+                except KeyboardInterrupt:
+                    break
+                conn.settimeout(None)
+                logger.info("前端已连接到模型宿主")
+                threading.Thread(target=serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+            try:
+                os.unlink(socket_path)
+            except FileNotFoundError:
+                pass
+            pool.shutdown(wait=False)
+            control_pool.shutdown(wait=False)
+            logger.info("模型宿主退出")
 
-        logger.info("FunASR服务器退出")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--damo-root", type=str, default=None,
                         help="damo 模型根目录，例如 /Volumes/APFS/AI/models/damo")
+    parser.add_argument("--ipc", choices=["json", "framed"], default="json",
+                        help="IPC协议：json(逐行JSON) 或 framed(长度前缀帧+共享内存音频)")
+    parser.add_argument("--listen", type=str, default=None,
+                        help="模型宿主模式：在该Unix域套接字路径上服务多个前端（帧协议）")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default=None,
+                        help="推理后端：torch(GPU) 或 onnx(int8量化CPU)，默认读取FUNASR_BACKEND")
     args = parser.parse_args()
 
-    server = FunASRServer(damo_root=args.damo_root)
-    server.run()
\ No newline at end of file
+    setup_logging()
+    server = FunASRServer(damo_root=args.damo_root, backend=args.backend)
+    server.install_signal_handlers()
+    if args.listen:
+        server.serve_model_host(args.listen)
+    else:
+        server.run(ipc=args.ipc)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+依赖健康状态的后台检查
+每个依赖（Ollama后端池、FunASR/模型宿主、GPU）由独立的后台任务按间隔检查，失败时按指数退避延长间隔；
+/api/status 只读取最近一次的检查结果及其时间，不再在请求中等待外部服务
+"""
+
+import os
+import time
+import asyncio
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+_checks = REGISTRY.counter(
+    "ququ_health_checks_total",
+    "Background dependency health checks",
+    ("check", "result"),
+)
+
+ProbeResult = Dict[str, Any]
+Probe = Callable[[], Union[ProbeResult, Awaitable[ProbeResult]]]
+
+
+class _Check:
+    """单个依赖的检查配置与最近一次结果"""
+
+    def __init__(self, name: str, probe: Probe, interval: float, timeout: float):
+        self.name = name
+        self.probe = probe
+        self.interval = interval
+        self.timeout = timeout
+        self.result: Optional[ProbeResult] = None
+        self.checked_at: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.consecutive_failures = 0
+        self.next_delay = interval
+        self.task: Optional[asyncio.Task] = None
+
+
+class HealthMonitor:
+    """
+    后台健康检查
+
+    probe返回{"success": ...}字典，可以是协程函数，也可以是同步函数（在线程中执行，
+    如进程间通信或导入torch）。超时或抛出异常按失败记录。
+    """
+
+    def __init__(self, interval: Optional[float] = None, max_backoff: Optional[float] = None,
+                 timeout: Optional[float] = None):
+        """
+        Args:
+            interval: 默认检查间隔（秒），默认读取HEALTH_CHECK_INTERVAL（15）
+            max_backoff: 连续失败时间隔的上限（秒），默认读取HEALTH_MAX_BACKOFF（120）
+            timeout: 单次检查超时（秒），默认读取HEALTH_CHECK_TIMEOUT（5）
+        """
+        self.interval = interval or float(os.getenv("HEALTH_CHECK_INTERVAL", "15"))
+        self.max_backoff = max_backoff or float(os.getenv("HEALTH_MAX_BACKOFF", "120"))
+        self.timeout = timeout or float(os.getenv("HEALTH_CHECK_TIMEOUT", "5"))
+        self._checks: Dict[str, _Check] = {}
+        self._started = False
+
+    def register(self, name: str, probe: Probe, interval: Optional[float] = None,
+                 timeout: Optional[float] = None):
+        """注册一个检查；在start()之后注册的检查立即开始运行"""
+        check = _Check(name, probe, interval or self.interval, timeout or self.timeout)
+        self._checks[name] = check
+        if self._started:
+            check.task = asyncio.create_task(self._run(check))
+
+    async def _probe_once(self, check: _Check) -> ProbeResult:
+        if inspect.iscoroutinefunction(check.probe):
+            return await asyncio.wait_for(check.probe(), check.timeout)
+        return await asyncio.wait_for(asyncio.to_thread(check.probe), check.timeout)
+
+    async def check_now(self, name: str) -> ProbeResult:
+        """立即执行一次检查并更新结果"""
+        check = self._checks[name]
+        started = time.monotonic()
+        try:
+            result = await self._probe_once(check)
+        except asyncio.TimeoutError:
+            result = {"success": False, "error": f"检查超时（{check.timeout}秒）"}
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        check.duration = round(time.monotonic() - started, 3)
+        check.checked_at = time.time()
+        check.result = result
+
+        if result.get("success"):
+            if check.consecutive_failures:
+                logger.info(f"依赖恢复: {name}")
+            check.consecutive_failures = 0
+            check.next_delay = check.interval
+        else:
+            if check.consecutive_failures == 0:
+                logger.warning(f"依赖检查失败: {name} ({result.get('error')})")
+            check.consecutive_failures += 1
+            check.next_delay = min(check.interval * 2 ** check.consecutive_failures, self.max_backoff)
+        _checks.inc(check=name, result="success" if result.get("success") else "error")
+        return result
+
+    async def _run(self, check: _Check):
+        # 检查恰好完成时到达的取消可能被wait_for吞掉，因此每轮都确认监控仍在运行
+        while self._started:
+            await self.check_now(check.name)
+            if not self._started:
+                break
+            await asyncio.sleep(check.next_delay)
+
+    def start(self):
+        self._started = True
+        for check in self._checks.values():
+            if check.task is None:
+                check.task = asyncio.create_task(self._run(check))
+
+    async def stop(self):
+        self._started = False
+        for check in self._checks.values():
+            if check.task is not None:
+                check.task.cancel()
+                try:
+                    await check.task
+                except asyncio.CancelledError:
+                    pass
+                check.task = None
+
+    def snapshot(self, name: str) -> ProbeResult:
+        """最近一次检查结果（不触发检查）；尚未完成第一次检查时返回失败结果"""
+        check = self._checks.get(name)
+        if check is None or check.result is None:
+            return {"success": False, "error": "尚未完成检查"}
+        return check.result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各检查的时间信息：age_seconds为距最近一次检查完成的秒数"""
+        now = time.time()
+        return {
+            name: {
+                "success": bool(check.result and check.result.get("success")),
+                "checked_at": check.checked_at,
+                "age_seconds": round(now - check.checked_at, 1) if check.checked_at else None,
+                "duration": check.duration,
+                "consecutive_failures": check.consecutive_failures,
+                "next_interval": check.next_delay,
+            }
+            for name, check in self._checks.items()
+        }
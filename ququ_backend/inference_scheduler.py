@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型推理调度
+所有模型调用（VAD、ASR、标点）都要先取得调度器的执行权。等待者按优先级类别排序，
+同一类别内音频越短越先执行（shortest-expected-job-first）；长音频按语音段分别申请执行权，
+因此在段与段之间交互请求可以插队，相当于在段边界被抢占。
+请求已取消（客户端断开）的等待者离开队列，不再执行
+"""
+
+import os
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+from metrics import Histogram
+from tracing import span
+from cancellation import current_token
+
+# 优先级类别 -> 排序等级（越小越优先）
+PRIORITY_CLASSES = {
+    "interactive": 0,  # 短语音听写等交互请求
+    "normal": 1,       # 流式长音频等
+    "batch": 2,        # 离线批量任务
+}
+DEFAULT_PRIORITY = "normal"
+
+# 排队等待时间分桶（秒）
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Waiter:
+    __slots__ = ("rank", "expected", "seq", "enqueued")
+
+    def __init__(self, rank: int, expected: float, seq: int):
+        self.rank = rank
+        self.expected = expected
+        self.seq = seq
+        self.enqueued = time.monotonic()
+
+
+class InferenceScheduler:
+    """
+    单执行权的优先级调度器（替代普通互斥锁）
+
+    为避免低优先级请求饿死，等待时间每超过aging_seconds，排序等级提升一级。
+    """
+
+    def __init__(self, aging_seconds: float = None):
+        """
+        Args:
+            aging_seconds: 老化周期（秒），默认读取FUNASR_PRIORITY_AGING_S（30）
+        """
+        self.aging_seconds = aging_seconds or float(os.getenv("FUNASR_PRIORITY_AGING_S", "30"))
+        self._cond = threading.Condition()
+        self._busy = False
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self.wait_histogram = Histogram(
+            "ququ_inference_queue_wait_seconds",
+            "Time spent waiting for the model inference slot",
+            ("priority",),
+            WAIT_BUCKETS,
+        )
+        self._granted = {name: 0 for name in PRIORITY_CLASSES}
+        self._cancelled = {name: 0 for name in PRIORITY_CLASSES}
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _effective_key(self, waiter: _Waiter, now: float):
+        aged = int((now - waiter.enqueued) / self.aging_seconds) if self.aging_seconds > 0 else 0
+        return (waiter.rank - aged, waiter.expected, waiter.seq)
+
+    def _next_waiter(self) -> _Waiter:
+        now = time.monotonic()
+        return min(self._waiters, key=lambda w: self._effective_key(w, now))
+
+    @contextmanager
+    def slot(self, priority: str = DEFAULT_PRIORITY, expected_seconds: float = 0.0):
+        """
+        取得模型执行权
+
+        Args:
+            priority: 优先级类别（interactive/normal/batch），未知类别按normal处理
+            expected_seconds: 预计处理的音频时长，用于同类别内短作业优先
+
+        Raises:
+            InferenceCancelled: 当前上下文的取消令牌在取得执行权之前被取消
+        """
+        if priority not in PRIORITY_CLASSES:
+            priority = DEFAULT_PRIORITY
+        waiter = _Waiter(PRIORITY_CLASSES[priority], float(expected_seconds or 0.0), next(self._seq))
+        token = current_token()
+        if token is not None:
+            token.add_callback(self._wake)
+
+        try:
+            with span("inference.queue", priority=priority), self._cond:
+                self._waiters.append(waiter)
+                while True:
+                    if token is not None and token.cancelled:
+                        self._waiters.remove(waiter)
+                        self._cancelled[priority] += 1
+                        # 本等待者可能正排在最前面，让其余等待者重新比较
+                        self._cond.notify_all()
+                        token.check()
+                    if not self._busy and self._next_waiter() is waiter:
+                        break
+                    # 老化会改变排序，定期醒来重新比较
+                    self._cond.wait(timeout=self.aging_seconds if self.aging_seconds > 0 else None)
+                self._waiters.remove(waiter)
+                self._busy = True
+                self._granted[priority] += 1
+        finally:
+            if token is not None:
+                token.remove_callback(self._wake)
+
+        self.wait_histogram.observe(time.monotonic() - waiter.enqueued, priority=priority)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            waiting = {name: 0 for name in PRIORITY_CLASSES}
+            ranks = {rank: name for name, rank in PRIORITY_CLASSES.items()}
+            for w in self._waiters:
+                waiting[ranks[w.rank]] += 1
+            oldest = max((now - w.enqueued for w in self._waiters), default=0.0)
+            granted = dict(self._granted)
+            cancelled = dict(self._cancelled)
+
+        return {
+            "busy": self._busy,
+            "waiting": waiting,
+            "oldest_wait": round(oldest, 3),
+            "granted": granted,
+            "cancelled": cancelled,
+            "aging_seconds": self.aging_seconds,
+            "wait_histogram": self.wait_histogram.to_dict(),
+        }
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FunASR worker IPC帧协议
+长度前缀的二进制帧，每帧携带请求ID，允许乱序响应
+
+帧格式（网络字节序）:
+    [4字节 payload长度][4字节 请求ID][payload: UTF-8 JSON]
+"""
+
+import json
+import struct
+from typing import Optional, Tuple, Dict, Any
+
+FRAME_HEADER = struct.Struct("!II")
+MAX_FRAME_SIZE = 16 * 1024 * 1024  # 单帧上限16MB，音频走共享内存，帧内只有控制信息
+
+# 请求ID 0 保留给worker启动时的初始化结果
+INIT_REQUEST_ID = 0
+
+
+class FrameError(Exception):
+    """帧格式错误"""
+
+
+def encode_frame(request_id: int, payload: Dict[str, Any]) -> bytes:
+    """编码一帧"""
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    if len(body) > MAX_FRAME_SIZE:
+        raise FrameError(f"帧过大: {len(body)} bytes")
+    return FRAME_HEADER.pack(len(body), request_id) + body
+
+
+def write_frame(stream, request_id: int, payload: Dict[str, Any]):
+    """向二进制流写入一帧并立即flush（调用方负责多线程写入加锁）"""
+    stream.write(encode_frame(request_id, payload))
+    stream.flush()
+
+
+def _read_exact(stream, size: int) -> Optional[bytes]:
+    """读取指定字节数，流在帧边界结束时返回None"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            if remaining == size:
+                return None
+            raise FrameError("流在帧中间结束")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(stream) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """
+    读取一帧
+
+    Returns:
+        (请求ID, payload字典)，流结束时返回None
+    """
+    header = _read_exact(stream, FRAME_HEADER.size)
+    if header is None:
+        return None
+
+    length, request_id = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise FrameError(f"帧长度超出上限: {length}")
+
+    body = _read_exact(stream, length) if length else b""
+    if body is None:
+        raise FrameError("流在帧中间结束")
+
+    try:
+        payload = json.loads(body.decode("utf-8")) if body else {}
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise FrameError(f"无效的帧内容: {str(e)}")
+
+    return request_id, payload
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量转录任务调度
+后台循环从JobStore领取待处理文件：短音频按批次一次送入GPU，长音频走分窗口转录；
+每个文件完成后立即写回任务存储并通知等待中的SSE连接
+"""
+
+import os
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from audio_io import probe_duration
+from job_store import JobStore
+
+logger = logging.getLogger(__name__)
+
+
+class JobScheduler:
+    """单个后台协程串行执行批次，交互请求不会被批处理任务占满"""
+
+    def __init__(self, store: JobStore, backend_getter: Callable[[], Any],
+                 batch_size: Optional[int] = None, batch_max_seconds: Optional[float] = None,
+                 poll_interval: float = 2.0):
+        """
+        Args:
+            store: 任务存储
+            backend_getter: 返回当前ASR后端的函数（后端在后台初始化完成后才确定）
+            batch_size: 每批最多文件数，默认读取JOB_BATCH_SIZE
+            batch_max_seconds: 超过该时长（秒）的文件不参与批处理，单独分窗口转录，默认读取JOB_BATCH_MAX_SECONDS
+            poll_interval: 没有新任务通知时轮询数据库的间隔（多worker共用数据库时由其他进程提交的任务）
+        """
+        self.store = store
+        self.backend_getter = backend_getter
+        self.batch_size = batch_size or int(os.getenv("JOB_BATCH_SIZE", "8"))
+        self.batch_max_seconds = batch_max_seconds or float(os.getenv("JOB_BATCH_MAX_SECONDS", "60"))
+        self.poll_interval = poll_interval
+        self.processed_files = 0
+        self.processed_batches = 0
+        self._wakeup = asyncio.Event()
+        self._updated = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        requeued = self.store.requeue_orphaned()
+        if requeued:
+            logger.info(f"恢复 {requeued} 个未完成的任务文件")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def wake(self):
+        """有新任务提交时唤醒调度循环"""
+        self._wakeup.set()
+
+    async def wait_for_update(self, timeout: float):
+        """等待任意文件完成（或超时），供SSE推送使用"""
+        async with self._updated:
+            try:
+                await asyncio.wait_for(self._updated.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _notify(self):
+        async with self._updated:
+            self._updated.notify_all()
+
+    async def _run(self):
+        logger.info(f"批量任务调度已启动 (批大小: {self.batch_size}, 批处理时长上限: {self.batch_max_seconds}秒)")
+        while True:
+            backend = self.backend_getter()
+            if backend is None or not backend.initialized:
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            files = await asyncio.to_thread(self.store.claim_files, self.batch_size)
+            if not files:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(backend, files)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"批量任务处理失败: {str(e)}")
+                for f in files:
+                    await asyncio.to_thread(
+                        self.store.finish_file, f["job_id"], f["idx"], {"success": False, "error": str(e)}
+                    )
+            await self._notify()
+
+    async def _process(self, backend, files: List[Dict[str, Any]]):
+        options = files[0]["options"]
+
+        short, long = [], []
+        for f in files:
+            duration = f["duration"] or await asyncio.to_thread(probe_duration, f["path"])
+            (long if duration and duration > self.batch_max_seconds else short).append(f)
+
+        if short:
+            results = await asyncio.to_thread(
+                backend.transcribe_batch, [f["path"] for f in short], options
+            )
+            self.processed_batches += 1
+            for f, result in zip(short, results):
+                await self._finish(f, result)
+            await self._notify()
+
+        for f in long:
+            result = await asyncio.to_thread(self._transcribe_long, backend, f["path"], options)
+            await self._finish(f, result)
+            await self._notify()
+
+    @staticmethod
+    def _transcribe_long(backend, path: str, options: Dict[str, Any]) -> Dict[str, Any]:
+        result = {"success": False, "error": "长音频转录未返回结果"}
+        for event in backend.transcribe_long_audio(path, {"priority": "batch", **options}):
+            if event.get("event") == "final":
+                result = {k: v for k, v in event.items() if k not in ("event", "done")}
+        return result
+
+    async def _finish(self, f: Dict[str, Any], result: Dict[str, Any]):
+        await asyncio.to_thread(self.store.finish_file, f["job_id"], f["idx"], result)
+        self.processed_files += 1
+        if result.get("success"):
+            logger.info(f"任务 {f['job_id']} 文件 {f['idx']} ({f['name']}) 完成")
+        else:
+            logger.warning(f"任务 {f['job_id']} 文件 {f['idx']} ({f['name']}) 失败: {result.get('error')}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "batch_size": self.batch_size,
+            "batch_max_seconds": self.batch_max_seconds,
+            "processed_files": self.processed_files,
+            "processed_batches": self.processed_batches,
+            **self.store.get_stats(),
+        }
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量转录任务存储
+任务和每个文件的状态、结果保存在本地SQLite中，服务重启后未完成的文件重新排队继续处理
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Optional, Dict, Any, List
+
+# 文件状态
+FILE_PENDING = "pending"
+FILE_RUNNING = "running"
+FILE_DONE = "done"
+FILE_FAILED = "failed"
+FILE_CANCELLED = "cancelled"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    options TEXT NOT NULL,
+    total INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_files (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    owned INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    claimed_by INTEGER,
+    duration REAL,
+    result TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_job_files_status ON job_files (status, job_id, idx);
+"""
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """SQLite任务存储，可被多个worker进程同时使用（领取文件在写事务中完成）"""
+
+    def __init__(self, job_dir: Optional[str] = None):
+        """
+        Args:
+            job_dir: 任务目录，保存数据库和上传的音频，默认读取JOB_DIR（/tmp/ququ_jobs）
+        """
+        self.job_dir = job_dir or os.getenv("JOB_DIR", "/tmp/ququ_jobs")
+        os.makedirs(self.job_dir, exist_ok=True)
+        self.db_path = os.path.join(self.job_dir, "jobs.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30,
+                                     isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def file_dir(self, job_id: str) -> str:
+        """任务上传文件的保存目录"""
+        path = os.path.join(self.job_dir, job_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def new_job_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def create_job(self, job_id: str, files: List[Dict[str, Any]], options: Dict[str, Any]) -> str:
+        """
+        创建任务
+
+        Args:
+            files: [{"name": 显示名, "path": 音频路径, "owned": 是否为任务目录中的上传文件}, ...]
+            options: 转录选项
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO jobs (id, created_at, updated_at, options, total) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, now, now, json.dumps(options, ensure_ascii=False), len(files)),
+                )
+                self._conn.executemany(
+                    "INSERT INTO job_files (job_id, idx, name, path, owned, status, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (job_id, idx, f["name"], f["path"], int(f.get("owned", False)), FILE_PENDING, now)
+                        for idx, f in enumerate(files)
+                    ],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def requeue_orphaned(self) -> int:
+        """把领取进程已不存在的running文件重新排队（服务重启后继续处理），返回数量"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, idx, claimed_by FROM job_files WHERE status = ?", (FILE_RUNNING,)
+            ).fetchall()
+            orphaned = [(row["job_id"], row["idx"]) for row in rows
+                        if row["claimed_by"] == os.getpid() or not _pid_alive(row["claimed_by"])]
+            self._conn.executemany(
+                "UPDATE job_files SET status = ?, claimed_by = NULL, updated_at = ? "
+                "WHERE job_id = ? AND idx = ?",
+                [(FILE_PENDING, time.time(), job_id, idx) for job_id, idx in orphaned],
+            )
+        return len(orphaned)
+
+    def claim_files(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        领取最早的一个任务中最多limit个待处理文件并标记为running
+
+        同一批只来自同一个任务，转录选项一致，可以一起批处理。
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT f.job_id FROM job_files f JOIN jobs j ON j.id = f.job_id "
+                    "WHERE f.status = ? ORDER BY j.created_at, f.idx LIMIT 1",
+                    (FILE_PENDING,),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return []
+
+                job_id = row["job_id"]
+                options = json.loads(self._conn.execute(
+                    "SELECT options FROM jobs WHERE id = ?", (job_id,)
+                ).fetchone()["options"])
+                rows = self._conn.execute(
+                    "SELECT job_id, idx, name, path, duration FROM job_files "
+                    "WHERE job_id = ? AND status = ? ORDER BY idx LIMIT ?",
+                    (job_id, FILE_PENDING, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE job_files SET status = ?, claimed_by = ?, updated_at = ? "
+                    "WHERE job_id = ? AND idx = ?",
+                    [(FILE_RUNNING, os.getpid(), now, r["job_id"], r["idx"]) for r in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [{**dict(r), "options": options} for r in rows]
+
+    def finish_file(self, job_id: str, idx: int, result: Dict[str, Any]):
+        """记录单个文件的转录结果（success为False时记为失败）"""
+        now = time.time()
+        success = result.get("success", False)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_files SET status = ?, result = ?, error = ?, duration = ?, "
+                "claimed_by = NULL, updated_at = ? WHERE job_id = ? AND idx = ? AND status = ?",
+                (
+                    FILE_DONE if success else FILE_FAILED,
+                    json.dumps(result, ensure_ascii=False) if success else None,
+                    None if success else result.get("error", "转录失败"),
+                    result.get("duration"),
+                    now, job_id, idx, FILE_RUNNING,
+                ),
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+
+    def cancel_job(self, job_id: str) -> int:
+        """取消任务中尚未开始的文件，返回取消数量"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE job_files SET status = ?, updated_at = ? WHERE job_id = ? AND status = ?",
+                (FILE_CANCELLED, now, job_id, FILE_PENDING),
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+        return cursor.rowcount
+
+    def get_job(self, job_id: str, include_results: bool = True) -> Optional[Dict[str, Any]]:
+        """任务详情，包括每个文件的状态和结果"""
+        with self._lock:
+            job = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            files = self._conn.execute(
+                "SELECT idx, name, status, duration, result, error, updated_at FROM job_files "
+                "WHERE job_id = ? ORDER BY idx", (job_id,)
+            ).fetchall()
+
+        file_list = []
+        counts = {FILE_PENDING: 0, FILE_RUNNING: 0, FILE_DONE: 0, FILE_FAILED: 0, FILE_CANCELLED: 0}
+        for f in files:
+            counts[f["status"]] += 1
+            item = {"index": f["idx"], "name": f["name"], "status": f["status"],
+                    "duration": f["duration"], "error": f["error"], "updated_at": f["updated_at"]}
+            if include_results and f["result"]:
+                item["result"] = json.loads(f["result"])
+            file_list.append(item)
+
+        if counts[FILE_PENDING] or counts[FILE_RUNNING]:
+            status = "running" if counts[FILE_RUNNING] or counts[FILE_DONE] or counts[FILE_FAILED] else "queued"
+        elif counts[FILE_CANCELLED]:
+            status = "cancelled"
+        else:
+            status = "completed"
+
+        return {
+            "job_id": job["id"],
+            "status": status,
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "options": json.loads(job["options"]),
+            "total": job["total"],
+            "counts": counts,
+            "files": file_list,
+        }
+
+    def list_jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        jobs = [self.get_job(row["id"], include_results=False) for row in rows]
+        for job in jobs:
+            job.pop("files", None)
+        return jobs
+
+    def delete_job(self, job_id: str) -> bool:
+        """删除已结束的任务及其上传文件"""
+        with self._lock:
+            owned = self._conn.execute(
+                "SELECT path FROM job_files WHERE job_id = ? AND owned = 1", (job_id,)
+            ).fetchall()
+            self._conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+            cursor = self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+        for row in owned:
+            try:
+                os.unlink(row["path"])
+            except FileNotFoundError:
+                pass
+        try:
+            os.rmdir(os.path.join(self.job_dir, job_id))
+        except OSError:
+            pass
+        return cursor.rowcount > 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) AS n FROM job_files GROUP BY status"
+            ).fetchall()
+        return {"files": {row["status"]: row["n"] for row in rows}}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -6,9 +6,20 @@ Ollama LLM客户端
 """
 
 import os
+import json
+import time
+import asyncio
 import logging
 import httpx
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Callable
+
+from singleflight import SingleFlight
+from llm_governor import LLMGovernor, LLMBusyError
+from llm_pool import LLMBackendPool, LLMBackend
+from llm_keepalive import ModelKeepAlive
+from prompts import correction_messages, asr_translation_messages, translation_messages
+from tracing import span, traceparent
+from logging_setup import request_id_var
 
 logger = logging.getLogger(__name__)
 
@@ -16,28 +27,315 @@ logger = logging.getLogger(__name__)
 class OllamaClient:
     """Ollama API客户端"""
 
-    def __init__(self, base_url: Optional[str] = None, model: Optional[str] = None):
+    def __init__(self, base_url: Optional[str] = None, model: Optional[str] = None,
+                 base_urls: Optional[List[str]] = None):
         """
         初始化Ollama客户端
 
         Args:
             base_url: Ollama API地址，默认为环境变量OLLAMA_BASE_URL或localhost:11434
             model: 使用的模型名称，默认为gpt-oss:20b
+            base_urls: 多个OpenAI兼容后端地址，默认读取OLLAMA_BASE_URLS（逗号分隔）；
+                       未设置时只使用base_url
         """
-        self.base_url = base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-        # 确保URL格式正确
-        if not self.base_url.endswith("/v1"):
-            if self.base_url.endswith("/"):
-                self.base_url = self.base_url + "v1"
-            else:
-                self.base_url = self.base_url + "/v1"
+        if base_urls is None:
+            base_urls = [url for url in os.getenv("OLLAMA_BASE_URLS", "").split(",") if url.strip()]
+        if not base_urls:
+            base_urls = [base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")]
 
         self.model = model or os.getenv("OLLAMA_MODEL", "gpt-oss:20b")
+        self.pool = LLMBackendPool(base_urls, model=self.model)
+        # 第一个后端作为显示用的主地址
+        self.base_url = self.pool.backends[0].base_url
+
         self.timeout = 60.0
-        logger.info(f"初始化Ollama客户端: {self.base_url}, 模型: {self.model}")
+        # Ollama原生接口的参数；num_ctx变化会导致Ollama重新加载模型，因此固定不变
+        self.keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+        self.num_ctx = int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+        # 输出token上限 = 输入字数 × 比例 + 余量（纠错输出约等于输入长度）
+        self.predict_ratio = float(os.getenv("OLLAMA_PREDICT_RATIO", "1.5"))
+        self.predict_margin = int(os.getenv("OLLAMA_PREDICT_MARGIN", "32"))
+        # 推理模型（如gpt-oss）忽略think:false，推理过程的token同样计入输出上限，
+        # 为其额外预留推理预算，并按推理强度请求尽量短的推理
+        patterns = os.getenv("OLLAMA_REASONING_MODELS", "gpt-oss")
+        self.reasoning = any(p.strip() and p.strip() in self.model for p in patterns.split(","))
+        self.reasoning_tokens = int(os.getenv("OLLAMA_REASONING_TOKENS", "1024")) if self.reasoning else 0
+        self.reasoning_effort = os.getenv("OLLAMA_REASONING_EFFORT", "low")
+        # 启动时预加载模型，有请求的时间段内保持驻留
+        self.keepalive = ModelKeepAlive(self.pool, self.model, self.keep_alive)
+        # 相同请求体的并发调用只向Ollama发送一次
+        self._singleflight = SingleFlight("llm")
+        # 限制同时发往Ollama的请求数（所有worker合计），超出的按优先级排队；默认每个后端2个
+        self.governor = LLMGovernor(
+            max_inflight=int(os.getenv("OLLAMA_MAX_INFLIGHT", str(2 * len(self.pool.backends))))
+        )
+        logger.info(f"初始化Ollama客户端: {', '.join(b.base_url for b in self.pool.backends)}, 模型: {self.model}")
+
+    def _predict_limit(self, text: str, cap: int) -> int:
+        """按输入长度估计输出token上限，不超过cap；推理模型另加推理预算"""
+        return min(cap, int(len(text) * self.predict_ratio) + self.predict_margin) + self.reasoning_tokens
+
+    async def _chat(self, messages: List[Dict[str, str]], num_predict: int,
+                    temperature: float = 0.3, priority: str = "normal",
+                    timeout: Optional[float] = None, stop: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        调用LLM对话接口（Ollama原生/api/chat，或OpenAI兼容的/v1/chat/completions）
+
+        Args:
+            num_predict: 输出token上限
+            priority: 排队优先级（interactive/normal/batch）
+            timeout: 整个调用（排队+请求）的时间上限（秒），由请求的剩余延迟预算给出；默认不额外限制
+            stop: 停止序列
+
+        Returns:
+            {"success": True, "content": 回复文本} 或 {"success": False, "error": 错误信息}；
+            排队超时或队列已满时附带 "type": "llm_busy"，输出达到token上限时为
+            {"success": False, "error": "truncated", "type": "truncated"}（不完整的结果不能代替原文）
+        """
+        self.keepalive.touch()
+        # 与后端接口无关的请求参数，发送时再转换为具体接口的请求体
+        payload = {
+            "messages": messages,
+            "temperature": temperature,
+            "num_predict": num_predict,
+            "stop": stop or [],
+        }
+        key = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # 合并执行带着发起者的时间预算：合并进来的调用按自己的截止时间等待，
+        # 执行因发起者的预算较短而失败（超过截止时间或排队超时）时，用自己剩余的预算重新执行一次
+        for attempt in range(2):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            started = []
+
+            def run(remaining=remaining):
+                started.append(True)
+                return self._governed_chat(payload, priority, remaining)
+
+            try:
+                result = await asyncio.wait_for(self._singleflight.do(key, run), remaining)
+            except asyncio.TimeoutError:
+                break
+            if started or attempt or result.get("type") not in ("deadline", "llm_busy"):
+                return result
+            logger.info(f"合并的LLM请求因发起者的时间预算失败 ({result['error']})，按本请求的预算重新执行")
+        logger.warning(f"LLM请求超过截止时间 ({priority})")
+        return {"success": False, "error": "超过请求截止时间", "type": "deadline"}
+
+    async def _governed_chat(self, payload: Dict[str, Any], priority: str,
+                             timeout: Optional[float] = None) -> Dict[str, Any]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        queue_timeout = None if timeout is None else min(self.governor.queue_timeout, timeout)
+        try:
+            with span("llm", priority=priority, model=self.model):
+                async with self.governor.slot(priority, queue_timeout):
+                    return await self._post_chat(payload, deadline)
+        except LLMBusyError as e:
+            logger.warning(f"LLM请求未执行 ({priority}): {str(e)}")
+            return {"success": False, "error": str(e), "type": "llm_busy"}
+
+    async def _post_chat(self, payload: Dict[str, Any], deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        发往后端池中选出的后端；启用对冲时，首个后端超过其p95延迟仍未返回，
+        再向另一个健康后端发出同样的请求，取先成功的结果。
+        请求失败时换一个未尝试过的健康后端重试一次（超过截止时间的不重试）
+
+        Args:
+            deadline: time.monotonic()表示的截止时间，None表示只受self.timeout限制
+        """
+        backend = self.pool.pick()
+        tried = [backend]
+        result = await self._post_hedged(backend, payload, tried, deadline)
+        # 输出被截断与后端无关，换后端重试结果相同
+        if not result["success"] and result.get("type") not in ("deadline", "truncated"):
+            retry_backend = self.pool.pick(exclude=tried)
+            if retry_backend is not None:
+                logger.warning(f"LLM后端 {backend.base_url} 请求失败，改用 {retry_backend.base_url} 重试")
+                result = await self._post_hedged(retry_backend, payload, tried + [retry_backend], deadline)
+        return result
+
+    async def _post_hedged(self, backend: LLMBackend, payload: Dict[str, Any],
+                           tried: List[LLMBackend], deadline: Optional[float] = None) -> Dict[str, Any]:
+        first = self._start_request(backend, payload, deadline)
+        tasks = [first]
+        try:
+            delay = self.pool.hedge_delay(backend)
+            if delay is None:
+                return await first
+
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            hedge_backend = None if done else self.pool.pick(exclude=tried)
+            if hedge_backend is None:
+                return await first
+
+            logger.info(f"LLM请求超过p95 ({delay:.2f}秒)，对冲到 {hedge_backend.base_url}")
+            tried.append(hedge_backend)
+            tasks.append(self._start_request(hedge_backend, payload, deadline))
+            pending = set(tasks)
+            result = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result["success"]:
+                        self.pool.record_hedge("primary" if task is first else "hedge")
+                        return result
+            return result
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _start_request(self, backend: LLMBackend, payload: Dict[str, Any],
+                       deadline: Optional[float] = None) -> asyncio.Future:
+        """立即计入后端的进行中请求数（同一时刻的多个请求据此分散），请求结束时记录延迟"""
+        self.pool.begin(backend)
+        started = time.monotonic()
+        task = asyncio.ensure_future(self._request_chat(backend, payload, deadline))
+
+        def _done(t: asyncio.Future):
+            # 被取消或因调用方的截止时间而超时的请求不反映后端的延迟和健康状态
+            if t.cancelled() or t.result().get("type") == "deadline":
+                self.pool.end(backend, 0.0, None)
+            else:
+                result = t.result()
+                # 被截断的回复说明后端正常工作
+                ok = result["success"] or result.get("type") == "truncated"
+                self.pool.end(backend, time.monotonic() - started, ok, result.get("error"))
+
+        task.add_done_callback(_done)
+        return task
+
+    def _native_payload(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        options = {
+            "num_predict": payload["num_predict"],
+            "temperature": payload["temperature"],
+            "num_ctx": self.num_ctx,
+        }
+        if payload["stop"]:
+            options["stop"] = payload["stop"]
+        return {
+            "model": self.model,
+            "messages": payload["messages"],
+            "stream": False,
+            # gpt-oss只接受推理强度（low/medium/high），不能关闭推理
+            "think": self.reasoning_effort if self.reasoning else False,
+            "keep_alive": self.keep_alive,
+            "options": options,
+        }
+
+    def _openai_payload(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        body = {
+            "model": self.model,
+            "messages": payload["messages"],
+            "temperature": payload["temperature"],
+            "max_tokens": payload["num_predict"],
+            "stream": False,
+        }
+        if self.reasoning:
+            body["reasoning_effort"] = self.reasoning_effort
+        if payload["stop"]:
+            body["stop"] = payload["stop"]
+        return body
+
+    @staticmethod
+    def _is_missing_endpoint(response: httpx.Response) -> bool:
+        """原生接口返回404且不是Ollama的"模型不存在"错误，说明后端不是Ollama"""
+        if response.status_code != 404:
+            return False
+        try:
+            error = str(response.json().get("error", ""))
+        except Exception:
+            return True
+        return "model" not in error
+
+    async def _request_chat(self, backend: LLMBackend, payload: Dict[str, Any],
+                            deadline: Optional[float] = None) -> Dict[str, Any]:
+        end = time.monotonic() + self.timeout
+        limited_by_deadline = deadline is not None and deadline < end
+        if limited_by_deadline:
+            end = deadline
+
+        def remaining() -> float:
+            return end - time.monotonic()
+
+        if remaining() <= 0:
+            return {"success": False, "error": "超过请求截止时间", "type": "deadline"}
+
+        with span("llm.request", backend=backend.base_url) as request_span:
+            result = await self._send_chat(backend, payload, remaining, limited_by_deadline)
+            if request_span is not None:
+                request_span.set(api=backend.api, success=result["success"], result_type=result.get("type"))
+            return result
+
+    async def _send_chat(self, backend: LLMBackend, payload: Dict[str, Any],
+                         remaining: Callable[[], float], limited_by_deadline: bool) -> Dict[str, Any]:
+        # 追踪上下文和请求ID随请求头传给后端（后端或其前面的代理记录时可与本服务的追踪关联）
+        headers = {}
+        parent = traceparent()
+        if parent is not None:
+            headers["traceparent"] = parent
+        request_id = request_id_var.get()
+        if request_id is not None:
+            headers["X-Request-ID"] = request_id
+
+        try:
+            async with httpx.AsyncClient(timeout=remaining(), headers=headers) as client:
+                # httpx的超时针对单次读写，截止时间需要限制整个请求
+                if backend.api != "openai":
+                    response = await asyncio.wait_for(
+                        client.post(f"{backend.root_url}/api/chat", json=self._native_payload(payload)),
+                        remaining(),
+                    )
+                    if backend.api is None and self._is_missing_endpoint(response):
+                        logger.info(f"{backend.root_url} 不支持Ollama原生接口，改用OpenAI兼容接口")
+                        backend.api = "openai"
+                    else:
+                        if backend.api is None and response.status_code == 200:
+                            backend.api = "native"
+                        return self._parse_response(backend, response, native=True)
+
+                response = await asyncio.wait_for(
+                    client.post(f"{backend.base_url}/chat/completions", json=self._openai_payload(payload)),
+                    remaining(),
+                )
+                return self._parse_response(backend, response, native=False)
+
+        except (httpx.TimeoutException, asyncio.TimeoutError):
+            if limited_by_deadline:
+                logger.warning(f"Ollama API请求超过截止时间 ({backend.base_url})")
+                return {"success": False, "error": "超过请求截止时间", "type": "deadline"}
+            logger.error(f"Ollama API请求超时 ({backend.base_url})")
+            return {"success": False, "error": "请求超时"}
+        except Exception as e:
+            logger.error(f"Ollama API请求失败 ({backend.base_url}): {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    @staticmethod
+    def _parse_response(backend: LLMBackend, response: httpx.Response, native: bool) -> Dict[str, Any]:
+        if response.status_code != 200:
+            logger.error(f"Ollama API错误 ({backend.base_url}): {response.status_code} - {response.text}")
+            return {"success": False, "error": f"API请求失败: {response.status_code}"}
+
+        result = response.json()
+        if native:
+            content = result["message"]["content"]
+            truncated = result.get("done_reason") == "length"
+        else:
+            choice = result["choices"][0]
+            content = choice["message"]["content"]
+            truncated = choice.get("finish_reason") == "length"
+        if truncated:
+            logger.warning(f"LLM输出达到token上限被截断 ({backend.base_url})")
+            return {"success": False, "error": "truncated", "type": "truncated"}
+        return {"success": True, "content": content.strip()}
 
     async def optimize_text(self, text: str, mode: str = "optimize", custom_prompt: Optional[str] = None,
-                           hotwords_context: Optional[str] = None) -> Dict[str, Any]:
+                           hotwords_context: Optional[str] = None,
+                           priority: str = "interactive", timeout: Optional[float] = None,
+                           single_utterance: bool = False) -> Dict[str, Any]:
         """
         使用LLM优化文本
 
@@ -45,118 +343,45 @@ class OllamaClient:
             text: 原始文本
             mode: 优化模式 (optimize/format/custom)
             custom_prompt: 自定义提示词
+            priority: 排队优先级，听写后的优化默认为interactive
+            timeout: 调用时间上限（秒），由请求的剩余延迟预算给出
+            single_utterance: 输入为一次识别的单段文本（ASR后处理）；为True时在模型追加的说明段落前停止，
+                通用的文本优化接口可能有多个段落，不能按空行截断
 
         Returns:
-            包含优化结果的字典
+            包含优化结果的字典；输出被截断时success为False，调用方应使用原文
         """
-        try:
-            prompt = self._build_prompt(text, mode, custom_prompt, hotwords_context)
-
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {"role": "system", "content": "你是专业的ASR文本纠错助手，严格按照用户要求纠正专有名词。"},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "temperature": 0.3,
-                        "stream": False,
-                        "think": False,
-                        "options": {
-                            "num_predict": 512
-                        }
-                    }
-                )
-
-                if response.status_code != 200:
-                    logger.error(f"Ollama API错误: {response.status_code} - {response.text}")
-                    return {
-                        "success": False,
-                        "error": f"API请求失败: {response.status_code}",
-                        "original_text": text
-                    }
-
-                result = response.json()
-                optimized_text = result["choices"][0]["message"]["content"].strip()
-
-                logger.info(f"文本优化成功，原文长度: {len(text)}, 优化后长度: {len(optimized_text)}")
-
-                return {
-                    "success": True,
-                    "original_text": text,
-                    "optimized_text": optimized_text,
-                    "mode": mode,
-                    "model": self.model
-                }
-
-        except httpx.TimeoutException:
-            logger.error("Ollama API请求超时")
+        result = await self._chat(
+            messages=correction_messages(text, mode, custom_prompt, hotwords_context),
+            # 纠错/格式化输出与输入长度相当；自定义提示词的输出长度无法估计，保留原上限
+            num_predict=512 + self.reasoning_tokens if custom_prompt else self._predict_limit(text, 512),
+            priority=priority,
+            timeout=timeout,
+            # 单段识别文本的纠错结果也是单段文本，在模型追加的说明段落前停止
+            stop=["\n\n"] if single_utterance and mode in ("optimize", "punctuate") and not custom_prompt else None,
+        )
+        if not result["success"]:
+            logger.error(f"文本优化失败: {result['error']}")
             return {
                 "success": False,
-                "error": "请求超时",
+                "error": result["error"],
+                "type": result.get("type"),
                 "original_text": text
             }
-        except Exception as e:
-            logger.error(f"文本优化失败: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "original_text": text
-            }
-
-    def _build_prompt(self, text: str, mode: str, custom_prompt: Optional[str] = None,
-                      hotwords_context: Optional[str] = None) -> str:
-        """构建优化提示词"""
-        if custom_prompt:
-            return f"{custom_prompt}\n\n原文：\n{text}"
-
-        # 准备热词对照表
-        hotwords_section = ""
-        if hotwords_context:
-            hotwords_section = f"""
 
-【⚠️ 专有名词对照表 - 必须严格遵循】
-以下是确定的误识别→正确形式映射，请优先使用：
-{hotwords_context}
-"""
-
-        prompts = {
-            "optimize": f"""请纠正以下语音识别结果中的专有名词错误，并删除口头语。
-
-规则：
-1. 如果专有名词对照表中有匹配项，必须使用对照表的正确形式
-2. 只修改明显错误的专有名词，不改变其他内容
-3. 删除"嗯"、"啊"、"那个"等口头语
-4. 保持原句的人称、语气和句式结构
-{hotwords_section}
-常见专有名词：Gemma, Qwen, Qwen2.5, Qwen3, DeepSeek, ChatGPT, GPT, Claude, PyTorch, TensorFlow, Docker, Git, GitHub, Home Assistant
-
-文本：{text}""",
-
-            "format": f"""请将以下文本格式化为正式的书面语：
-1. 保持原意不变
-2. 使用恰当的标点符号
-3. 分段组织内容
-4. 使用规范的书面语表达
-
-原文：
-{text}
-
-请直接输出格式化后的文本。""",
-
-            "punctuate": f"""请为以下文本添加合适的标点符号，使其更易读：
-
-原文：
-{text}
+        optimized_text = result["content"]
+        logger.info(f"文本优化成功，原文长度: {len(text)}, 优化后长度: {len(optimized_text)}")
 
-请直接输出添加标点后的文本。"""
+        return {
+            "success": True,
+            "original_text": text,
+            "optimized_text": optimized_text,
+            "mode": mode,
+            "model": self.model
         }
 
-        return prompts.get(mode, prompts["optimize"])
-
-    async def translate_from_asr(self, text: str, source_lang: str = "中文", target_lang: str = "英文") -> Dict[str, Any]:
+    async def translate_from_asr(self, text: str, source_lang: str = "中文", target_lang: str = "英文",
+                                 priority: str = "normal", timeout: Optional[float] = None) -> Dict[str, Any]:
         """
         针对ASR识别结果的智能翻译（优化+翻译一步完成）
 
@@ -164,98 +389,44 @@ class OllamaClient:
             text: ASR识别的原始文本
             source_lang: 源语言（默认：中文）
             target_lang: 目标语言（默认：英文）
+            priority: 排队优先级
+            timeout: 调用时间上限（秒），由请求的剩余延迟预算给出
 
         Returns:
             包含翻译结果的字典
         """
-        try:
-            prompt = f"""你的任务：理解语音识别结果的真实意图，并翻译成{target_lang}。
-
-【重要背景】
-这段文本是语音识别的结果，可能包含错误：
-- 专有名词识别错误（如："deep sik" → "DeepSeek", "乾文二点五" → "Qwen2.5"）
-- 口头语和语气词（嗯、啊、那个等）
-- 发音相似导致的误识别
-
-【常见专有名词参考】
-AI模型: Gemma, Qwen, Qwen3, Qwen2.5, DeepSeek, ChatGPT, GPT, Claude, LLaMA
-技术工具: PyTorch, TensorFlow, CUDA, Ollama, Docker, Hugging Face
-社交平台: Facebook, Reddit, Twitter, YouTube, GitHub, LinkedIn
-
-【任务步骤】
-1. 理解句子真实含义和主题
-2. 识别并纠正专有名词的误识别
-3. 删除口头语和语气词
-4. 翻译成准确、地道的{target_lang}
-
-【要求】
-- 专有名词必须使用正确的英文形式
-- 保持原文的语气和风格
-- 使用地道的{target_lang}表达
-- 直接输出翻译结果，不要解释
-
-【原文】
-{text}
-
-【{target_lang}翻译】"""
-
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {"role": "system", "content": f"你是一个专业的翻译助手，擅长理解语音识别结果并准确翻译。特别擅长处理技术类专有名词。"},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "temperature": 0.3,
-                        "stream": False,
-                        "think": False,
-                        "options": {
-                            "num_predict": 1024
-                        }
-                    }
-                )
-
-                if response.status_code != 200:
-                    logger.error(f"Ollama API错误: {response.status_code} - {response.text}")
-                    return {
-                        "success": False,
-                        "error": f"API请求失败: {response.status_code}",
-                        "original_text": text
-                    }
-
-                result = response.json()
-                translated_text = result["choices"][0]["message"]["content"].strip()
-
-                logger.info(f"ASR智能翻译成功: {source_lang} -> {target_lang}, 原文长度: {len(text)}, 译文长度: {len(translated_text)}")
-
-                return {
-                    "success": True,
-                    "original_text": text,
-                    "translated_text": translated_text,
-                    "source_lang": source_lang,
-                    "target_lang": target_lang,
-                    "model": self.model,
-                    "mode": "asr_translate"  # 标识这是ASR直接翻译模式
-                }
-
-        except httpx.TimeoutException:
-            logger.error("Ollama API请求超时")
-            return {
-                "success": False,
-                "error": "请求超时",
-                "original_text": text
-            }
-        except Exception as e:
-            logger.error(f"ASR智能翻译失败: {str(e)}")
+        result = await self._chat(
+            messages=asr_translation_messages(text, target_lang),
+            num_predict=self._predict_limit(text, 1024),
+            priority=priority,
+            timeout=timeout,
+            # 只要译文本身，不要模型仿照提示词格式追加的【说明】等段落
+            stop=["\n\n", "【"],
+        )
+        if not result["success"]:
+            logger.error(f"ASR智能翻译失败: {result['error']}")
             return {
                 "success": False,
-                "error": str(e),
+                "error": result["error"],
+                "type": result.get("type"),
                 "original_text": text
             }
 
-    async def translate_text(self, text: str, source_lang: str = "中文", target_lang: str = "英文") -> Dict[str, Any]:
+        translated_text = result["content"]
+        logger.info(f"ASR智能翻译成功: {source_lang} -> {target_lang}, 原文长度: {len(text)}, 译文长度: {len(translated_text)}")
+
+        return {
+            "success": True,
+            "original_text": text,
+            "translated_text": translated_text,
+            "source_lang": source_lang,
+            "target_lang": target_lang,
+            "model": self.model,
+            "mode": "asr_translate"  # 标识这是ASR直接翻译模式
+        }
+
+    async def translate_text(self, text: str, source_lang: str = "中文", target_lang: str = "英文",
+                             priority: str = "batch") -> Dict[str, Any]:
         """
         翻译文本
 
@@ -263,104 +434,57 @@ AI模型: Gemma, Qwen, Qwen3, Qwen2.5, DeepSeek, ChatGPT, GPT, Claude, LLaMA
             text: 原始文本
             source_lang: 源语言（默认：中文）
             target_lang: 目标语言（默认：英文）
+            priority: 排队优先级，独立的文本翻译默认为batch
 
         Returns:
             包含翻译结果的字典
         """
-        try:
-            prompt = f"""请将以下{source_lang}翻译成{target_lang}。
-
-要求：
-1. 准确翻译原文意思
-2. 保持原文的语气和风格
-3. 使用地道的{target_lang}表达
-4. 直接输出翻译结果，不要添加任何解释
-
-原文：{text}
-
-翻译："""
-
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {"role": "system", "content": f"你是一个专业的翻译助手，擅长{source_lang}到{target_lang}的翻译。"},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "temperature": 0.3,  # 翻译使用较低temperature保证准确性
-                        "stream": False,
-                        "think": False,
-                        "options": {
-                            "num_predict": 1024
-                        }
-                    }
-                )
-
-                if response.status_code != 200:
-                    logger.error(f"Ollama API错误: {response.status_code} - {response.text}")
-                    return {
-                        "success": False,
-                        "error": f"API请求失败: {response.status_code}",
-                        "original_text": text
-                    }
-
-                result = response.json()
-                translated_text = result["choices"][0]["message"]["content"].strip()
-
-                logger.info(f"翻译成功: {source_lang} -> {target_lang}, 原文长度: {len(text)}, 译文长度: {len(translated_text)}")
-
-                return {
-                    "success": True,
-                    "original_text": text,
-                    "translated_text": translated_text,
-                    "source_lang": source_lang,
-                    "target_lang": target_lang,
-                    "model": self.model
-                }
-
-        except httpx.TimeoutException:
-            logger.error("Ollama API请求超时")
-            return {
-                "success": False,
-                "error": "请求超时",
-                "original_text": text
-            }
-        except Exception as e:
-            logger.error(f"翻译失败: {str(e)}")
+        result = await self._chat(
+            messages=translation_messages(text, source_lang, target_lang),
+            num_predict=self._predict_limit(text, 1024),
+            priority=priority,
+        )
+        if not result["success"]:
+            logger.error(f"翻译失败: {result['error']}")
             return {
                 "success": False,
-                "error": str(e),
+                "error": result["error"],
+                "type": result.get("type"),
                 "original_text": text
             }
 
+        translated_text = result["content"]
+        logger.info(f"翻译成功: {source_lang} -> {target_lang}, 原文长度: {len(text)}, 译文长度: {len(translated_text)}")
+
+        return {
+            "success": True,
+            "original_text": text,
+            "translated_text": translated_text,
+            "source_lang": source_lang,
+            "target_lang": target_lang,
+            "model": self.model
+        }
+
     async def check_health(self) -> Dict[str, Any]:
-        """检查Ollama服务健康状态"""
-        try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{self.base_url}/models")
-
-                if response.status_code == 200:
-                    models = response.json()
-                    return {
-                        "success": True,
-                        "available": True,
-                        "base_url": self.base_url,
-                        "model": self.model,
-                        "models": models.get("data", [])
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "available": False,
-                        "error": f"HTTP {response.status_code}"
-                    }
+        """检查Ollama服务健康状态（探测池中所有后端，任一可用即为可用）"""
+        probes = await self.pool.probe_all()
+        available = next((p for p in probes if p["success"]), None)
+        backends = self.pool.get_stats()["backends"]
 
-        except Exception as e:
-            logger.error(f"Ollama健康检查失败: {str(e)}")
+        if available is not None:
             return {
-                "success": False,
-                "available": False,
-                "error": str(e)
+                "success": True,
+                "available": True,
+                "base_url": self.base_url,
+                "model": self.model,
+                "models": available["models"],
+                "backends": backends,
             }
+
+        logger.error(f"Ollama健康检查失败: {probes[0].get('error')}")
+        return {
+            "success": False,
+            "available": False,
+            "error": probes[0].get("error"),
+            "backends": backends,
+        }
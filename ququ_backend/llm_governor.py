@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM并发控制
+所有发往Ollama的请求先取得调控器的名额：同时进行的请求数有上限，超出的请求按优先级排队
+（交互式的文本优化先于批量翻译），排队超时或队列已满时立即失败，由调用方回退到ASR原文，
+而不是让单个Ollama实例被无限并发拖慢到所有请求都超时
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from inference_scheduler import PRIORITY_CLASSES, DEFAULT_PRIORITY, WAIT_BUCKETS
+from metrics import REGISTRY
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+_queue_wait = REGISTRY.histogram(
+    "ququ_llm_queue_wait_seconds",
+    "Time LLM requests spent waiting for an in-flight slot",
+    ("priority",),
+    WAIT_BUCKETS,
+)
+_rejected = REGISTRY.counter(
+    "ququ_llm_rejected_total",
+    "LLM requests rejected by the governor",
+    ("priority", "reason"),
+)
+
+
+class LLMBusyError(RuntimeError):
+    """排队超时或队列已满"""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class LLMGovernor:
+    """
+    限制并发的异步优先级队列
+
+    名额释放时直接交给队首等待者（按优先级、再按到达顺序），不会被新到的请求抢走。
+    每个HTTP worker进程各有一个调控器，总上限按worker数平分，每个worker至少1个名额。
+    """
+
+    def __init__(self, max_inflight: Optional[int] = None, queue_timeout: Optional[float] = None,
+                 max_queue: Optional[int] = None, workers: Optional[int] = None):
+        """
+        Args:
+            max_inflight: 所有worker合计的LLM请求数上限，默认读取OLLAMA_MAX_INFLIGHT（2）
+            queue_timeout: 默认排队超时（秒），默认读取OLLAMA_QUEUE_TIMEOUT（10）
+            max_queue: 每个worker的排队请求数上限，默认读取OLLAMA_MAX_QUEUE（64）
+            workers: HTTP worker进程数，默认读取SERVER_WORKERS（1）
+        """
+        self.total_max_inflight = max_inflight or int(os.getenv("OLLAMA_MAX_INFLIGHT", "2"))
+        self.workers = max(1, workers or int(os.getenv("SERVER_WORKERS", "1")))
+        self.max_inflight = max(1, self.total_max_inflight // self.workers)
+        if self.max_inflight * self.workers > self.total_max_inflight:
+            logger.warning(f"OLLAMA_MAX_INFLIGHT={self.total_max_inflight} 小于worker数 {self.workers}，"
+                           f"每个worker仍保留1个名额，实际合计上限为 {self.max_inflight * self.workers}")
+        self.queue_timeout = queue_timeout or float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "10"))
+        self.max_queue = max_queue or int(os.getenv("OLLAMA_MAX_QUEUE", "64"))
+        self._inflight = 0
+        self._waiting = 0
+        # (排序等级, 到达序号, future)；取消的等待者留在堆中，出队时跳过
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._granted = {name: 0 for name in PRIORITY_CLASSES}
+
+        REGISTRY.gauge("ququ_llm_inflight", "LLM requests currently in flight",
+                       function=lambda: self._inflight)
+        REGISTRY.gauge("ququ_llm_queue_depth", "LLM requests waiting for an in-flight slot",
+                       function=lambda: self._waiting)
+        logger.info(f"LLM并发控制: 最大并发 {self.max_inflight}（{self.workers}个worker合计 "
+                    f"{self.total_max_inflight}）, 排队超时 {self.queue_timeout}秒, "
+                    f"队列上限 {self.max_queue}")
+
+    @asynccontextmanager
+    async def slot(self, priority: str = DEFAULT_PRIORITY, timeout: Optional[float] = None):
+        """
+        取得一个LLM请求名额
+
+        Args:
+            priority: 优先级类别（interactive/normal/batch），未知类别按normal处理
+            timeout: 排队超时（秒），默认使用queue_timeout
+
+        Raises:
+            LLMBusyError: 排队超时或队列已满
+        """
+        if priority not in PRIORITY_CLASSES:
+            priority = DEFAULT_PRIORITY
+        with span("llm.queue", priority=priority):
+            await self._acquire(priority, self.queue_timeout if timeout is None else timeout)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: str, timeout: float):
+        started = time.monotonic()
+        if self._inflight < self.max_inflight and self._waiting == 0:
+            self._inflight += 1
+            self._granted[priority] += 1
+            _queue_wait.observe(0.0, priority=priority)
+            return
+
+        if self._waiting >= self.max_queue:
+            _rejected.inc(priority=priority, reason="queue_full")
+            raise LLMBusyError("LLM请求队列已满", "queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (PRIORITY_CLASSES[priority], next(self._seq), future))
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max(timeout, 0.0))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done():
+                # 超时/取消的同时名额已经交给了本请求，归还给下一个等待者
+                self._release()
+            else:
+                future.cancel()
+                self._waiting -= 1
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            _rejected.inc(priority=priority, reason="timeout")
+            raise LLMBusyError(f"LLM繁忙，排队超过{timeout:.1f}秒", "timeout")
+
+        self._granted[priority] += 1
+        _queue_wait.observe(time.monotonic() - started, priority=priority)
+
+    def _release(self):
+        while self._heap:
+            _, _, future = heapq.heappop(self._heap)
+            if future.cancelled():
+                continue
+            # 名额直接转交，_inflight不变
+            self._waiting -= 1
+            future.set_result(True)
+            return
+        self._inflight -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_inflight": self.max_inflight,
+            "total_max_inflight": self.total_max_inflight,
+            "workers": self.workers,
+            "inflight": self._inflight,
+            "waiting": self._waiting,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "granted": dict(self._granted),
+            "rejected": {
+                reason: sum(_rejected.get(priority=name, reason=reason) for name in PRIORITY_CLASSES)
+                for reason in ("timeout", "queue_full")
+            },
+            "wait_histogram": _queue_wait.to_dict(),
+        }
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ollama模型预加载与保活
+启动时让各Ollama后端加载OLLAMA_MODEL；最近有LLM请求（活动窗口内）时定期检查模型是否驻留，
+已驻留则延长驻留时间，被换出则重新加载，使空闲后的第一个优化/翻译请求不必等待数GB的模型加载。
+超出活动窗口后不再保活，Ollama按keep_alive自然释放显存
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+
+from llm_pool import LLMBackendPool, LLMBackend, model_listed
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+_resident = REGISTRY.gauge(
+    "ququ_llm_model_resident",
+    "Whether the configured model is loaded on each Ollama backend",
+    ("backend",),
+)
+_loads = REGISTRY.counter(
+    "ququ_llm_model_loads_total",
+    "Model loads triggered by preload/keep-alive",
+    ("backend",),
+)
+
+
+class ModelKeepAlive:
+    """预加载并在活动窗口内保持模型驻留"""
+
+    def __init__(self, pool: LLMBackendPool, model: str, keep_alive: str,
+                 interval: Optional[float] = None, activity_window: Optional[float] = None):
+        """
+        Args:
+            pool: LLM后端池（OpenAI兼容的非Ollama后端自动跳过）
+            model: 模型名称
+            keep_alive: 加载/保活请求携带的驻留时间
+            interval: 保活检查间隔（秒），默认读取OLLAMA_KEEPALIVE_INTERVAL（240），应小于keep_alive
+            activity_window: 最后一次LLM请求后继续保活的时间（秒），默认读取OLLAMA_ACTIVITY_WINDOW（3600）
+        """
+        self.pool = pool
+        self.model = model
+        self.keep_alive = keep_alive
+        self.interval = interval or float(os.getenv("OLLAMA_KEEPALIVE_INTERVAL", "240"))
+        self.activity_window = activity_window or float(os.getenv("OLLAMA_ACTIVITY_WINDOW", "3600"))
+        self.preload = os.getenv("OLLAMA_PRELOAD", "1") == "1"
+        # 启动视为一次活动，保证启动后的第一个窗口内模型驻留
+        self.last_activity = time.monotonic()
+        self._states: Dict[str, Dict[str, Any]] = {
+            b.base_url: {
+                "resident": None,
+                "expires_at": None,
+                "size_vram": None,
+                "last_load_at": None,
+                "last_load_seconds": None,
+                "last_ping_at": None,
+                "error": None,
+            }
+            for b in pool.backends
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self):
+        """记录一次LLM活动"""
+        self.last_activity = time.monotonic()
+
+    def _matches(self, entry: Dict[str, Any]) -> bool:
+        return model_listed(self.model, (entry.get("name"), entry.get("model")))
+
+    async def _running_model(self, client: httpx.AsyncClient, backend: LLMBackend) -> Optional[Dict[str, Any]]:
+        """GET /api/ps，返回本模型的驻留信息；未驻留返回{}，不是Ollama返回None"""
+        response = await client.get(f"{backend.root_url}/api/ps")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        for entry in response.json().get("models", []):
+            if self._matches(entry):
+                return entry
+        return {}
+
+    async def refresh(self, backend: LLMBackend, ping: bool = True):
+        """
+        更新单个后端的驻留状态
+
+        Args:
+            ping: 为True时，已驻留则延长驻留时间，未驻留则加载；为False时只查询状态
+        """
+        state = self._states[backend.base_url]
+        if backend.api == "openai":
+            return
+        try:
+            async with httpx.AsyncClient(timeout=300.0) as client:
+                running = await self._running_model(client, backend)
+                if running is None:
+                    # 非Ollama后端（如llama.cpp server），模型常驻，无需保活
+                    state["resident"] = None
+                    if backend.api is None:
+                        backend.api = "openai"
+                    return
+
+                if ping:
+                    started = time.monotonic()
+                    # 不带prompt的generate请求只加载模型/重置驻留计时
+                    response = await client.post(
+                        f"{backend.root_url}/api/generate",
+                        json={"model": self.model, "keep_alive": self.keep_alive},
+                    )
+                    response.raise_for_status()
+                    if running:
+                        state["last_ping_at"] = time.time()
+                    else:
+                        state["last_load_at"] = time.time()
+                        state["last_load_seconds"] = round(time.monotonic() - started, 2)
+                        _loads.inc(backend=backend.base_url)
+                        logger.info(f"Ollama模型已加载: {self.model} @ {backend.root_url} "
+                                    f"({state['last_load_seconds']}秒)")
+                    running = await self._running_model(client, backend)
+
+            state["resident"] = bool(running)
+            state["expires_at"] = running.get("expires_at") if running else None
+            state["size_vram"] = running.get("size_vram") if running else None
+            state["error"] = None
+            _resident.set(1 if running else 0, backend=backend.base_url)
+        except Exception as e:
+            state["error"] = str(e)
+            logger.warning(f"Ollama模型保活失败 ({backend.root_url}): {str(e)}")
+
+    async def refresh_all(self, ping: bool = True):
+        await asyncio.gather(*(self.refresh(b, ping) for b in self.pool.backends))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        if self.preload:
+            logger.info(f"预加载Ollama模型: {self.model}")
+            await self.refresh_all(ping=True)
+        while True:
+            await asyncio.sleep(self.interval)
+            active = time.monotonic() - self.last_activity <= self.activity_window
+            await self.refresh_all(ping=active)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "keep_alive": self.keep_alive,
+            "interval": self.interval,
+            "activity_window": self.activity_window,
+            "idle_seconds": round(time.monotonic() - self.last_activity, 1),
+            "backends": [{"base_url": url, **state} for url, state in self._states.items()],
+        }
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多LLM后端负载均衡
+管理多个OpenAI兼容的后端（Ollama、llama.cpp server等）：按进行中请求数和观测到的延迟选择后端，
+后台探测健康状态并剔除不可用的后端；可选的对冲请求在首个后端超过其p95延迟时发往第二个后端
+"""
+
+import os
+import time
+import asyncio
+import logging
+import statistics
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+import httpx
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+_backend_requests = REGISTRY.counter(
+    "ququ_llm_backend_requests_total",
+    "LLM requests sent to each backend",
+    ("backend", "result"),
+)
+_hedged = REGISTRY.counter(
+    "ququ_llm_hedged_total",
+    "Hedged LLM requests and which copy won",
+    ("winner",),
+)
+
+
+def normalize_base_url(url: str) -> str:
+    """统一为以/v1结尾的OpenAI兼容地址"""
+    url = url.strip().rstrip("/")
+    if not url.endswith("/v1"):
+        url = url + "/v1"
+    return url
+
+
+def model_listed(model: str, names: Iterable[Optional[str]]) -> bool:
+    """模型是否在后端的模型列表中（未写标签时按:latest匹配）"""
+    names = set(names)
+    return model in names or (":" not in model and f"{model}:latest" in names)
+
+
+class LLMBackend:
+    """单个后端的状态：进行中请求数、延迟EWMA与最近延迟样本、健康状态"""
+
+    def __init__(self, base_url: str, latency_window: int = 100, api: Optional[str] = None):
+        self.base_url = normalize_base_url(base_url)
+        # 去掉/v1的根地址，Ollama原生接口（/api/chat）在其下
+        self.root_url = self.base_url[:-len("/v1")]
+        # native（Ollama /api/chat）、openai（/v1/chat/completions），None表示尚未确定
+        self.api = api
+        self.outstanding = 0
+        self.ewma: Optional[float] = None
+        self.latencies = deque(maxlen=latency_window)
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_probe: Optional[float] = None
+
+    def record(self, latency: float, ok: bool, alpha: float, failure_penalty: float = 0.0):
+        """
+        记录一次请求结果
+
+        失败的请求按不低于failure_penalty秒计入延迟EWMA（快速失败的后端不会因此显得更快），
+        但不计入用于对冲的延迟样本
+        """
+        if ok:
+            self.consecutive_failures = 0
+            self.latencies.append(latency)
+        else:
+            self.consecutive_failures += 1
+            latency = max(latency, failure_penalty)
+        self.ewma = latency if self.ewma is None else alpha * latency + (1 - alpha) * self.ewma
+
+    def p95(self, min_samples: int) -> Optional[float]:
+        if len(self.latencies) < min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def score(self, prior: float) -> float:
+        """(进行中请求数 + 1) × 延迟EWMA；还没有样本的后端使用prior（池中其他后端的中位数）"""
+        return (self.outstanding + 1) * (self.ewma if self.ewma is not None else prior)
+
+    def get_stats(self, min_samples: int) -> Dict[str, Any]:
+        p95 = self.p95(min_samples)
+        return {
+            "base_url": self.base_url,
+            "api": self.api,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "latency_ewma": round(self.ewma, 3) if self.ewma is not None else None,
+            "latency_p95": round(p95, 3) if p95 is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+        }
+
+
+class LLMBackendPool:
+    """
+    后端池
+
+    选择规则：只在健康后端中选择 (进行中请求数 + 1) × 延迟EWMA 最小的一个，失败请求按惩罚延迟计入EWMA；
+    还没有样本的后端按池中已有EWMA的中位数估计；全部不健康时退回到所有后端（避免因探测误判而完全不可用）。
+    """
+
+    def __init__(self, base_urls: List[str], probe_interval: Optional[float] = None,
+                 failure_threshold: Optional[int] = None, hedge: Optional[bool] = None,
+                 api: Optional[str] = None, model: Optional[str] = None,
+                 failure_penalty: Optional[float] = None):
+        """
+        Args:
+            base_urls: 后端地址列表
+            model: 使用的模型名称；给出时探测要求模型出现在后端的/v1/models列表中
+            api: 调用方式，native/openai/auto，默认读取OLLAMA_API（auto：先尝试Ollama原生接口，
+                 后端不支持时改用OpenAI兼容接口）
+            probe_interval: 健康探测间隔（秒，由health_monitor按此间隔调用probe_all），默认读取OLLAMA_PROBE_INTERVAL（10）
+            failure_threshold: 连续失败多少次后不等探测直接剔除，默认读取OLLAMA_FAILURE_THRESHOLD（3）
+            hedge: 是否启用对冲请求，默认读取OLLAMA_HEDGE（0）
+            failure_penalty: 失败请求计入延迟EWMA的最低延迟（秒），默认读取OLLAMA_FAILURE_PENALTY_S（10）
+        """
+        if not base_urls:
+            raise ValueError("至少需要一个LLM后端地址")
+        api = api or os.getenv("OLLAMA_API", "auto")
+        self.backends = [LLMBackend(url, api=None if api == "auto" else api) for url in base_urls]
+        self.probe_interval = probe_interval or float(os.getenv("OLLAMA_PROBE_INTERVAL", "10"))
+        self.failure_threshold = failure_threshold or int(os.getenv("OLLAMA_FAILURE_THRESHOLD", "3"))
+        self.failure_penalty = (failure_penalty if failure_penalty is not None
+                                else float(os.getenv("OLLAMA_FAILURE_PENALTY_S", "10")))
+        self.model = model
+        if hedge is None:
+            hedge = os.getenv("OLLAMA_HEDGE", "0") == "1"
+        self.hedge = hedge and len(self.backends) > 1
+        self.hedge_min_samples = int(os.getenv("OLLAMA_HEDGE_MIN_SAMPLES", "20"))
+        self.ewma_alpha = 0.2
+
+        REGISTRY.gauge("ququ_llm_backends_healthy", "Healthy LLM backends in the pool",
+                       function=lambda: sum(1 for b in self.backends if b.healthy))
+
+    def pick(self, exclude: Optional[List[LLMBackend]] = None) -> Optional[LLMBackend]:
+        """选择一个后端；exclude中的后端不参与选择，没有可选后端时返回None"""
+        exclude = exclude or []
+        candidates = [b for b in self.backends if b not in exclude]
+        healthy = [b for b in candidates if b.healthy]
+        if healthy:
+            candidates = healthy
+        elif exclude:
+            # 对冲请求只发往健康后端
+            return None
+        if not candidates:
+            return None
+        prior = self.prior_latency()
+        return min(candidates, key=lambda b: (b.score(prior), b.outstanding))
+
+    def prior_latency(self) -> float:
+        """还没有延迟样本的后端的估计延迟：已有EWMA的中位数，全部没有样本时为0"""
+        sampled = [b.ewma for b in self.backends if b.ewma is not None]
+        return statistics.median(sampled) if sampled else 0.0
+
+    def hedge_delay(self, backend: LLMBackend) -> Optional[float]:
+        """首个后端超过该时间仍未返回时发出对冲请求；样本不足或未启用时返回None"""
+        if not self.hedge:
+            return None
+        return backend.p95(self.hedge_min_samples)
+
+    def begin(self, backend: LLMBackend):
+        backend.outstanding += 1
+
+    def end(self, backend: LLMBackend, latency: float, ok: Optional[bool], error: Optional[str] = None):
+        """请求结束；ok为None表示请求被取消（如对冲中落败的一方），不计入延迟和失败"""
+        backend.outstanding -= 1
+        if ok is None:
+            return
+        backend.record(latency, ok, self.ewma_alpha, self.failure_penalty)
+        _backend_requests.inc(backend=backend.base_url, result="success" if ok else "error")
+        if not ok:
+            backend.last_error = error
+            if backend.healthy and backend.consecutive_failures >= self.failure_threshold:
+                backend.healthy = False
+                logger.warning(f"LLM后端连续失败 {backend.consecutive_failures} 次，暂时剔除: {backend.base_url}")
+
+    def record_hedge(self, winner: str):
+        _hedged.inc(winner=winner)
+
+    async def probe(self, backend: LLMBackend) -> Dict[str, Any]:
+        """探测单个后端（GET /models），更新健康状态并返回响应；配置了模型时要求模型在列表中"""
+        backend.last_probe = time.time()
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                response = await client.get(f"{backend.base_url}/models")
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+            models = response.json().get("data", [])
+            if self.model and not model_listed(self.model, (m.get("id") for m in models)):
+                raise RuntimeError(f"后端没有模型 {self.model}")
+            if not backend.healthy:
+                logger.info(f"LLM后端恢复: {backend.base_url}")
+            backend.healthy = True
+            backend.consecutive_failures = 0
+            return {"success": True, "models": models}
+        except Exception as e:
+            if backend.healthy:
+                logger.warning(f"LLM后端探测失败，暂时剔除: {backend.base_url} ({str(e)})")
+            backend.healthy = False
+            backend.last_error = str(e)
+            return {"success": False, "error": str(e)}
+
+    async def probe_all(self) -> List[Dict[str, Any]]:
+        return await asyncio.gather(*(self.probe(b) for b in self.backends))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "hedge": self.hedge,
+            "probe_interval": self.probe_interval,
+            "prior_latency": round(self.prior_latency(), 3),
+            "backends": [b.get_stats(self.hedge_min_samples) for b in self.backends],
+            "hedged": {winner: _hedged.get(winner=winner) for winner in ("primary", "hedge")},
+        }
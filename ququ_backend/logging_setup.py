@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+非阻塞结构化日志
+请求线程和事件循环只把日志记录放进内存队列（QueueHandler），由后台QueueListener线程写控制台和
+按大小轮转的日志文件；文件中每行一条JSON记录，带请求ID和通过extra传入的阶段耗时等字段。
+识别/优化文本经redact_text()按配置截断、哈希或隐藏；按请求采样INFO及以下级别的日志
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import hashlib
+import logging
+import contextvars
+import logging.handlers
+from typing import Any, Dict, Optional, TextIO
+
+# 当前请求ID（HTTP中间件设置；asyncio.to_thread和任务会复制上下文，推理线程中同样可读）
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# LogRecord自带的属性，其余属性视为通过extra传入的结构化字段
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def redact_text(text: Optional[str]) -> str:
+    """
+    按LOG_TEXT_MODE处理写入日志的识别/优化文本
+
+    - prefix（默认）：只保留前LOG_TEXT_PREFIX（20）个字符
+    - full：原样
+    - hash：长度和SHA-256前12位，可用于关联同一文本
+    - none：只记录长度
+    """
+    if not text:
+        return ""
+    mode = os.getenv("LOG_TEXT_MODE", "prefix")
+    if mode == "full":
+        return text
+    if mode == "hash":
+        return f"<{len(text)}字 sha256:{hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]}>"
+    if mode == "none":
+        return f"<{len(text)}字>"
+    limit = int(os.getenv("LOG_TEXT_PREFIX", "20"))
+    return text if len(text) <= limit else f"{text[:limit]}…<{len(text)}字>"
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    在产生日志的线程中附加请求ID，并按请求采样
+
+    采样以请求ID的哈希决定，同一请求的日志要么全部保留要么全部丢弃；
+    WARNING及以上级别和不属于任何请求的日志（启动、后台任务）始终保留。
+    """
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = request_id_var.get()
+        record.request_id = request_id
+        if self.sample_rate >= 1.0 or request_id is None or record.levelno >= logging.WARNING:
+            return True
+        bucket = int(hashlib.md5(request_id.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+        return bucket < self.sample_rate
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录一行JSON：时间、级别、logger、消息、请求ID，以及extra中的字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def per_process_log_file(log_file: str) -> str:
+    """
+    当前进程专用的日志文件路径（<名称>.<pid><扩展名>）
+
+    多个进程的RotatingFileHandler不能共用一个文件：各自按自己的计数轮转，会互相改名、覆盖对方的记录
+    """
+    root, ext = os.path.splitext(log_file)
+    return f"{root}.{os.getpid()}{ext}"
+
+
+def setup_logging(log_file: str, level: Optional[str] = None,
+                  console_stream: Optional[TextIO] = None) -> logging.handlers.QueueListener:
+    """
+    配置根logger：QueueHandler → 后台线程 → 控制台（文本）+ 轮转文件（JSON）
+
+    Args:
+        log_file: 日志文件路径
+        level: 日志级别，默认读取LOG_LEVEL（INFO）
+        console_stream: 控制台输出流，默认stdout（以stdin/stdout通信的worker进程应传stderr）
+
+    环境变量：
+        LOG_MAX_BYTES: 单个日志文件大小上限，默认50MB
+        LOG_BACKUP_COUNT: 保留的轮转文件数，默认5
+        LOG_CONSOLE_FORMAT: 控制台格式，text（默认）或json
+        LOG_SAMPLE_RATE: 按请求采样INFO及以下级别日志的比例，默认1（全部保留）
+    """
+    global _listener
+
+    if _listener is not None:
+        return _listener
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file,
+        maxBytes=int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+        backupCount=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    console_handler = logging.StreamHandler(console_stream or sys.stdout)
+    if os.getenv("LOG_CONSOLE_FORMAT", "text") == "json":
+        console_handler.setFormatter(JsonFormatter())
+    else:
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    # 无界队列：写日志永远不阻塞调用方
+    log_queue: queue.Queue = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter(float(os.getenv("LOG_SAMPLE_RATE", "1"))))
+
+    root = logging.getLogger()
+    root.setLevel(level or os.getenv("LOG_LEVEL", "INFO"))
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
+    _listener.start()
+    # 退出时把队列中剩余的记录写完
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按内存压力清理
+后台线程定期采样进程RSS、系统可用内存（MemAvailable）和torch CUDA分配器统计，
+只有越过水位线时才在后台执行清理：主机内存紧张时gc.collect()并把空闲堆内存还给系统，
+CUDA缓存中未使用的部分过大时torch.cuda.empty_cache()。转录请求路径上不再执行全量GC
+"""
+
+import os
+import sys
+import time
+import threading
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _read_rss_bytes() -> Optional[int]:
+    """当前进程的常驻内存（/proc/self/statm第二列 × 页大小）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _read_available_bytes() -> Optional[int]:
+    """系统可用内存（/proc/meminfo的MemAvailable）"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _cuda_stats() -> Optional[Dict[str, int]]:
+    """torch CUDA分配器统计；torch未导入（如ONNX后端）或没有GPU时返回None，不会触发torch导入"""
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return None
+    try:
+        if not torch.cuda.is_available():
+            return None
+        stats = torch.cuda.memory_stats()
+        return {
+            "allocated": torch.cuda.memory_allocated(),
+            "reserved": torch.cuda.memory_reserved(),
+            "alloc_retries": stats.get("num_alloc_retries", 0),
+            "ooms": stats.get("num_ooms", 0),
+        }
+    except Exception:
+        return None
+
+
+def _diff_mb(before: Optional[int], after: Optional[int]) -> Optional[float]:
+    if before is None or after is None:
+        return None
+    return round((before - after) / 1024 ** 2, 1)
+
+
+class MemoryManager:
+    """
+    内存采样与水位线触发的清理
+
+    水位线（MB，0表示不启用）：
+    - rss_high：进程RSS超过时清理主机内存
+    - available_low：系统可用内存低于时清理主机内存
+    - cuda_cached_high：CUDA已保留但未分配的缓存超过时释放缓存
+    同一类清理在cooldown秒内最多执行一次，避免持续高水位时反复GC。
+    """
+
+    def __init__(self, interval: Optional[float] = None, rss_high_mb: Optional[float] = None,
+                 available_low_mb: Optional[float] = None, cuda_cached_high_mb: Optional[float] = None,
+                 cooldown: Optional[float] = None):
+        """
+        Args:
+            interval: 采样间隔（秒），默认读取MEMORY_SAMPLE_INTERVAL（5）
+            rss_high_mb: 默认读取MEMORY_RSS_HIGH_MB（0，不启用）
+            available_low_mb: 默认读取MEMORY_AVAILABLE_LOW_MB（1024）
+            cuda_cached_high_mb: 默认读取MEMORY_CUDA_CACHED_HIGH_MB（1024）
+            cooldown: 两次清理的最小间隔（秒），默认读取MEMORY_CLEANUP_COOLDOWN（60）
+        """
+        self.interval = interval or float(os.getenv("MEMORY_SAMPLE_INTERVAL", "5"))
+        self.rss_high_mb = rss_high_mb if rss_high_mb is not None else float(os.getenv("MEMORY_RSS_HIGH_MB", "0"))
+        self.available_low_mb = (available_low_mb if available_low_mb is not None
+                                 else float(os.getenv("MEMORY_AVAILABLE_LOW_MB", "1024")))
+        self.cuda_cached_high_mb = (cuda_cached_high_mb if cuda_cached_high_mb is not None
+                                    else float(os.getenv("MEMORY_CUDA_CACHED_HIGH_MB", "1024")))
+        self.cooldown = cooldown if cooldown is not None else float(os.getenv("MEMORY_CLEANUP_COOLDOWN", "60"))
+
+        self._lock = threading.Lock()
+        self._sample: Dict[str, Any] = {}
+        self._last_cleanup = {"host": 0.0, "cuda": 0.0}
+        self._cleanups = {"host": 0, "cuda": 0}
+        self._last_cleanup_info: Optional[Dict[str, Any]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def sample(self) -> Dict[str, Any]:
+        """采样一次内存读数并保存"""
+        sample = {
+            "rss_bytes": _read_rss_bytes(),
+            "available_bytes": _read_available_bytes(),
+            "cuda": _cuda_stats(),
+            "sampled_at": time.time(),
+        }
+        with self._lock:
+            self._sample = sample
+        return sample
+
+    def _pressure(self, sample: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """判断各类清理是否需要执行，返回触发原因"""
+        mb = 1024 ** 2
+        host = None
+        rss = sample["rss_bytes"]
+        available = sample["available_bytes"]
+        if self.rss_high_mb > 0 and rss is not None and rss / mb > self.rss_high_mb:
+            host = f"RSS {rss / mb:.0f}MB > {self.rss_high_mb:.0f}MB"
+        elif self.available_low_mb > 0 and available is not None and available / mb < self.available_low_mb:
+            host = f"可用内存 {available / mb:.0f}MB < {self.available_low_mb:.0f}MB"
+
+        cuda = None
+        stats = sample["cuda"]
+        if self.cuda_cached_high_mb > 0 and stats is not None:
+            cached = (stats["reserved"] - stats["allocated"]) / mb
+            if cached > self.cuda_cached_high_mb:
+                cuda = f"CUDA缓存 {cached:.0f}MB > {self.cuda_cached_high_mb:.0f}MB"
+        return {"host": host, "cuda": cuda}
+
+    def release(self, host: bool = True, cuda: bool = True, reason: str = "manual") -> Dict[str, Any]:
+        """
+        执行清理
+
+        Args:
+            host: gc.collect()并调用malloc_trim把空闲堆内存还给系统
+            cuda: torch.cuda.empty_cache()释放分配器中未使用的缓存
+        """
+        before = self.sample()
+        started = time.monotonic()
+        collected = None
+        now = time.time()
+        if host:
+            import gc
+
+            collected = gc.collect()
+            try:
+                import ctypes
+
+                ctypes.CDLL("libc.so.6").malloc_trim(0)
+            except Exception:
+                pass
+            self._last_cleanup["host"] = now
+            self._cleanups["host"] += 1
+        if cuda:
+            torch = sys.modules.get("torch")
+            if torch is not None:
+                try:
+                    if torch.cuda.is_available():
+                        torch.cuda.empty_cache()
+                except Exception as e:
+                    logger.warning(f"释放CUDA缓存失败: {str(e)}")
+            self._last_cleanup["cuda"] = now
+            self._cleanups["cuda"] += 1
+
+        after = self.sample()
+        info = {
+            "reason": reason,
+            "host": host,
+            "cuda": cuda,
+            "at": now,
+            "seconds": round(time.monotonic() - started, 3),
+            "gc_collected": collected,
+            "rss_freed_mb": _diff_mb(before["rss_bytes"], after["rss_bytes"]),
+            "cuda_freed_mb": _diff_mb((before["cuda"] or {}).get("reserved"), (after["cuda"] or {}).get("reserved")),
+        }
+        with self._lock:
+            self._last_cleanup_info = info
+        return info
+
+    def check(self):
+        """采样并在越过水位线时清理（后台线程每个周期调用一次）"""
+        sample = self.sample()
+        pressure = self._pressure(sample)
+        now = time.time()
+        host = bool(pressure["host"]) and now - self._last_cleanup["host"] >= self.cooldown
+        cuda = bool(pressure["cuda"]) and now - self._last_cleanup["cuda"] >= self.cooldown
+        if not (host or cuda):
+            return
+        reason = "; ".join(r for r, run in ((pressure["host"], host), (pressure["cuda"], cuda)) if run)
+        info = self.release(host=host, cuda=cuda, reason=reason)
+        freed = f"释放RSS {info['rss_freed_mb']}MB"
+        if cuda:
+            freed += f"，CUDA缓存 {info['cuda_freed_mb']}MB"
+        logger.info(f"内存压力清理 ({reason})，耗时 {info['seconds']}秒，{freed}")
+
+    def start(self):
+        """启动后台采样线程"""
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.check()
+                except Exception as e:
+                    logger.warning(f"内存采样失败: {str(e)}")
+
+        self.sample()
+        self._thread = threading.Thread(target=run, name="memory-manager", daemon=True)
+        self._thread.start()
+        logger.info(f"内存压力清理已启用，采样间隔: {self.interval}秒")
+
+    def stop(self):
+        self._stop.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sample = dict(self._sample)
+            last_cleanup = self._last_cleanup_info
+        mb = 1024 ** 2
+        cuda = sample.get("cuda")
+        return {
+            "rss_mb": round(sample["rss_bytes"] / mb, 1) if sample.get("rss_bytes") is not None else None,
+            "available_mb": (round(sample["available_bytes"] / mb, 1)
+                             if sample.get("available_bytes") is not None else None),
+            "cuda": {
+                "allocated_mb": round(cuda["allocated"] / mb, 1),
+                "reserved_mb": round(cuda["reserved"] / mb, 1),
+                "alloc_retries": cuda["alloc_retries"],
+                "ooms": cuda["ooms"],
+            } if cuda else None,
+            "sampled_at": sample.get("sampled_at"),
+            "watermarks": {
+                "rss_high_mb": self.rss_high_mb,
+                "available_low_mb": self.available_low_mb,
+                "cuda_cached_high_mb": self.cuda_cached_high_mb,
+            },
+            "cleanups": dict(self._cleanups),
+            "last_cleanup": last_cleanup,
+        }
+
+
+# 进程内共享（主后端与CPU溢出后端在同一进程时只采样、清理一份）
+MEMORY_MANAGER = MemoryManager()
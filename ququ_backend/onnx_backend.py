@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ONNX Runtime CPU推理后端
+加载int8量化的Paraformer、FSMN-VAD和CT-Transformer（funasr_onnx），
+对外提供与funasr.AutoModel相同的generate()调用方式和返回格式，
+FunASRServer的推理流程无需区分后端
+"""
+
+import os
+import logging
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# ModelScope上自带model_quant.onnx的ONNX模型仓库
+ONNX_MODELS = {
+    "asr": "damo/speech_paraformer-large_asr_nat-zh-cn-16k-common-vocab8404-onnx",
+    "vad": "damo/speech_fsmn_vad_zh-cn-16k-common-onnx",
+    "punc": "damo/punc_ct-transformer_zh-cn-common-vocab272727-onnx",
+}
+
+MODEL_SAMPLE_RATE = 16000
+
+
+def _resolve_model_dir(name: str) -> str:
+    """模型目录：可用FUNASR_ONNX_{ASR,VAD,PUNC}_DIR指向本地已导出的目录，否则使用ModelScope仓库ID"""
+    return os.getenv(f"FUNASR_ONNX_{name.upper()}_DIR", ONNX_MODELS[name])
+
+
+def _prepare_audio(audio, fs: int):
+    """ONNX模型只接受16kHz音频：文件路径原样交给funasr_onnx读取，数组按需重采样"""
+    if isinstance(audio, (str, os.PathLike)):
+        return str(audio)
+    if fs != MODEL_SAMPLE_RATE:
+        import librosa
+
+        audio = librosa.resample(audio, orig_sr=fs, target_sr=MODEL_SAMPLE_RATE)
+    return audio
+
+
+class OnnxASRModel:
+    """Paraformer ONNX（int8）"""
+
+    def __init__(self, threads: int):
+        from funasr_onnx import Paraformer
+
+        self.model = Paraformer(
+            _resolve_model_dir("asr"),
+            batch_size=1,
+            quantize=True,
+            intra_op_num_threads=threads,
+        )
+
+    @staticmethod
+    def _result_text(result) -> str:
+        preds = result.get("preds", "") if isinstance(result, dict) else result
+        if isinstance(preds, (list, tuple)):
+            preds = preds[0] if preds else ""
+        return str(preds)
+
+    def generate(self, input, fs: int = MODEL_SAMPLE_RATE, **kwargs) -> List[Dict[str, Any]]:
+        # hotword/cache/batch_size_s等PyTorch后端参数在ONNX后端中忽略
+        if isinstance(input, list):
+            # 文件路径列表：批量识别，每个输入对应一条结果
+            results = self.model([_prepare_audio(item, fs) for item in input])
+            return [{"text": self._result_text(result)} for result in results]
+
+        results = self.model(_prepare_audio(input, fs))
+        if not results:
+            return [{"text": ""}]
+        return [{"text": self._result_text(results[0])}]
+
+
+class OnnxVADModel:
+    """FSMN-VAD ONNX（int8）"""
+
+    def __init__(self, threads: int):
+        from funasr_onnx import Fsmn_vad
+
+        self.model = Fsmn_vad(
+            _resolve_model_dir("vad"),
+            quantize=True,
+            intra_op_num_threads=threads,
+        )
+
+    def generate(self, input, fs: int = MODEL_SAMPLE_RATE, **kwargs) -> List[Dict[str, Any]]:
+        segments = self.model(_prepare_audio(input, fs))
+        # 与FunASR VAD输出一致：value为[[开始毫秒, 结束毫秒], ...]
+        return [{"key": "onnx", "value": segments[0] if segments else []}]
+
+
+class OnnxPuncModel:
+    """CT-Transformer标点模型 ONNX（int8）"""
+
+    def __init__(self, threads: int):
+        from funasr_onnx import CT_Transformer
+
+        self.model = CT_Transformer(
+            _resolve_model_dir("punc"),
+            quantize=True,
+            intra_op_num_threads=threads,
+        )
+
+    def generate(self, input, **kwargs) -> List[Dict[str, Any]]:
+        result = self.model(input)
+        text = result[0] if isinstance(result, (list, tuple)) else result
+        return [{"text": text}]
+
+
+ONNX_MODEL_CLASSES = {
+    "asr": OnnxASRModel,
+    "vad": OnnxVADModel,
+    "punc": OnnxPuncModel,
+}
+
+
+def load_onnx_model(name: str, threads: int):
+    """创建ONNX CPU模型"""
+    return ONNX_MODEL_CLASSES[name](threads)
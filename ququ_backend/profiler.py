@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行中服务的性能剖析
+- 采样剖析：后台线程按固定间隔读取所有线程的调用栈（sys._current_frames），输出折叠栈
+  （"线程;函数;函数 次数"，可直接交给flamegraph.pl或speedscope），不影响被采样的线程
+- 单请求剖析：带X-Profile: 1请求头（并通过认证）的请求在事件循环线程上用cProfile记录，
+  结果按请求ID保存，通过/debug/profile/requests/{request_id}查看
+两者都需要DEBUG_TOKEN；未配置DEBUG_TOKEN时调试接口不可用
+"""
+
+import io
+import os
+import sys
+import hmac
+import time
+import pstats
+import cProfile
+import threading
+import collections
+from typing import Dict, Optional
+
+MAX_PROFILE_SECONDS = 60.0
+
+
+def debug_token_valid(headers) -> Optional[bool]:
+    """
+    校验调试令牌：X-Debug-Token或Authorization: Bearer <token>请求头
+
+    不接受查询参数，令牌不会出现在访问日志、追踪和代理日志记录的URL中；按常数时间比较
+
+    Returns:
+        未配置DEBUG_TOKEN时返回None（调试接口关闭），否则返回是否匹配
+    """
+    expected = os.getenv("DEBUG_TOKEN")
+    if not expected:
+        return None
+    token = headers.get("x-debug-token")
+    authorization = headers.get("authorization", "")
+    if not token and authorization.lower().startswith("bearer "):
+        token = authorization[7:].strip()
+    if not token:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8"))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """全线程调用栈采样，同一时间只运行一个采样"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def sample(self, seconds: float, interval: float = 0.01) -> Dict[str, int]:
+        """
+        在调用线程中采样seconds秒（应在asyncio.to_thread中调用）
+
+        Returns:
+            折叠栈 -> 采样次数；采样正在进行时抛出RuntimeError
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("已有采样正在进行")
+        try:
+            seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+            own_ident = threading.get_ident()
+            counts: Dict[str, int] = collections.Counter()
+            end = time.monotonic() + seconds
+            while time.monotonic() < end:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f"thread-{ident}"))
+                    counts[";".join(reversed(stack))] += 1
+                time.sleep(interval)
+            return counts
+        finally:
+            self._lock.release()
+
+
+def render_collapsed(counts: Dict[str, int]) -> str:
+    """折叠栈文本，按采样次数降序"""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items(), key=lambda i: -i[1]))
+
+
+class RequestProfiler:
+    """
+    单请求cProfile
+
+    cProfile只记录启用它的线程，即事件循环线程：包括请求体（multipart）解析、JSON编解码、
+    热词处理等在事件循环上执行的代码；线程池中的推理不在其中（用采样剖析查看）。
+    同一时间只剖析一个请求，期间事件循环上其他请求的代码也会计入。
+    """
+
+    def __init__(self, keep: int = 20):
+        self._lock = threading.Lock()
+        self._results: "collections.OrderedDict[str, Dict]" = collections.OrderedDict()
+        self.keep = keep
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """开始剖析；已有请求在剖析时返回None"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 其他剖析工具已在运行
+            self._lock.release()
+            return None
+        return profile
+
+    def finish(self, request_id: str, path: str, profile: cProfile.Profile, started: float):
+        profile.disable()
+        self._lock.release()
+        self._results[request_id] = {
+            "path": path,
+            "seconds": round(time.monotonic() - started, 3),
+            "stats": pstats.Stats(profile),
+        }
+        while len(self._results) > self.keep:
+            self._results.popitem(last=False)
+
+    def report(self, request_id: str, sort: str = "cumulative", limit: int = 50) -> Optional[str]:
+        """pstats文本报告，请求ID不存在时返回None"""
+        result = self._results.get(request_id)
+        if result is None:
+            return None
+        out = io.StringIO()
+        out.write(f"{result['path']}  {result['seconds']}秒\n")
+        result["stats"].stream = out
+        result["stats"].sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def list(self) -> Dict[str, Dict]:
+        return {rid: {"path": r["path"], "seconds": r["seconds"]} for rid, r in self._results.items()}
+
+
+STACK_SAMPLER = StackSampler()
+REQUEST_PROFILER = RequestProfiler()
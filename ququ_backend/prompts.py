@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM提示词模板
+静态内容（系统提示词、规则、常见专有名词）在模块加载时拼好，每次请求逐字节相同并放在最前面；
+热词对照表、目标语言、识别文本等可变内容放在最后。Ollama和llama.cpp会复用相同前缀的KV缓存，
+短听写请求的prefill只需处理末尾的可变部分
+"""
+
+from typing import Dict, List, Optional
+
+# 常见专有名词
+COMMON_TERMS = "Gemma, Qwen, Qwen2.5, Qwen3, DeepSeek, ChatGPT, GPT, Claude, PyTorch, TensorFlow, Docker, Git, GitHub, Home Assistant"
+
+CORRECTION_SYSTEM = "你是专业的ASR文本纠错助手，严格按照用户要求纠正专有名词。"
+
+ASR_TRANSLATION_SYSTEM = "你是一个专业的翻译助手，擅长理解语音识别结果并准确翻译。特别擅长处理技术类专有名词。"
+
+TRANSLATION_SYSTEM = "你是一个专业的翻译助手，擅长各种语言之间的翻译。"
+
+# 各优化模式的静态前缀
+_CORRECTION_PREFIXES = {
+    "optimize": f"""请纠正文末语音识别结果中的专有名词错误，并删除口头语。
+
+规则：
+1. 如果专有名词对照表中有匹配项，必须使用对照表的正确形式
+2. 只修改明显错误的专有名词，不改变其他内容
+3. 删除"嗯"、"啊"、"那个"等口头语
+4. 保持原句的人称、语气和句式结构
+
+常见专有名词：{COMMON_TERMS}
+""",
+
+    "format": """请将文末的原文格式化为正式的书面语：
+1. 保持原意不变
+2. 使用恰当的标点符号
+3. 分段组织内容
+4. 使用规范的书面语表达
+
+请直接输出格式化后的文本。
+""",
+
+    "punctuate": """请为文末的原文添加合适的标点符号，使其更易读。
+
+请直接输出添加标点后的文本。
+""",
+}
+
+_ASR_TRANSLATION_PREFIX = """你的任务：理解文末语音识别结果的真实意图，并翻译成指定的目标语言。
+
+【重要背景】
+这段文本是语音识别的结果，可能包含错误：
+- 专有名词识别错误（如："deep sik" → "DeepSeek", "乾文二点五" → "Qwen2.5"）
+- 口头语和语气词（嗯、啊、那个等）
+- 发音相似导致的误识别
+
+【常见专有名词参考】
+AI模型: Gemma, Qwen, Qwen3, Qwen2.5, DeepSeek, ChatGPT, GPT, Claude, LLaMA
+技术工具: PyTorch, TensorFlow, CUDA, Ollama, Docker, Hugging Face
+社交平台: Facebook, Reddit, Twitter, YouTube, GitHub, LinkedIn
+
+【任务步骤】
+1. 理解句子真实含义和主题
+2. 识别并纠正专有名词的误识别
+3. 删除口头语和语气词
+4. 翻译成准确、地道的目标语言
+
+【要求】
+- 专有名词必须使用正确的英文形式
+- 保持原文的语气和风格
+- 使用地道的目标语言表达
+- 直接输出翻译结果，不要解释
+"""
+
+_TRANSLATION_PREFIX = """请将文末的原文翻译成指定的目标语言。
+
+要求：
+1. 准确翻译原文意思
+2. 保持原文的语气和风格
+3. 使用地道的目标语言表达
+4. 直接输出翻译结果，不要添加任何解释
+"""
+
+
+def correction_messages(text: str, mode: str = "optimize", custom_prompt: Optional[str] = None,
+                        hotwords_context: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    文本优化的消息列表
+
+    Args:
+        mode: 优化模式 (optimize/format/punctuate)，未知模式按optimize处理
+        custom_prompt: 自定义提示词，给出时替代模式模板
+        hotwords_context: 热词对照表（误识别 → 正确形式），放在静态前缀之后、识别文本之前
+    """
+    if custom_prompt:
+        prompt = f"{custom_prompt}\n\n原文：\n{text}"
+    else:
+        prefix = _CORRECTION_PREFIXES.get(mode, _CORRECTION_PREFIXES["optimize"])
+        hotwords_section = ""
+        if hotwords_context and mode not in ("format", "punctuate"):
+            hotwords_section = f"""
+【⚠️ 专有名词对照表 - 必须严格遵循】
+以下是确定的误识别→正确形式映射，请优先使用：
+{hotwords_context}
+"""
+        label = "文本：" if mode not in ("format", "punctuate") else "原文：\n"
+        prompt = f"{prefix}{hotwords_section}\n{label}{text}"
+
+    return [
+        {"role": "system", "content": CORRECTION_SYSTEM},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def asr_translation_messages(text: str, target_lang: str) -> List[Dict[str, str]]:
+    """ASR识别结果智能翻译（纠错+翻译）的消息列表"""
+    return [
+        {"role": "system", "content": ASR_TRANSLATION_SYSTEM},
+        {"role": "user", "content": f"{_ASR_TRANSLATION_PREFIX}\n【目标语言】{target_lang}\n\n【原文】\n{text}\n\n【{target_lang}翻译】"},
+    ]
+
+
+def translation_messages(text: str, source_lang: str, target_lang: str) -> List[Dict[str, str]]:
+    """普通文本翻译的消息列表"""
+    return [
+        {"role": "system", "content": TRANSLATION_SYSTEM},
+        {"role": "user", "content": f"{_TRANSLATION_PREFIX}\n源语言：{source_lang}\n目标语言：{target_lang}\n\n原文：{text}\n\n翻译："},
+    ]
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按截止时间规划请求
+客户端通过X-Deadline-Ms头或deadline_ms参数给出延迟预算，规划器根据实测的各阶段耗时估计总耗时，
+超出预算时依次去掉可选阶段（LLM优化、标点恢复、短音频的VAD）；LLM超时由剩余预算决定，
+响应中返回被跳过的阶段
+"""
+
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from metrics import REGISTRY
+
+# 各阶段耗时的初始估计：vad/asr/punc为每秒音频的耗时，overhead（排队、解码、进程间通信）和llm为每次请求的耗时
+PRIORS = {
+    "vad": 0.01,
+    "asr": 0.05,
+    "punc": 0.005,
+    "overhead": 0.05,
+    "llm": 2.0,
+}
+PER_AUDIO_SECOND = ("vad", "asr", "punc")
+
+_skipped = REGISTRY.counter(
+    "ququ_planner_skipped_stages_total",
+    "Optional stages skipped to meet a request deadline",
+    ("stage",),
+)
+
+
+class RequestPlan:
+    """单个请求的执行计划"""
+
+    def __init__(self, planner: "RequestPlanner", deadline_ms: Optional[int], duration: float,
+                 use_vad: bool, use_punc: bool, use_llm: bool):
+        self.planner = planner
+        self.started = time.monotonic()
+        self.deadline_ms = deadline_ms
+        self.deadline = self.started + deadline_ms / 1000.0 if deadline_ms else None
+        self.duration = duration
+        self.use_vad = use_vad
+        self.use_punc = use_punc
+        self.use_llm = use_llm
+        self.skipped_stages: List[str] = []
+
+    def remaining(self) -> Optional[float]:
+        """剩余预算（秒），没有截止时间时返回None"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def skip(self, stage: str):
+        setattr(self, f"use_{stage}", False)
+        self.skipped_stages.append(stage)
+        _skipped.inc(stage=stage)
+
+    def allow_llm(self) -> bool:
+        """ASR完成后再确认一次剩余预算是否还够一次LLM调用，不够时跳过"""
+        if not self.use_llm:
+            return False
+        remaining = self.remaining()
+        if remaining is not None and remaining - self.planner.safety_margin < self.planner.estimate("llm", 0.0):
+            self.skip("llm")
+            return False
+        return True
+
+    def llm_timeout(self) -> Optional[float]:
+        """LLM调用（含排队）的超时时间，取剩余预算减去安全余量"""
+        remaining = self.remaining()
+        if remaining is None:
+            return None
+        return max(remaining - self.planner.safety_margin, 0.0)
+
+    def annotate(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """给有截止时间的请求的响应加上规划信息（返回副本，合并请求共享的结果对象不受影响）"""
+        result = dict(result)
+        if self.deadline is not None:
+            result["deadline_ms"] = self.deadline_ms
+            result["elapsed_ms"] = round((time.monotonic() - self.started) * 1000)
+            result["skipped_stages"] = list(self.skipped_stages)
+        return result
+
+
+class RequestPlanner:
+    """
+    根据实测阶段耗时规划请求
+
+    每个阶段的耗时用EWMA跟踪：ASR类阶段按每秒音频的耗时，LLM按每次调用的耗时。
+    """
+
+    def __init__(self, alpha: float = 0.2):
+        """
+        Args:
+            alpha: EWMA平滑系数
+        """
+        self.alpha = alpha
+        self.safety_margin = float(os.getenv("PLANNER_SAFETY_MS", "100")) / 1000.0
+        # 超过该时长的音频不跳过VAD（长音频需要VAD切分）
+        self.vad_skip_max_seconds = float(os.getenv("PLANNER_VAD_SKIP_MAX_S", "30"))
+        self._estimates = dict(PRIORS)
+        self._samples = {stage: 0 for stage in PRIORS}
+
+    def _observe(self, stage: str, value: float):
+        if self._samples[stage] == 0:
+            self._estimates[stage] = value
+        else:
+            self._estimates[stage] = self.alpha * value + (1 - self.alpha) * self._estimates[stage]
+        self._samples[stage] += 1
+
+    def observe_asr(self, duration: float, timings: Dict[str, float], wall_seconds: float):
+        """
+        记录一次转录的阶段耗时
+
+        Args:
+            duration: 音频时长（秒）
+            timings: 转录结果中的timings（vad/asr/punc，秒）
+            wall_seconds: 服务端观察到的总耗时，与各阶段之和的差记为overhead
+        """
+        if duration <= 0 or not timings:
+            return
+        for stage in PER_AUDIO_SECOND:
+            if stage in timings:
+                self._observe(stage, timings[stage] / duration)
+        self._observe("overhead", max(wall_seconds - sum(timings.values()), 0.0))
+
+    def observe_llm(self, seconds: float):
+        self._observe("llm", seconds)
+
+    def estimate(self, stage: str, duration: float) -> float:
+        if stage in PER_AUDIO_SECOND:
+            return self._estimates[stage] * duration
+        return self._estimates[stage]
+
+    def plan(self, deadline_ms: Optional[int], duration: float, use_vad: bool = True,
+             use_punc: bool = True, use_llm: bool = False) -> RequestPlan:
+        """
+        生成执行计划
+
+        预计耗时超过预算时按LLM、标点、VAD的顺序跳过可选阶段；ASR本身不可跳过，
+        只剩ASR仍超出预算时照常执行。
+
+        Args:
+            deadline_ms: 延迟预算（毫秒），None表示不限制
+            duration: 音频时长（秒），未知时传0
+        """
+        plan = RequestPlan(self, deadline_ms, duration, use_vad, use_punc, use_llm)
+        if plan.deadline is None:
+            return plan
+
+        budget = deadline_ms / 1000.0 - self.safety_margin
+
+        def total() -> float:
+            cost = self.estimate("overhead", duration) + self.estimate("asr", duration)
+            if plan.use_vad:
+                cost += self.estimate("vad", duration)
+            if plan.use_punc:
+                cost += self.estimate("punc", duration)
+            if plan.use_llm:
+                cost += self.estimate("llm", duration)
+            return cost
+
+        if plan.use_llm and total() > budget:
+            plan.skip("llm")
+        if plan.use_punc and total() > budget:
+            plan.skip("punc")
+        if plan.use_vad and duration <= self.vad_skip_max_seconds and total() > budget:
+            plan.skip("vad")
+        return plan
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "estimates": {stage: round(value, 4) for stage, value in self._estimates.items()},
+            "samples": dict(self._samples),
+            "safety_margin": self.safety_margin,
+            "skipped": {stage: _skipped.get(stage=stage) for stage in ("llm", "punc", "vad")},
+        }
@@ -8,14 +8,22 @@ QuQu Backend Server
 import os
 import sys
 import logging
+import signal
+import subprocess
 import tempfile
+import threading
+import time
 import asyncio
+import shutil
+import uuid
+import functools
+import contextvars
 from pathlib import Path
-from typing import Optional
-from contextlib import asynccontextmanager
+from typing import Optional, List
+from contextlib import asynccontextmanager, contextmanager
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request, Query
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
@@ -23,67 +31,206 @@ import json as json_module
 
 # 导入自定义模块
 from funasr_gpu import FunASRServer
+from worker_client import FunASRWorkerClient
+from backend_router import OverflowRouter
 from llm_client import OllamaClient
 from hotwords_with_variants import format_hotwords_for_llm
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler("/tmp/ququ_backend.log", encoding="utf-8")
-    ]
-)
+from audio_io import wav_bytes_to_pcm, is_wav_bytes, estimate_duration, pcm_bytes_to_array, PCM_FORMATS
+from asr_sessions import SessionManager
+from job_store import JobStore
+from job_scheduler import JobScheduler
+from metrics import REGISTRY, Counter, Gauge, Histogram
+from singleflight import SingleFlight, audio_fingerprint, options_key
+from request_planner import RequestPlanner, RequestPlan
+from health_monitor import HealthMonitor
+from logging_setup import setup_logging, per_process_log_file, request_id_var, redact_text
+from tracing import TRACER, span, parse_traceparent
+from profiler import STACK_SAMPLER, REQUEST_PROFILER, debug_token_valid, render_collapsed
+from sse_store import StreamStore, StreamJob
+from cancellation import CancelToken, use_token, record_cancelled
+
+# 配置日志：经队列由后台线程写控制台和轮转的JSON日志文件
+# 多worker时主进程和每个uvicorn worker都会导入本模块，各自写带pid后缀的文件
+_log_file = os.getenv("LOG_FILE", "/tmp/ququ_backend.log")
+if int(os.getenv("SERVER_WORKERS", "1")) > 1:
+    _log_file = per_process_log_file(_log_file)
+setup_logging(_log_file)
 logger = logging.getLogger(__name__)
 
 # 全局变量
+# 单进程模式为进程内的FunASRServer；分离部署模式为连接模型宿主的FunASRWorkerClient（接口相同）
 funasr_server: Optional[FunASRServer] = None
 ollama_client: Optional[OllamaClient] = None
+# CPU溢出后端（ONNX int8）及路由，FUNASR_CPU_OVERFLOW=1时启用
+cpu_funasr_server: Optional[FunASRServer] = None
+asr_router: Optional[OverflowRouter] = None
+# 相同音频+选项的并发转录只执行一次
+asr_singleflight = SingleFlight("asr")
+# 根据实测阶段耗时为带截止时间的请求选择要执行的阶段
+request_planner = RequestPlanner()
+# 依赖健康状态由后台任务定期检查，/api/status只读取最近一次结果
+health_monitor = HealthMonitor()
+# 流式接口的任务与事件，断线后可按Last-Event-ID续传
+stream_store = StreamStore()
+# 分块上传的转录会话
+asr_sessions: Optional[SessionManager] = None
+# 批量转录任务（SQLite持久化）及后台调度
+job_store: Optional[JobStore] = None
+job_scheduler: Optional[JobScheduler] = None
 
 # 热词缓存
 _hotwords_cache: Optional[str] = None
 _hotwords_file_mtime: float = 0
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """应用生命周期管理"""
-    global funasr_server, ollama_client
-
-    # 启动时初始化
-    logger.info("🚀 启动QuQu Backend Server...")
+# 后台初始化状态（/api/health 返回），重量级依赖和模型在后台任务中加载
+_startup_state = {
+    "stage": "starting",  # starting/connecting_model_host/initializing_models/ready/failed
+    "started_at": time.time(),
+    "finished_at": None,
+    "error": None,
+}
+_init_task: Optional[asyncio.Task] = None
+
+# 超过该时长（秒）的音频在流式接口中分窗口处理，并逐窗口推送asr_partial事件
+LONG_AUDIO_THRESHOLD_S = float(os.getenv("LONG_AUDIO_THRESHOLD_S", "120"))
+# 非流式接口处理期间检查客户端是否已断开的间隔（秒）
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+
+
+def _set_startup_stage(stage: str, error: Optional[str] = None):
+    _startup_state["stage"] = stage
+    if stage in ("ready", "failed"):
+        _startup_state["finished_at"] = time.time()
+    if error:
+        _startup_state["error"] = error
+
+
+def get_initialization_progress() -> dict:
+    """初始化进度快照（不访问外部服务，不阻塞）"""
+    progress = dict(_startup_state)
+    end = progress["finished_at"] or time.time()
+    progress["elapsed"] = round(end - progress["started_at"], 2)
+    if isinstance(funasr_server, FunASRServer):
+        progress["funasr"] = funasr_server.get_init_progress()
+    elif funasr_server is not None:
+        progress["funasr"] = {"model_host": True, "connected": not funasr_server.closed,
+                              "reconnects": funasr_server.reconnects, "init_result": funasr_server.init_result}
+    return progress
+
+
+async def _initialize_in_background():
+    """后台初始化：连接模型宿主或加载模型，然后检查Ollama"""
+    global funasr_server
 
-    # 初始化FunASR
-    logger.info("初始化FunASR GPU服务...")
-    funasr_server = FunASRServer()
-    init_result = funasr_server.initialize()
+    model_host_socket = os.getenv("MODEL_HOST_SOCKET")
+    try:
+        if model_host_socket:
+            # 分离部署模式：模型只在模型宿主进程中加载一份，本worker通过本地IPC调用
+            _set_startup_stage("connecting_model_host")
+            logger.info(f"分离部署模式，连接模型宿主: {model_host_socket}")
+            connect_timeout = float(os.getenv("MODEL_HOST_CONNECT_TIMEOUT", "60"))
+            client = await asyncio.to_thread(
+                FunASRWorkerClient.connect, model_host_socket, connect_timeout
+            )
+            funasr_server = client
+            init_result = await asyncio.to_thread(client.wait_ready)
+        else:
+            _set_startup_stage("initializing_models")
+            logger.info("初始化FunASR GPU服务...")
+            init_result = await asyncio.to_thread(funasr_server.initialize)
+    except Exception as e:
+        init_result = {"success": False, "error": str(e)}
 
     if init_result["success"]:
+        _set_startup_stage("ready")
         logger.info(f"✅ FunASR初始化成功: {init_result['message']}")
     else:
+        # 不退出进程，允许后续再次初始化
+        _set_startup_stage("failed", init_result.get("error"))
         logger.error(f"❌ FunASR初始化失败: {init_result.get('error')}")
-        # 不阻塞启动，允许后续再次初始化
+
+    if cpu_funasr_server is not None:
+        logger.info("初始化CPU溢出后端 (ONNX int8)...")
+        cpu_result = await asyncio.to_thread(cpu_funasr_server.initialize)
+        if cpu_result["success"]:
+            logger.info("✅ CPU溢出后端就绪")
+        else:
+            logger.warning(f"⚠️ CPU溢出后端初始化失败，仅使用主后端: {cpu_result.get('error')}")
+
+    # 初始化完成后立即刷新FunASR状态，不等下一个检查周期
+    await health_monitor.check_now("funasr")
+    await health_monitor.check_now("funasr_stats")
+
+    # 检查Ollama健康状态
+    health = await health_monitor.check_now("ollama")
+    if health["success"]:
+        logger.info(f"✅ Ollama服务可用: {ollama_client.base_url}")
+    else:
+        logger.warning(f"⚠️ Ollama服务不可用: {health.get('error')}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期管理
+
+    只创建轻量对象并启动后台初始化任务，端口立即开始监听；
+    初始化完成前 /api/health 返回初始化进度，ASR接口返回503。
+    """
+    global funasr_server, ollama_client, cpu_funasr_server, asr_router, asr_sessions, _init_task
+    global job_store, job_scheduler
+
+    # 启动时初始化
+    logger.info("🚀 启动QuQu Backend Server...")
+
+    if not os.getenv("MODEL_HOST_SOCKET"):
+        funasr_server = FunASRServer()
+
+        # GPU被Ollama占满时，把溢出请求分流到CPU上的ONNX int8模型
+        if os.getenv("FUNASR_CPU_OVERFLOW", "0") == "1" and funasr_server.backend != "onnx":
+            cpu_funasr_server = FunASRServer(backend="onnx")
+            asr_router = OverflowRouter(
+                funasr_server,
+                cpu_funasr_server,
+                primary_max_inflight=int(os.getenv("FUNASR_GPU_MAX_INFLIGHT", "2")),
+                overflow_max_inflight=int(os.getenv("FUNASR_CPU_MAX_INFLIGHT", "1")),
+            )
 
     # 初始化Ollama客户端
     logger.info("初始化Ollama客户端...")
     ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://192.168.100.38:11434")
     ollama_model = os.getenv("OLLAMA_MODEL", "gpt-oss:20b")
     ollama_client = OllamaClient(base_url=ollama_base_url, model=ollama_model)
+    ollama_client.keepalive.start()
 
-    # 检查Ollama健康状态
-    health = await ollama_client.check_health()
-    if health["success"]:
-        logger.info(f"✅ Ollama服务可用: {ollama_base_url}")
-    else:
-        logger.warning(f"⚠️ Ollama服务不可用: {health.get('error')}")
+    # Ollama后端池的健康探测也由健康检查驱动（按OLLAMA_PROBE_INTERVAL），失败的后端在此恢复
+    health_monitor.register("ollama", ollama_client.check_health, interval=ollama_client.pool.probe_interval)
+    health_monitor.register("funasr", _check_funasr_status)
+    health_monitor.register("funasr_stats", _collect_funasr_stats)
+    health_monitor.start()
+
+    asr_sessions = SessionManager(lambda: asr_router if asr_router is not None else funasr_server)
+
+    job_store = JobStore()
+    job_scheduler = JobScheduler(job_store, lambda: asr_router if asr_router is not None else funasr_server)
+    job_scheduler.start()
 
-    logger.info("✨ QuQu Backend Server启动完成")
+    _init_task = asyncio.create_task(_initialize_in_background())
+
+    logger.info(f"✨ QuQu Backend Server已开始监听，启动耗时: {time.time() - _startup_state['started_at']:.2f}秒，模型在后台初始化")
 
     yield
 
     # 关闭时清理
     logger.info("🛑 关闭QuQu Backend Server...")
+    await stream_store.stop()
+    await job_scheduler.stop()
+    job_store.close()
+    await health_monitor.stop()
+    await ollama_client.keepalive.stop()
+    if isinstance(funasr_server, FunASRWorkerClient):
+        funasr_server.close()
 
 
 # 创建FastAPI应用
@@ -104,6 +251,87 @@ app.add_middleware(
 )
 
 
+async def _finish_profile_after_body(body_iterator, request_id, path, profile, started):
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        REQUEST_PROFILER.finish(request_id, path, profile, started)
+
+
+@app.middleware("http")
+async def profile_middleware(request: Request, call_next):
+    """带X-Profile: 1和有效调试令牌的请求用cProfile记录，结果见/debug/profile/requests/{请求ID}"""
+    if request.headers.get("x-profile") != "1" or not debug_token_valid(request.headers):
+        return await call_next(request)
+
+    profile = REQUEST_PROFILER.start()
+    if profile is None:
+        response = await call_next(request)
+        response.headers["X-Profile"] = "busy"
+        return response
+
+    request_id = request_id_var.get()
+    started = time.monotonic()
+    try:
+        response = await call_next(request)
+    except BaseException:
+        REQUEST_PROFILER.finish(request_id, request.url.path, profile, started)
+        raise
+    response.headers["X-Profile"] = f"/debug/profile/requests/{request_id}"
+    # 剖析结果只保存在处理该请求的worker进程中
+    response.headers["X-Worker-PID"] = str(os.getpid())
+    response.body_iterator = _finish_profile_after_body(
+        response.body_iterator, request_id, request.url.path, profile, started
+    )
+    return response
+
+
+# 不追踪的路径（探活、监控和调试接口）
+UNTRACED_PATHS = ("/api/health", "/api/ready", "/api/status", "/api/metrics", "/debug/")
+
+
+async def _finish_trace_after_body(body_iterator, root):
+    """响应体（包括SSE流）发送完毕后才结束根span"""
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        TRACER.end_root(root)
+
+
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """
+    为每个请求设置请求ID（沿用客户端的X-Request-ID），写入日志记录并在响应头中返回；
+    除探活/监控接口外，每个请求开始一个追踪（沿用客户端traceparent中的trace id）
+    """
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    token = request_id_var.set(request_id)
+    root = None
+    if not request.url.path.startswith(UNTRACED_PATHS):
+        root = TRACER.start_root(f"{request.method} {request.url.path}",
+                                 parent=parse_traceparent(request.headers.get("traceparent")),
+                                 request_id=request_id)
+    try:
+        response = await call_next(request)
+    except BaseException as e:
+        if root is not None:
+            root.error(f"{type(e).__name__}: {e}")
+            TRACER.end_root(root)
+        raise
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    if root is not None:
+        root.set(status_code=response.status_code)
+        if response.status_code >= 500:
+            root.status = "error"
+        response.headers["X-Trace-ID"] = root.trace_id
+        response.body_iterator = _finish_trace_after_body(response.body_iterator, root)
+    return response
+
+
 # ==================== 辅助函数 ====================
 
 def load_hotwords() -> str:
@@ -171,6 +399,364 @@ def merge_hotwords(user_hotwords: str = "") -> str:
     return all_hotwords
 
 
+@contextmanager
+def prepared_audio(content: bytes, filename: str, decode_in_memory: bool = True):
+    """
+    把上传的音频转换为转录输入
+
+    PCM编码的WAV直接在内存中解码为数组，不落盘；其他格式（mp3、m4a等）
+    仍需写入临时文件交给FunASR解码。
+
+    Args:
+        decode_in_memory: 为False时一律写入临时文件（长音频分窗口读取，不整体解码）
+
+    Yields:
+        (audio, options): 音频路径或float32数组，以及需要合并进转录选项的参数
+    """
+    with span("audio.decode", size=len(content)):
+        decoded = wav_bytes_to_pcm(content) if decode_in_memory else None
+    if decoded is not None:
+        samples, sample_rate = decoded
+        yield samples, {"sample_rate": sample_rate}
+        return
+
+    temp_dir = tempfile.mkdtemp()
+    temp_audio_path = Path(temp_dir) / (Path(filename or "audio").name or "audio")
+    try:
+        with open(temp_audio_path, "wb") as f:
+            f.write(content)
+        yield str(temp_audio_path), {}
+    finally:
+        # 清理临时文件
+        try:
+            temp_audio_path.unlink()
+            Path(temp_dir).rmdir()
+        except Exception as cleanup_error:
+            logger.warning(f"清理临时文件失败: {str(cleanup_error)}")
+
+
+def share_audio(audio_input):
+    """
+    为合并执行准备一份独立的音频
+
+    文件输入在新的临时目录中建立硬链接（跨文件系统时复制），执行结束后由合并执行删除，
+    发起请求的处理函数提前清理自己的临时文件（如客户端断开）不影响等待同一结果的其他请求。
+
+    Returns:
+        (音频, 释放函数)；内存中的数组原样返回，释放函数为None
+    """
+    if not isinstance(audio_input, (str, os.PathLike)):
+        return audio_input, None
+
+    temp_dir = tempfile.mkdtemp()
+    owned = Path(temp_dir) / Path(audio_input).name
+    try:
+        os.link(audio_input, owned)
+    except OSError:
+        shutil.copyfile(audio_input, owned)
+
+    def release():
+        try:
+            owned.unlink()
+            Path(temp_dir).rmdir()
+        except Exception as cleanup_error:
+            logger.warning(f"清理临时文件失败: {str(cleanup_error)}")
+
+    return str(owned), release
+
+
+async def run_transcription(audio_input, options: dict) -> dict:
+    """
+    在线程中执行转录，避免阻塞事件循环
+
+    单进程模式下推理由FunASRServer内部的调度器串行化；分离部署模式下只是等待模型宿主的响应。
+    启用CPU溢出后端时由路由策略选择后端。
+    """
+    backend = asr_router if asr_router is not None else funasr_server
+    # 同步HTTP接口默认为交互优先级，长音频和批量任务由调用方显式降级
+    options = {"priority": "interactive", **options}
+
+    # 客户端重试或同一段音频同时调用多个接口时，正在进行的相同转录只执行一次
+    fingerprint = await asyncio.to_thread(audio_fingerprint, audio_input)
+    key = f"{fingerprint}:{options_key(options)}"
+    audio_input, release = share_audio(audio_input)
+
+    async def transcribe():
+        started = time.monotonic()
+        with span("asr.transcribe", priority=options["priority"]):
+            result = await asyncio.to_thread(backend.transcribe_audio, audio_input, options)
+        if result.get("success"):
+            request_planner.observe_asr(
+                result.get("duration") or 0.0, result.get("timings") or {}, time.monotonic() - started
+            )
+        return result
+
+    return await asr_singleflight.do(key, transcribe, release)
+
+
+def cancel_on_disconnect(endpoint):
+    """
+    端点装饰器：客户端在收到响应前断开（或超时放弃）时取消端点协程
+
+    取消经合并执行和取消令牌传到排队中的推理（不再占用GPU）和进行中的LLM请求（连接被中断）。
+    端点须有Request类型的参数。
+    """
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        request = next(value for value in kwargs.values() if isinstance(value, Request))
+        # 先读完请求体（原始PCM接口在端点中读取，表单和JSON已由FastAPI读完），
+        # 之后轮询is_disconnected()不会读走请求体
+        try:
+            await request.body()
+        except RuntimeError:
+            pass
+
+        work = asyncio.ensure_future(endpoint(*args, **kwargs))
+        try:
+            while True:
+                done, _ = await asyncio.wait({work}, timeout=DISCONNECT_POLL_INTERVAL)
+                if done:
+                    return work.result()
+                if await request.is_disconnected():
+                    break
+        except asyncio.CancelledError:
+            work.cancel()
+            raise
+
+        work.cancel()
+        await asyncio.wait({work})
+        record_cancelled("request")
+        logger.info(f"客户端已断开，取消请求: {request.url.path}")
+        # 客户端已不在，该响应不会被读取
+        raise HTTPException(status_code=499, detail="客户端已断开连接")
+
+    return wrapper
+
+
+def request_deadline_ms(request: Request, deadline_ms: Optional[int] = None) -> Optional[int]:
+    """延迟预算（毫秒）：表单/查询参数deadline_ms优先，其次X-Deadline-Ms请求头；未给出时返回None"""
+    if deadline_ms is None:
+        header = request.headers.get("x-deadline-ms")
+        if not header:
+            return None
+        try:
+            deadline_ms = int(header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"无效的X-Deadline-Ms: {header}")
+    if deadline_ms <= 0:
+        raise HTTPException(status_code=400, detail="deadline_ms必须为正数")
+    return deadline_ms
+
+
+async def read_pcm_body(request: Request, sample_rate: Optional[int] = None,
+                        audio_format: Optional[str] = None, channels: Optional[int] = None):
+    """
+    把请求体（原始PCM）直接包装为float32数组，不经过multipart解析和临时文件
+
+    采样率、格式、声道数取自查询参数，缺省时取请求头X-Sample-Rate、X-Audio-Format、X-Channels，
+    再缺省为16000/s16le/1。请求体以RIFF/WAVE文件头开始时按WAV在内存中解码，无法解码时返回400
+    （不会把文件头当作PCM采样点解析）。
+
+    Returns:
+        (float32数组, 采样率)
+    """
+    data = await request.body()
+    if not data:
+        raise HTTPException(status_code=400, detail="请求体为空")
+
+    if is_wav_bytes(data):
+        decoded = wav_bytes_to_pcm(data)
+        if decoded is None:
+            raise HTTPException(
+                status_code=400,
+                detail="无法解码的WAV：支持16/32位PCM，浮点、8/24位等编码需要安装soundfile；"
+                       "也可以改为发送原始PCM或用multipart上传",
+            )
+        return decoded
+
+    try:
+        sample_rate = sample_rate or int(request.headers.get("X-Sample-Rate", "16000"))
+        channels = channels or int(request.headers.get("X-Channels", "1"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Sample-Rate/X-Channels必须为整数")
+    audio_format = audio_format or request.headers.get("X-Audio-Format", "s16le")
+
+    if audio_format not in PCM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的PCM格式: {audio_format}")
+    if sample_rate <= 0 or channels <= 0:
+        raise HTTPException(status_code=400, detail="采样率和声道数必须为正数")
+
+    return pcm_bytes_to_array(data, audio_format, channels), sample_rate
+
+
+async def optimize_recognized_text(recognized_text: str, optimize_mode: str, merged_hotwords: str,
+                                   plan: Optional[RequestPlan] = None) -> str:
+    """LLM优化识别文本；LLM成功就用LLM结果，失败（或剩余预算不足）就用ASR原文"""
+    if optimize_mode == "none":
+        return recognized_text
+    if plan is not None and not plan.allow_llm():
+        logger.info("剩余延迟预算不足，跳过LLM优化")
+        return recognized_text
+
+    # 格式化热词为LLM易读的格式（包含常见误识别变体）
+    hotwords_list = merged_hotwords.split() if merged_hotwords else []
+    hotwords_formatted = format_hotwords_for_llm(hotwords_list, max_words=50)
+
+    started = time.monotonic()
+    llm_result = await ollama_client.optimize_text(
+        text=recognized_text,
+        mode=optimize_mode,
+        hotwords_context=hotwords_formatted if hotwords_formatted else None,
+        timeout=plan.llm_timeout() if plan is not None else None,
+        single_utterance=True,
+    )
+
+    if llm_result["success"]:
+        llm_seconds = time.monotonic() - started
+        request_planner.observe_llm(llm_seconds)
+        optimized_text = llm_result["optimized_text"]
+        logger.info(f"文本优化成功，原文长度: {len(recognized_text)}, 优化后长度: {len(optimized_text)}",
+                    extra={"timings": {"llm": round(llm_seconds, 4)}})
+        return optimized_text
+
+    if plan is not None and llm_result.get("type") == "deadline":
+        plan.skip("llm")
+    logger.warning(f"文本优化失败，使用原始识别文本: {llm_result.get('error')}")
+    return recognized_text
+
+
+def is_long_audio(content: bytes, requested: bool = False) -> bool:
+    """客户端显式要求，或从文件头读出的时长超过阈值时按长音频处理"""
+    if requested:
+        return True
+    duration = estimate_duration(content)
+    return duration is not None and duration >= LONG_AUDIO_THRESHOLD_S
+
+
+async def iterate_in_thread(make_iterator):
+    """
+    在线程中消费同步生成器，逐项异步产出，不阻塞事件循环
+
+    消费方提前停止（任务被取消或生成器被关闭）时取消线程中的令牌，生成器在下一次申请推理执行权时结束
+    """
+    loop = asyncio.get_running_loop()
+    items: asyncio.Queue = asyncio.Queue()
+    finished = object()
+    token = CancelToken()
+
+    def produce():
+        try:
+            with use_token(token):
+                for item in make_iterator():
+                    loop.call_soon_threadsafe(items.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(items.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(items.put_nowait, finished)
+
+    # 复制上下文：请求ID和追踪span在线程中同样可用
+    producer = loop.run_in_executor(None, contextvars.copy_context().run, produce)
+    try:
+        while True:
+            item = await items.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    except (asyncio.CancelledError, GeneratorExit):
+        token.cancel("abandoned")
+        raise
+    await producer
+
+
+async def transcribe_with_progress(audio_input, options: dict, long_mode: bool):
+    """
+    转录并逐步产出事件
+
+    长音频分窗口处理，每个窗口完成后产出asr_partial事件（带进度百分比）；
+    最后产出{"stage": "asr_result", "result": 转录结果}，由调用方决定如何输出。
+    """
+    if not long_mode:
+        result = await run_transcription(audio_input, options)
+        yield {"stage": "asr_result", "result": result}
+        return
+
+    backend = asr_router if asr_router is not None else funasr_server
+    options = {"priority": "normal", **options}
+    async for event in iterate_in_thread(lambda: backend.transcribe_long_audio(audio_input, options)):
+        if event.get("event") == "partial":
+            yield {
+                "stage": "asr_partial",
+                "text": event["text"],
+                "start": event["start"],
+                "end": event["end"],
+                "progress": event["progress"],
+                "timestamp": asyncio.get_event_loop().time(),
+            }
+        else:
+            result = {k: v for k, v in event.items() if k not in ("event", "done")}
+            yield {"stage": "asr_result", "result": result}
+
+
+def _memory_metrics(memory):
+    """模型进程的内存读数（memory_manager采样）转换为Prometheus指标"""
+    mb = 1024 ** 2
+    host = Gauge("ququ_memory_bytes", "Memory readings of the model process", ("kind",))
+    if memory.get("rss_mb") is not None:
+        host.set(memory["rss_mb"] * mb, kind="rss")
+    if memory.get("available_mb") is not None:
+        host.set(memory["available_mb"] * mb, kind="system_available")
+    cuda = Gauge("ququ_cuda_memory_bytes", "torch CUDA caching allocator memory", ("kind",))
+    if memory.get("cuda"):
+        cuda.set(memory["cuda"]["allocated_mb"] * mb, kind="allocated")
+        cuda.set(memory["cuda"]["reserved_mb"] * mb, kind="reserved")
+    cleanups = Counter("ququ_memory_cleanups_total", "Memory cleanups run by the memory manager", ("kind",))
+    for kind, count in memory.get("cleanups", {}).items():
+        cleanups.inc(count, kind=kind)
+    return [host, cuda, cleanups]
+
+
+def _collect_scheduler_metrics():
+    """从各推理后端（可能在模型宿主进程中）取回调度器和内存统计，转换为Prometheus指标"""
+    wait_histogram = None
+    queue_depth = Gauge("ququ_inference_queue_depth", "Requests waiting for the model inference slot",
+                        ("backend", "priority"))
+    cancelled = Counter("ququ_inference_cancelled_total",
+                        "Inference requests dropped from the queue because the request was cancelled",
+                        ("backend", "priority"))
+    memory_metrics = []
+
+    for label, backend in (("primary", funasr_server), ("cpu", cpu_funasr_server)):
+        if backend is None or not backend.initialized:
+            continue
+        stats = backend.get_performance_stats()
+        # CPU溢出后端与主后端在同一进程，内存读数相同，只取主后端的
+        if label == "primary" and stats.get("memory"):
+            memory_metrics = _memory_metrics(stats["memory"])
+        scheduler = stats.get("scheduler")
+        if not scheduler:
+            continue
+        for priority, count in scheduler["waiting"].items():
+            queue_depth.set(count, backend=label, priority=priority)
+        for priority, count in scheduler.get("cancelled", {}).items():
+            cancelled.inc(count, backend=label, priority=priority)
+        if wait_histogram is None:
+            wait_histogram = Histogram.from_dict(
+                "ququ_inference_queue_wait_seconds",
+                "Time spent waiting for the model inference slot, per priority class",
+                scheduler["wait_histogram"],
+                backend=label,
+            )
+        else:
+            wait_histogram.merge_dict(scheduler["wait_histogram"], backend=label)
+
+    return [m for m in (wait_histogram, queue_depth, cancelled) if m is not None] + memory_metrics
+
+
+REGISTRY.register_collector(_collect_scheduler_metrics)
+
+
 # ==================== 数据模型 ====================
 
 class TranscriptionOptions(BaseModel):
@@ -180,6 +766,16 @@ class TranscriptionOptions(BaseModel):
     hotword: str = ""
 
 
+class SessionCreateRequest(BaseModel):
+    """创建分块上传转录会话的请求"""
+    sample_rate: int = 16000
+    format: str = "s16le"  # s16le/s32le/f32le
+    channels: int = 1
+    use_vad: bool = True
+    use_punc: bool = True
+    hotword: str = ""
+
+
 class OptimizeRequest(BaseModel):
     """文本优化请求"""
     text: str
@@ -205,6 +801,9 @@ async def root():
         "status": "running",
         "endpoints": {
             "asr_transcribe": "/api/asr/transcribe",
+            "asr_sessions": "/api/asr/sessions",
+            "jobs": "/api/jobs",
+            "asr_transcribe_pcm": "/api/asr/transcribe-pcm",
             "asr_transcribe_and_optimize": "/api/asr/transcribe-and-optimize",
             "asr_transcribe_and_optimize_stream": "/api/asr/transcribe-and-optimize-stream",
             "asr_transcribe_and_translate": "/api/asr/transcribe-and-translate",
@@ -212,53 +811,74 @@ async def root():
             "llm_optimize": "/api/llm/optimize",
             "llm_translate": "/api/llm/translate",
             "status": "/api/status",
+            "ready": "/api/ready",
+            "metrics": "/api/metrics",
             "docs": "/docs"
         }
     }
 
 
+def _check_funasr_status():
+    """FunASR状态（分离部署模式下为对模型宿主的进程间调用，在线程中执行）"""
+    if not funasr_server:
+        return {"success": False, "error": "FunASR未初始化"}
+    return funasr_server.check_status()
+
+
+def _collect_funasr_stats():
+    if not funasr_server:
+        return {"success": False, "error": "FunASR未初始化"}
+    return {"success": True, "stats": funasr_server.get_performance_stats()}
+
+
 @app.get("/api/status")
 async def get_status():
-    """获取服务状态"""
-    global funasr_server, ollama_client
+    """
+    获取服务状态
 
-    # 检查FunASR状态
-    funasr_status = {}
-    if funasr_server:
-        funasr_status = funasr_server.check_status()
-    else:
-        funasr_status = {"success": False, "error": "FunASR未初始化"}
+    依赖状态来自后台健康检查的最近一次结果，health中给出每项检查的时间（age_seconds）；
+    本接口不访问Ollama、模型宿主等外部服务。
+    """
+    status = {
+        "success": True,
+        "funasr": health_monitor.snapshot("funasr"),
+        "ollama": health_monitor.snapshot("ollama"),
+        # CUDA可用性由模型进程（分离部署时为模型宿主）在状态查询中给出，API进程不导入torch
+        "gpu_available": health_monitor.snapshot("funasr").get("gpu", {}).get("available", False),
+        "performance_stats": health_monitor.snapshot("funasr_stats").get("stats", {}),
+        "health": health_monitor.get_stats(),
+    }
 
-    # 检查Ollama状态
-    ollama_status = {}
-    if ollama_client:
-        ollama_status = await ollama_client.check_health()
-    else:
-        ollama_status = {"success": False, "error": "Ollama客户端未初始化"}
+    if asr_router is not None:
+        status["routing"] = asr_router.get_stats()
+        status["cpu_backend"] = cpu_funasr_server.get_performance_stats()
 
-    # 获取GPU状态
-    gpu_available = False
-    try:
-        import torch
-        gpu_available = torch.cuda.is_available()
-    except:
-        pass
+    if job_scheduler is not None:
+        status["jobs"] = job_scheduler.get_stats()
 
-    return {
-        "success": True,
-        "funasr": funasr_status,
-        "ollama": ollama_status,
-        "gpu_available": gpu_available,
-        "performance_stats": funasr_server.get_performance_stats() if funasr_server else {}
+    status["singleflight"] = {
+        "asr": asr_singleflight.get_stats(),
+        "llm": ollama_client._singleflight.get_stats() if ollama_client else {},
     }
+    status["llm_governor"] = ollama_client.governor.get_stats() if ollama_client else {}
+    status["llm_pool"] = ollama_client.pool.get_stats() if ollama_client else {}
+    status["llm_model"] = ollama_client.keepalive.get_stats() if ollama_client else {}
+    status["planner"] = request_planner.get_stats()
+    status["tracing"] = TRACER.get_stats()
+    status["streams"] = stream_store.get_stats()
+
+    return status
 
 
 @app.post("/api/asr/transcribe")
+@cancel_on_disconnect
 async def transcribe_audio(
+    request: Request,
     audio: UploadFile = File(..., description="音频文件"),
     use_vad: bool = Form(True, description="是否使用VAD"),
     use_punc: bool = Form(True, description="是否添加标点"),
-    hotword: str = Form("", description="热词（空格分隔，自动加载hotwords.txt）")
+    hotword: str = Form("", description="热词（空格分隔，自动加载hotwords.txt）"),
+    deadline_ms: Optional[int] = Form(None, description="延迟预算（毫秒），也可用X-Deadline-Ms头")
 ):
     """
     语音识别接口
@@ -268,63 +888,502 @@ async def transcribe_audio(
         use_vad: 是否使用VAD（语音活动检测）
         use_punc: 是否添加标点符号
         hotword: 热词，用空格分隔
+        deadline_ms: 延迟预算，预计超时时跳过标点、短音频的VAD
 
     Returns:
-        识别结果
+        识别结果（有延迟预算时附带skipped_stages）
     """
     global funasr_server
 
     if not funasr_server or not funasr_server.initialized:
         raise HTTPException(status_code=503, detail="FunASR服务未就绪，请稍后重试")
 
-    # 保存临时音频文件
-    temp_dir = tempfile.mkdtemp()
-    temp_audio_path = Path(temp_dir) / audio.filename
+    deadline = request_deadline_ms(request, deadline_ms)
 
     try:
-        # 写入音频文件
         content = await audio.read()
-        with open(temp_audio_path, "wb") as f:
-            f.write(content)
 
         logger.info(f"收到转录请求: {audio.filename}, 大小: {len(content)} bytes")
 
+        plan = request_planner.plan(deadline, estimate_duration(content) or 0.0, use_vad, use_punc)
+
         # 执行转录
         # 合并系统热词和用户热词
         merged_hotwords = merge_hotwords(hotword)
 
         options = {
-            "use_vad": use_vad,
-            "use_punc": use_punc,
+            "use_vad": plan.use_vad,
+            "use_punc": plan.use_punc,
             "hotword": merged_hotwords
         }
 
         logger.info(f"使用热词数: {len(merged_hotwords.split()) if merged_hotwords else 0}")
 
-        result = funasr_server.transcribe_audio(str(temp_audio_path), options)
+        with prepared_audio(content, audio.filename) as (audio_input, audio_options):
+            result = await run_transcription(audio_input, {**options, **audio_options})
 
         if result["success"]:
-            logger.info(f"转录成功: {result['text'][:100]}...")
-            return JSONResponse(content=result)
+            logger.info(f"转录成功: {redact_text(result['text'])}",
+                        extra={"audio_duration": result.get("duration"), "timings": result.get("timings")})
+            return JSONResponse(content=plan.annotate(result))
         else:
             logger.error(f"转录失败: {result.get('error')}")
             raise HTTPException(status_code=500, detail=result.get("error", "转录失败"))
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"转录请求处理失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-    finally:
-        # 清理临时文件
+
+@app.post("/api/asr/transcribe-pcm")
+@cancel_on_disconnect
+async def transcribe_pcm(
+    request: Request,
+    sample_rate: Optional[int] = Query(None, description="采样率，缺省取X-Sample-Rate头或16000"),
+    audio_format: Optional[str] = Query(None, alias="format", description="s16le/s32le/f32le，缺省取X-Audio-Format头"),
+    channels: Optional[int] = Query(None, description="声道数，缺省取X-Channels头或1"),
+    use_vad: bool = Query(True),
+    use_punc: bool = Query(True),
+    hotword: str = Query(""),
+    deadline_ms: Optional[int] = Query(None, description="延迟预算（毫秒），也可用X-Deadline-Ms头")
+):
+    """
+    原始PCM语音识别接口
+
+    请求体为application/octet-stream原始PCM（或完整WAV），直接在内存中转换为数组，
+    跳过multipart解析和临时文件，适合已在内存中持有16kHz单声道PCM的嵌入式客户端。
+
+    示例：
+        curl -X POST "http://host:8000/api/asr/transcribe-pcm?sample_rate=16000&format=s16le" \\
+             -H "Content-Type: application/octet-stream" --data-binary @audio.pcm
+    """
+    if not funasr_server or not funasr_server.initialized:
+        raise HTTPException(status_code=503, detail="FunASR服务未就绪，请稍后重试")
+
+    deadline = request_deadline_ms(request, deadline_ms)
+    samples, sample_rate = await read_pcm_body(request, sample_rate, audio_format, channels)
+    logger.info(f"收到PCM转录请求: {len(samples) / sample_rate:.2f}秒, 采样率: {sample_rate}")
+
+    plan = request_planner.plan(deadline, len(samples) / sample_rate, use_vad, use_punc)
+    options = {
+        "use_vad": plan.use_vad,
+        "use_punc": plan.use_punc,
+        "hotword": merge_hotwords(hotword),
+        "sample_rate": sample_rate,
+    }
+
+    try:
+        result = await run_transcription(samples, options)
+    except Exception as e:
+        logger.error(f"PCM转录请求处理失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not result["success"]:
+        logger.error(f"转录失败: {result.get('error')}")
+        raise HTTPException(status_code=500, detail=result.get("error", "转录失败"))
+
+    return JSONResponse(content=plan.annotate(result))
+
+
+@app.post("/api/asr/transcribe-and-optimize-pcm")
+@cancel_on_disconnect
+async def transcribe_and_optimize_pcm(
+    request: Request,
+    sample_rate: Optional[int] = Query(None),
+    audio_format: Optional[str] = Query(None, alias="format"),
+    channels: Optional[int] = Query(None),
+    use_vad: bool = Query(True),
+    use_punc: bool = Query(True),
+    hotword: str = Query(""),
+    optimize_mode: str = Query("optimize", description="优化模式"),
+    deadline_ms: Optional[int] = Query(None, description="延迟预算（毫秒），也可用X-Deadline-Ms头")
+):
+    """原始PCM一体化接口：语音识别 + 文本优化，参数同 /api/asr/transcribe-pcm"""
+    if not funasr_server or not funasr_server.initialized:
+        raise HTTPException(status_code=503, detail="FunASR服务未就绪")
+
+    if not ollama_client:
+        raise HTTPException(status_code=503, detail="Ollama客户端未初始化")
+
+    deadline = request_deadline_ms(request, deadline_ms)
+    samples, sample_rate = await read_pcm_body(request, sample_rate, audio_format, channels)
+    merged_hotwords = merge_hotwords(hotword)
+    plan = request_planner.plan(deadline, len(samples) / sample_rate, use_vad, use_punc,
+                                use_llm=optimize_mode != "none")
+
+    try:
+        asr_result = await run_transcription(samples, {
+            "use_vad": plan.use_vad,
+            "use_punc": plan.use_punc,
+            "hotword": merged_hotwords,
+            "sample_rate": sample_rate,
+        })
+        if not asr_result["success"]:
+            raise HTTPException(status_code=500, detail=asr_result.get("error", "转录失败"))
+
+        recognized_text = asr_result["text"]
+        optimized_text = await optimize_recognized_text(recognized_text, optimize_mode, merged_hotwords, plan)
+
+        return JSONResponse(content=plan.annotate({
+            "success": True,
+            "asr_result": asr_result,
+            "recognized_text": recognized_text,
+            "optimized_text": optimized_text,
+            "optimize_mode": optimize_mode
+        }))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"PCM一体化请求处理失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"  # 禁用nginx缓冲
+}
+
+
+def _sse_response(job: StreamJob, after: int = 0, resumed: bool = False) -> StreamingResponse:
+    """订阅流式任务的SSE响应，X-Stream-Job-ID返回任务ID"""
+    return StreamingResponse(
+        stream_store.subscribe(job, after, resumed),
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "X-Stream-Job-ID": job.job_id}
+    )
+
+
+def _resume_stream(request: Request) -> Optional[StreamingResponse]:
+    """请求带Last-Event-ID且对应任务仍在保存期内时，返回接回该任务的响应；否则返回None"""
+    resolved = stream_store.resolve(request.headers.get("last-event-id"))
+    if resolved is None:
+        return None
+    job, after = resolved
+    return _sse_response(job, after, resumed=True)
+
+
+@app.get("/api/asr/streams/{job_id}")
+async def resume_stream(
+    job_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Query(None, description="已收到的最后事件ID（<job_id>:<序号>或序号），也可用Last-Event-ID请求头")
+):
+    """
+    按任务ID重新连接流式接口（transcribe-stream、transcribe-and-optimize-stream、
+    transcribe-and-translate-stream），补发已收到的事件之后的事件并继续接收，
+    不需要重新上传音频；任务完成后在SSE_STREAM_TTL秒内仍可取回全部事件
+    """
+    job = stream_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"流式任务不存在或已过期: {job_id}")
+
+    last = request.headers.get("last-event-id") or last_event_id or "0"
+    try:
+        after = int(last.rpartition(":")[2] or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无效的事件ID: {last}")
+    return _sse_response(job, after, resumed=True)
+
+
+@app.post("/api/asr/transcribe-stream")
+async def transcribe_audio_stream(
+    request: Request,
+    audio: UploadFile = File(..., description="音频文件"),
+    use_vad: bool = Form(True),
+    use_punc: bool = Form(True),
+    hotword: str = Form(""),
+    long_audio: bool = Form(False, description="按长音频分窗口处理（超过阈值时自动启用）")
+):
+    """
+    流式语音识别接口（SSE），适合会议录音等长音频
+
+    长音频按窗口解码，每个窗口完成后立即推送asr_partial（text、start、end、progress），
+    最后推送asr_complete和done；短音频直接推送asr_complete。
+    """
+    global funasr_server
+
+    # 断线重连：带Last-Event-ID且任务仍在保存期内时接回原任务，不重新处理音频
+    resumed = _resume_stream(request)
+    if resumed is not None:
+        return resumed
+
+    if not funasr_server or not funasr_server.initialized:
+        raise HTTPException(status_code=503, detail="FunASR服务未就绪")
+
+    audio_content = await audio.read()
+    audio_filename = audio.filename
+    long_mode = is_long_audio(audio_content, long_audio)
+
+    async def generate_stream():
+        """生成流式响应"""
         try:
-            temp_audio_path.unlink()
-            Path(temp_dir).rmdir()
-        except:
-            pass
+            logger.info(f"收到流式转录请求: {audio_filename}, 长音频模式: {long_mode}")
+
+            yield f"data: {json_module.dumps({'stage': 'start', 'message': '开始处理音频', 'long_audio': long_mode, 'timestamp': asyncio.get_event_loop().time()}, ensure_ascii=False)}\n\n"
+
+            options = {
+                "use_vad": use_vad,
+                "use_punc": use_punc,
+                "hotword": merge_hotwords(hotword)
+            }
+
+            with prepared_audio(audio_content, audio_filename, decode_in_memory=not long_mode) as (audio_input, audio_options):
+                async for event in transcribe_with_progress(audio_input, {**options, **audio_options}, long_mode):
+                    if event["stage"] == "asr_result":
+                        asr_result = event["result"]
+                    else:
+                        yield f"data: {json_module.dumps(event, ensure_ascii=False)}\n\n"
+
+            if not asr_result["success"]:
+                yield f"data: {json_module.dumps({'stage': 'error', 'error': asr_result.get('error', '转录失败')}, ensure_ascii=False)}\n\n"
+                return
+
+            yield f"data: {json_module.dumps({'stage': 'asr_complete', 'text': asr_result['text'], 'duration': asr_result.get('duration', 0), 'timestamp': asyncio.get_event_loop().time()}, ensure_ascii=False)}\n\n"
+            yield f"data: {json_module.dumps({'stage': 'done', 'message': '处理完成', 'asr_text': asr_result['text'], 'timings': asr_result.get('timings', {}), 'timestamp': asyncio.get_event_loop().time()}, ensure_ascii=False)}\n\n"
+
+        except Exception as e:
+            logger.error(f"流式转录失败: {str(e)}")
+            yield f"data: {json_module.dumps({'stage': 'error', 'error': str(e)}, ensure_ascii=False)}\n\n"
+
+    return _sse_response(stream_store.start(generate_stream()))
+
+
+# ==================== 分块上传转录会话 ====================
+
+# 会话操作失败类型对应的HTTP状态码
+_SESSION_ERROR_STATUS = {
+    "not_found": 404,
+    "session_limit": 429,
+    "session_closed": 409,
+    "session_failed": 500,
+    "buffer_full": 503,
+    "worker_disconnected": 503,
+    "timeout": 504,
+}
+
+
+async def _session_command(op: str, **params) -> dict:
+    """
+    执行会话操作，失败时抛出对应状态码的HTTPException
+
+    分离部署模式下会话保存在模型宿主中（各worker共享），单进程模式下保存在本进程。
+    """
+    if isinstance(funasr_server, FunASRWorkerClient):
+        result = await asyncio.to_thread(funasr_server.session_command, op, **params)
+    elif asr_sessions is not None:
+        result = await asr_sessions.handle(op, **params)
+    else:
+        raise HTTPException(status_code=503, detail="FunASR服务未就绪，请稍后重试")
+
+    if not result.get("success"):
+        status = _SESSION_ERROR_STATUS.get(result.get("type"), 500)
+        raise HTTPException(status_code=status, detail=result.get("error", "会话操作失败"))
+    return result
+
+
+@app.post("/api/asr/sessions")
+async def create_session(request: Optional[SessionCreateRequest] = None):
+    """
+    打开转录会话
+
+    客户端录音时不断调用 /api/asr/sessions/{id}/chunks 上传原始PCM分块，
+    服务器在后台对已结束的语音段解码；结束录音后调用finalize获取完整结果。
+    """
+    if not funasr_server or not funasr_server.initialized:
+        raise HTTPException(status_code=503, detail="FunASR服务未就绪，请稍后重试")
+
+    request = request or SessionCreateRequest()
+    if request.format not in PCM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的PCM格式: {request.format}")
+
+    result = await _session_command(
+        "create",
+        sample_rate=request.sample_rate,
+        fmt=request.format,
+        channels=request.channels,
+        options={
+            "use_vad": request.use_vad,
+            "use_punc": request.use_punc,
+            "hotword": merge_hotwords(request.hotword),
+            "priority": "interactive",
+        },
+    )
+    return {"success": True, "session_id": result["session_id"], "ttl": result["ttl"]}
+
+
+@app.post("/api/asr/sessions/{session_id}/chunks")
+async def append_session_chunk(session_id: str, request: Request):
+    """追加一个音频分块（请求体为原始PCM，格式在创建会话时指定）"""
+    data = await request.body()
+    if not data:
+        raise HTTPException(status_code=400, detail="音频分块为空")
+    return await _session_command("append", session_id=session_id, data=data)
+
+
+@app.get("/api/asr/sessions/{session_id}")
+async def get_session(session_id: str):
+    """查询会话进度和已解码的部分文本"""
+    return await _session_command("status", session_id=session_id)
+
+
+@app.post("/api/asr/sessions/{session_id}/finalize")
+async def finalize_session(session_id: str):
+    """结束录音：解码剩余音频并返回完整转录结果"""
+    try:
+        result = await _session_command("finalize", session_id=session_id)
+    except HTTPException as e:
+        if e.status_code >= 500:
+            logger.error(f"会话转录失败: {e.detail}")
+        raise
+
+    logger.info(f"会话 {session_id} 完成: {result['duration']:.1f}秒音频, "
+                f"结束后耗时 {result['finalize_latency']:.3f}秒")
+    return JSONResponse(content=result)
+
+
+@app.delete("/api/asr/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """放弃会话"""
+    return await _session_command("delete", session_id=session_id)
+
+
+# ==================== 批量转录任务 ====================
+
+def _allowed_job_path(path: str) -> Optional[str]:
+    """服务器本地路径只允许位于JOB_PATH_ROOTS（逗号分隔）之下，未配置时不接受路径"""
+    roots = [r.strip() for r in os.getenv("JOB_PATH_ROOTS", "").split(",") if r.strip()]
+    resolved = os.path.realpath(path)
+    for root in roots:
+        root = os.path.realpath(root)
+        if resolved == root or resolved.startswith(root + os.sep):
+            return resolved if os.path.isfile(resolved) else None
+    return None
+
+
+@app.post("/api/jobs")
+async def create_job(
+    files: Optional[List[UploadFile]] = File(None, description="音频文件（可多个）"),
+    paths: str = Form("", description="服务器本地音频路径，逗号或换行分隔（需位于JOB_PATH_ROOTS下）"),
+    use_vad: bool = Form(True),
+    use_punc: bool = Form(True),
+    hotword: str = Form("")
+):
+    """
+    提交批量转录任务，立即返回任务ID
+
+    文件在后台排队、按批次在GPU上转录，状态保存在SQLite中，服务重启后继续处理。
+    通过 GET /api/jobs/{job_id} 轮询，或 GET /api/jobs/{job_id}/events 以SSE接收逐个文件的结果。
+    """
+    job_id = job_store.new_job_id()
+    job_files = []
+
+    for raw_path in paths.replace("\n", ",").split(","):
+        raw_path = raw_path.strip()
+        if not raw_path:
+            continue
+        resolved = _allowed_job_path(raw_path)
+        if resolved is None:
+            raise HTTPException(status_code=400, detail=f"路径不存在或不在允许的目录中: {raw_path}")
+        job_files.append({"name": raw_path, "path": resolved, "owned": False})
+
+    if files:
+        file_dir = job_store.file_dir(job_id)
+        for idx, upload in enumerate(files):
+            name = Path(upload.filename or "audio").name or "audio"
+            target = Path(file_dir) / f"{idx:05d}_{name}"
+            # 直接从multipart的临时文件复制，不把整个文件读入内存
+            with open(target, "wb") as f:
+                await asyncio.to_thread(shutil.copyfileobj, upload.file, f)
+            job_files.append({"name": name, "path": str(target), "owned": True})
+
+    if not job_files:
+        raise HTTPException(status_code=400, detail="请上传音频文件或提供音频路径")
+
+    options = {"use_vad": use_vad, "use_punc": use_punc, "hotword": merge_hotwords(hotword),
+               "priority": "batch"}
+    await asyncio.to_thread(job_store.create_job, job_id, job_files, options)
+    job_scheduler.wake()
+
+    logger.info(f"创建批量任务: {job_id}, 文件数: {len(job_files)}")
+    return {"success": True, "job_id": job_id, "files": len(job_files)}
+
+
+@app.get("/api/jobs")
+async def list_jobs(limit: int = Query(50, ge=1, le=500)):
+    """最近的批量任务"""
+    return {"success": True, "jobs": await asyncio.to_thread(job_store.list_jobs, limit)}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """任务状态和每个文件的结果"""
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return {"success": True, **job}
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    以SSE推送任务进度
+
+    每个文件结束时推送file_complete（含结果或错误），全部结束后推送job_complete。
+    """
+    if await asyncio.to_thread(job_store.get_job, job_id, False) is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+
+    async def generate_stream():
+        sent = set()
+        while True:
+            job = await asyncio.to_thread(job_store.get_job, job_id)
+            if job is None:
+                yield f"data: {json_module.dumps({'stage': 'error', 'error': '任务已删除'}, ensure_ascii=False)}\n\n"
+                return
+
+            for f in job["files"]:
+                if f["index"] not in sent and f["status"] in ("done", "failed", "cancelled"):
+                    sent.add(f["index"])
+                    yield f"data: {json_module.dumps({'stage': 'file_complete', 'job_id': job_id, **f}, ensure_ascii=False)}\n\n"
+
+            if job["status"] in ("completed", "cancelled"):
+                yield f"data: {json_module.dumps({'stage': 'job_complete', 'job_id': job_id, 'status': job['status'], 'counts': job['counts']}, ensure_ascii=False)}\n\n"
+                return
+
+            yield f"data: {json_module.dumps({'stage': 'progress', 'job_id': job_id, 'status': job['status'], 'counts': job['counts']}, ensure_ascii=False)}\n\n"
+            await job_scheduler.wait_for_update(timeout=5.0)
+
+    return StreamingResponse(
+        generate_stream(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str, purge: bool = Query(False, description="同时删除任务记录和上传的文件")):
+    """取消任务中尚未开始的文件；purge=true时删除已结束任务的记录和文件"""
+    job = await asyncio.to_thread(job_store.get_job, job_id, False)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+
+    cancelled = await asyncio.to_thread(job_store.cancel_job, job_id)
+    if purge:
+        job = await asyncio.to_thread(job_store.get_job, job_id, False)
+        if job["counts"]["running"]:
+            raise HTTPException(status_code=409, detail="任务仍有文件在处理中，稍后再删除")
+        await asyncio.to_thread(job_store.delete_job, job_id)
+
+    return {"success": True, "job_id": job_id, "cancelled": cancelled, "purged": purge}
 
 
 @app.post("/api/llm/optimize")
-async def optimize_text(request: OptimizeRequest):
+@cancel_on_disconnect
+async def optimize_text(request: OptimizeRequest, http_request: Request):
     """
     文本优化接口
 
@@ -352,11 +1411,14 @@ async def optimize_text(request: OptimizeRequest):
         return JSONResponse(content=result)
     else:
         logger.error(f"文本优化失败: {result.get('error')}")
-        raise HTTPException(status_code=500, detail=result.get("error", "文本优化失败"))
+        # LLM排队超时/队列已满时返回503，客户端可稍后重试
+        status_code = 503 if result.get("type") == "llm_busy" else 500
+        raise HTTPException(status_code=status_code, detail=result.get("error", "文本优化失败"))
 
 
 @app.post("/api/llm/translate")
-async def translate_text(request: TranslateRequest):
+@cancel_on_disconnect
+async def translate_text(request: TranslateRequest, http_request: Request):
     """
     文本翻译接口
 
@@ -392,16 +1454,21 @@ async def translate_text(request: TranslateRequest):
         return JSONResponse(content=result)
     else:
         logger.error(f"翻译失败: {result.get('error')}")
-        raise HTTPException(status_code=500, detail=result.get("error", "翻译失败"))
+        # LLM排队超时/队列已满时返回503，客户端可稍后重试
+        status_code = 503 if result.get("type") == "llm_busy" else 500
+        raise HTTPException(status_code=status_code, detail=result.get("error", "翻译失败"))
 
 
 @app.post("/api/asr/transcribe-and-optimize")
+@cancel_on_disconnect
 async def transcribe_and_optimize(
+    request: Request,
     audio: UploadFile = File(..., description="音频文件"),
     use_vad: bool = Form(True),
     use_punc: bool = Form(True),
     hotword: str = Form(""),
-    optimize_mode: str = Form("optimize", description="优化模式")
+    optimize_mode: str = Form("optimize", description="优化模式"),
+    deadline_ms: Optional[int] = Form(None, description="延迟预算（毫秒），也可用X-Deadline-Ms头")
 ):
     """
     一体化接口：语音识别 + 文本优化
@@ -412,6 +1479,7 @@ async def transcribe_and_optimize(
         use_punc: 是否添加标点
         hotword: 热词
         optimize_mode: 优化模式
+        deadline_ms: 延迟预算，预计超时时依次跳过LLM优化、标点、短音频的VAD
 
     Returns:
         识别和优化后的结果
@@ -424,31 +1492,30 @@ async def transcribe_and_optimize(
     if not ollama_client:
         raise HTTPException(status_code=503, detail="Ollama客户端未初始化")
 
-    # 保存临时音频文件
-    temp_dir = tempfile.mkdtemp()
-    temp_audio_path = Path(temp_dir) / audio.filename
+    deadline = request_deadline_ms(request, deadline_ms)
 
     try:
-        # 写入音频文件
         content = await audio.read()
-        with open(temp_audio_path, "wb") as f:
-            f.write(content)
 
         logger.info(f"收到一体化请求: {audio.filename}")
 
+        plan = request_planner.plan(deadline, estimate_duration(content) or 0.0, use_vad, use_punc,
+                                    use_llm=optimize_mode != "none")
+
         # 1. 语音识别
         # 合并系统热词和用户热词
         merged_hotwords = merge_hotwords(hotword)
 
         options = {
-            "use_vad": use_vad,
-            "use_punc": use_punc,
+            "use_vad": plan.use_vad,
+            "use_punc": plan.use_punc,
             "hotword": merged_hotwords
         }
 
         logger.info(f"一体化处理 - 使用热词数: {len(merged_hotwords.split()) if merged_hotwords else 0}")
 
-        asr_result = funasr_server.transcribe_audio(str(temp_audio_path), options)
+        with prepared_audio(content, audio.filename) as (audio_input, audio_options):
+            asr_result = await run_transcription(audio_input, {**options, **audio_options})
 
         if not asr_result["success"]:
             raise HTTPException(status_code=500, detail=asr_result.get("error", "转录失败"))
@@ -456,34 +1523,15 @@ async def transcribe_and_optimize(
         recognized_text = asr_result["text"]
 
         # 2. 文本优化
-        if optimize_mode != "none":
-            # 格式化热词为LLM易读的格式（包含常见误识别变体）
-            hotwords_list = merged_hotwords.split() if merged_hotwords else []
-            hotwords_formatted = format_hotwords_for_llm(hotwords_list, max_words=50)
-
-            llm_result = await ollama_client.optimize_text(
-                text=recognized_text,
-                mode=optimize_mode,
-                hotwords_context=hotwords_formatted if hotwords_formatted else None
-            )
+        optimized_text = await optimize_recognized_text(recognized_text, optimize_mode, merged_hotwords, plan)
 
-            # 简单决策：LLM成功就用LLM结果，失败就用ASR原文
-            if llm_result["success"]:
-                optimized_text = llm_result["optimized_text"]
-                logger.info(f"文本优化成功，原文长度: {len(recognized_text)}, 优化后长度: {len(optimized_text)}")
-            else:
-                logger.warning(f"文本优化失败，使用原始识别文本: {llm_result.get('error')}")
-                optimized_text = recognized_text
-        else:
-            optimized_text = recognized_text
-
-        return JSONResponse(content={
+        return JSONResponse(content=plan.annotate({
             "success": True,
             "asr_result": asr_result,
             "recognized_text": recognized_text,
             "optimized_text": optimized_text,
             "optimize_mode": optimize_mode
-        })
+        }))
 
     except HTTPException:
         raise
@@ -491,29 +1539,23 @@ async def transcribe_and_optimize(
         logger.error(f"一体化请求处理失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-    finally:
-        # 清理临时文件
-        try:
-            temp_audio_path.unlink()
-            Path(temp_dir).rmdir()
-        except:
-            pass
-
 
 @app.post("/api/asr/transcribe-and-optimize-stream")
 async def transcribe_and_optimize_stream(
+    request: Request,
     audio: UploadFile = File(..., description="音频文件"),
     use_vad: bool = Form(True),
     use_punc: bool = Form(True),
     hotword: str = Form(""),
-    optimize_mode: str = Form("optimize", description="优化模式")
+    optimize_mode: str = Form("optimize", description="优化模式"),
+    long_audio: bool = Form(False, description="按长音频分窗口处理（超过阈值时自动启用）")
 ):
     """
     流式接口：语音识别 + 文本优化（分阶段输出）
 
     使用Server-Sent Events (SSE)格式返回，客户端可以实时接收每个阶段的结果：
     - 阶段1: 开始处理
-    - 阶段2: ASR识别完成
+    - 阶段2: ASR识别完成（长音频先逐窗口输出asr_partial，带progress百分比）
     - 阶段3: LLM优化完成
     - 阶段4: 处理完成
 
@@ -523,6 +1565,7 @@ async def transcribe_and_optimize_stream(
         use_punc: 是否添加标点
         hotword: 热词
         optimize_mode: 优化模式
+        long_audio: 按长音频分窗口处理
 
     Returns:
         SSE流式响应
@@ -536,6 +1579,11 @@ async def transcribe_and_optimize_stream(
     """
     global funasr_server, ollama_client
 
+    # 断线重连：带Last-Event-ID且任务仍在保存期内时接回原任务，不重新处理音频
+    resumed = _resume_stream(request)
+    if resumed is not None:
+        return resumed
+
     if not funasr_server or not funasr_server.initialized:
         raise HTTPException(status_code=503, detail="FunASR服务未就绪")
 
@@ -545,18 +1593,11 @@ async def transcribe_and_optimize_stream(
     # 先读取音频内容（在generate_stream外部）
     audio_content = await audio.read()
     audio_filename = audio.filename
-
-    # 保存临时音频文件
-    temp_dir = tempfile.mkdtemp()
-    temp_audio_path = Path(temp_dir) / audio_filename
+    long_mode = is_long_audio(audio_content, long_audio)
 
     async def generate_stream():
         """生成流式响应"""
         try:
-            # 写入音频文件
-            with open(temp_audio_path, "wb") as f:
-                f.write(audio_content)
-
             logger.info(f"收到流式请求: {audio_filename}")
 
             # 阶段1: 开始处理
@@ -572,7 +1613,12 @@ async def transcribe_and_optimize_stream(
 
             logger.info(f"流式处理 - 使用热词数: {len(merged_hotwords.split()) if merged_hotwords else 0}")
 
-            asr_result = funasr_server.transcribe_audio(str(temp_audio_path), options)
+            with prepared_audio(audio_content, audio_filename, decode_in_memory=not long_mode) as (audio_input, audio_options):
+                async for event in transcribe_with_progress(audio_input, {**options, **audio_options}, long_mode):
+                    if event["stage"] == "asr_result":
+                        asr_result = event["result"]
+                    else:
+                        yield f"data: {json_module.dumps(event, ensure_ascii=False)}\n\n"
 
             if not asr_result["success"]:
                 yield f"data: {json_module.dumps({'stage': 'error', 'error': asr_result.get('error', '转录失败')}, ensure_ascii=False)}\n\n"
@@ -583,7 +1629,7 @@ async def transcribe_and_optimize_stream(
             # 输出ASR结果
             yield f"data: {json_module.dumps({'stage': 'asr_complete', 'text': recognized_text, 'duration': asr_result.get('duration', 0), 'timestamp': asyncio.get_event_loop().time()}, ensure_ascii=False)}\n\n"
 
-            logger.info(f"ASR识别完成: {recognized_text[:50]}...")
+            logger.info(f"ASR识别完成: {redact_text(recognized_text)}")
 
             # 阶段3: 文本优化
             if optimize_mode != "none":
@@ -595,12 +1641,13 @@ async def transcribe_and_optimize_stream(
                 llm_result = await ollama_client.optimize_text(
                     text=recognized_text,
                     mode=optimize_mode,
-                    hotwords_context=hotwords_formatted if hotwords_formatted else None
+                    hotwords_context=hotwords_formatted if hotwords_formatted else None,
+                    single_utterance=True,
                 )
 
                 if llm_result["success"]:
                     optimized_text = llm_result["optimized_text"]
-                    logger.info(f"LLM优化完成: {optimized_text[:50]}...")
+                    logger.info(f"LLM优化完成: {redact_text(optimized_text)}")
                 else:
                     logger.warning(f"文本优化失败，使用原始文本: {llm_result.get('error')}")
                     optimized_text = recognized_text
@@ -617,33 +1664,20 @@ async def transcribe_and_optimize_stream(
             logger.error(f"流式处理失败: {str(e)}")
             yield f"data: {json_module.dumps({'stage': 'error', 'error': str(e)}, ensure_ascii=False)}\n\n"
 
-        finally:
-            # 清理临时文件
-            try:
-                temp_audio_path.unlink()
-                Path(temp_dir).rmdir()
-            except Exception as cleanup_error:
-                logger.warning(f"清理临时文件失败: {str(cleanup_error)}")
-
-    return StreamingResponse(
-        generate_stream(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"  # 禁用nginx缓冲
-        }
-    )
+    return _sse_response(stream_store.start(generate_stream()))
 
 
 @app.post("/api/asr/transcribe-and-translate")
+@cancel_on_disconnect
 async def transcribe_and_translate(
+    request: Request,
     audio: UploadFile = File(..., description="音频文件"),
     use_vad: bool = Form(True),
     use_punc: bool = Form(True),
     hotword: str = Form(""),
     source_lang: str = Form("中文", description="源语言"),
-    target_lang: str = Form("英文", description="目标语言")
+    target_lang: str = Form("英文", description="目标语言"),
+    deadline_ms: Optional[int] = Form(None, description="延迟预算（毫秒），也可用X-Deadline-Ms头")
 ):
     """
     一体化接口：语音识别 + 智能翻译（优化版）
@@ -663,6 +1697,7 @@ async def transcribe_and_translate(
         hotword: 热词
         source_lang: 源语言（默认：中文）
         target_lang: 目标语言（默认：英文）
+        deadline_ms: 延迟预算，预计超时时依次跳过翻译（返回原文）、标点、短音频的VAD
 
     Returns:
         识别和智能翻译后的结果
@@ -675,40 +1710,47 @@ async def transcribe_and_translate(
     if not ollama_client:
         raise HTTPException(status_code=503, detail="Ollama客户端未初始化")
 
-    # 保存临时音频文件
-    temp_dir = tempfile.mkdtemp()
-    temp_audio_path = Path(temp_dir) / audio.filename
+    deadline = request_deadline_ms(request, deadline_ms)
 
     try:
-        # 写入音频文件
         content = await audio.read()
-        with open(temp_audio_path, "wb") as f:
-            f.write(content)
 
         logger.info(f"收到语音翻译请求: {audio.filename}, {source_lang} -> {target_lang}")
 
+        plan = request_planner.plan(deadline, estimate_duration(content) or 0.0, use_vad, use_punc, use_llm=True)
+
         # 1. 语音识别
         merged_hotwords = merge_hotwords(hotword)
         options = {
-            "use_vad": use_vad,
-            "use_punc": use_punc,
+            "use_vad": plan.use_vad,
+            "use_punc": plan.use_punc,
             "hotword": merged_hotwords
         }
 
-        asr_result = funasr_server.transcribe_audio(str(temp_audio_path), options)
+        with prepared_audio(content, audio.filename) as (audio_input, audio_options):
+            asr_result = await run_transcription(audio_input, {**options, **audio_options})
 
         if not asr_result["success"]:
             raise HTTPException(status_code=500, detail=asr_result.get("error", "转录失败"))
 
         recognized_text = asr_result["text"]
-        logger.info(f"识别成功: {recognized_text[:100]}...")
+        logger.info(f"识别成功: {redact_text(recognized_text)}")
 
         # 2. ASR智能翻译（优化+翻译一步完成，提升速度）
-        translate_result = await ollama_client.translate_from_asr(
-            text=recognized_text,
-            source_lang=source_lang,
-            target_lang=target_lang
-        )
+        if plan.allow_llm():
+            started = time.monotonic()
+            translate_result = await ollama_client.translate_from_asr(
+                text=recognized_text,
+                source_lang=source_lang,
+                target_lang=target_lang,
+                timeout=plan.llm_timeout()
+            )
+            if translate_result["success"]:
+                request_planner.observe_llm(time.monotonic() - started)
+            elif translate_result.get("type") == "deadline":
+                plan.skip("llm")
+        else:
+            translate_result = {"success": False, "error": "剩余延迟预算不足，跳过翻译"}
 
         if translate_result["success"]:
             translated_text = translate_result["translated_text"]
@@ -717,7 +1759,7 @@ async def transcribe_and_translate(
             logger.warning(f"翻译失败，返回原文: {translate_result.get('error')}")
             translated_text = recognized_text
 
-        return JSONResponse(content={
+        return JSONResponse(content=plan.annotate({
             "success": True,
             "asr_result": asr_result,
             "recognized_text": recognized_text,
@@ -725,7 +1767,7 @@ async def transcribe_and_translate(
             "source_lang": source_lang,
             "target_lang": target_lang,
             "mode": "asr_smart_translate"  # 标识使用了智能翻译模式
-        })
+        }))
 
     except HTTPException:
         raise
@@ -733,30 +1775,24 @@ async def transcribe_and_translate(
         logger.error(f"语音翻译请求处理失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-    finally:
-        # 清理临时文件
-        try:
-            temp_audio_path.unlink()
-            Path(temp_dir).rmdir()
-        except:
-            pass
-
 
 @app.post("/api/asr/transcribe-and-translate-stream")
 async def transcribe_and_translate_stream(
+    request: Request,
     audio: UploadFile = File(..., description="音频文件"),
     use_vad: bool = Form(True),
     use_punc: bool = Form(True),
     hotword: str = Form(""),
     source_lang: str = Form("中文", description="源语言"),
-    target_lang: str = Form("英文", description="目标语言")
+    target_lang: str = Form("英文", description="目标语言"),
+    long_audio: bool = Form(False, description="按长音频分窗口处理（超过阈值时自动启用）")
 ):
     """
     流式接口：语音识别 + 智能翻译（分阶段输出）
 
     使用Server-Sent Events (SSE)格式返回，客户端可以实时接收每个阶段的结果：
     - 阶段1: 开始处理
-    - 阶段2: ASR识别完成
+    - 阶段2: ASR识别完成（长音频先逐窗口输出asr_partial，带progress百分比）
     - 阶段3: 正在翻译
     - 阶段4: 翻译完成
     - 阶段5: 处理完成
@@ -768,12 +1804,18 @@ async def transcribe_and_translate_stream(
         hotword: 热词
         source_lang: 源语言（默认：中文）
         target_lang: 目标语言（默认：英文）
+        long_audio: 按长音频分窗口处理
 
     Returns:
         SSE流式响应
     """
     global funasr_server, ollama_client
 
+    # 断线重连：带Last-Event-ID且任务仍在保存期内时接回原任务，不重新处理音频
+    resumed = _resume_stream(request)
+    if resumed is not None:
+        return resumed
+
     if not funasr_server or not funasr_server.initialized:
         raise HTTPException(status_code=503, detail="FunASR服务未就绪")
 
@@ -783,18 +1825,11 @@ async def transcribe_and_translate_stream(
     # 先读取音频内容（在generate_stream外部）
     audio_content = await audio.read()
     audio_filename = audio.filename
-
-    # 保存临时音频文件
-    temp_dir = tempfile.mkdtemp()
-    temp_audio_path = Path(temp_dir) / audio_filename
+    long_mode = is_long_audio(audio_content, long_audio)
 
     async def generate_stream():
         """生成流式响应"""
         try:
-            # 写入音频文件
-            with open(temp_audio_path, "wb") as f:
-                f.write(audio_content)
-
             logger.info(f"收到流式翻译请求: {audio_filename}, {source_lang} -> {target_lang}")
 
             # 阶段1: 开始处理
@@ -810,7 +1845,12 @@ async def transcribe_and_translate_stream(
 
             logger.info(f"流式翻译处理 - 使用热词数: {len(merged_hotwords.split()) if merged_hotwords else 0}")
 
-            asr_result = funasr_server.transcribe_audio(str(temp_audio_path), options)
+            with prepared_audio(audio_content, audio_filename, decode_in_memory=not long_mode) as (audio_input, audio_options):
+                async for event in transcribe_with_progress(audio_input, {**options, **audio_options}, long_mode):
+                    if event["stage"] == "asr_result":
+                        asr_result = event["result"]
+                    else:
+                        yield f"data: {json_module.dumps(event, ensure_ascii=False)}\n\n"
 
             if not asr_result["success"]:
                 yield f"data: {json_module.dumps({'stage': 'error', 'error': asr_result.get('error', '转录失败')}, ensure_ascii=False)}\n\n"
@@ -821,7 +1861,7 @@ async def transcribe_and_translate_stream(
             # 输出ASR结果
             yield f"data: {json_module.dumps({'stage': 'asr_complete', 'text': recognized_text, 'duration': asr_result.get('duration', 0), 'timestamp': asyncio.get_event_loop().time()}, ensure_ascii=False)}\n\n"
 
-            logger.info(f"ASR识别完成: {recognized_text[:50]}...")
+            logger.info(f"ASR识别完成: {redact_text(recognized_text)}")
 
             # 阶段3: 智能翻译
             yield f"data: {json_module.dumps({'stage': 'translating', 'message': f'正在翻译 ({source_lang} → {target_lang})'}, ensure_ascii=False)}\n\n"
@@ -834,7 +1874,7 @@ async def transcribe_and_translate_stream(
 
             if translate_result["success"]:
                 translated_text = translate_result["translated_text"]
-                logger.info(f"翻译完成: {translated_text[:50]}...")
+                logger.info(f"翻译完成: {redact_text(translated_text)}")
             else:
                 logger.warning(f"翻译失败，使用原始文本: {translate_result.get('error')}")
                 translated_text = recognized_text
@@ -849,29 +1889,114 @@ async def transcribe_and_translate_stream(
             logger.error(f"流式翻译处理失败: {str(e)}")
             yield f"data: {json_module.dumps({'stage': 'error', 'error': str(e)}, ensure_ascii=False)}\n\n"
 
-        finally:
-            # 清理临时文件
-            try:
-                temp_audio_path.unlink()
-                Path(temp_dir).rmdir()
-            except Exception as cleanup_error:
-                logger.warning(f"清理临时文件失败: {str(cleanup_error)}")
+    return _sse_response(stream_store.start(generate_stream()))
 
-    return StreamingResponse(
-        generate_stream(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"  # 禁用nginx缓冲
-        }
-    )
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Prometheus文本格式指标"""
+    text = await asyncio.to_thread(REGISTRY.render)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def require_debug_token(request: Request):
+    """调试接口认证：未配置DEBUG_TOKEN时接口关闭（404），令牌不匹配返回401"""
+    valid = debug_token_valid(request.headers)
+    if valid is None:
+        raise HTTPException(status_code=404, detail="调试接口未启用（未配置DEBUG_TOKEN）")
+    if not valid:
+        raise HTTPException(status_code=401, detail="调试令牌无效")
+
+
+@app.get("/debug/profile")
+async def profile_service(
+    request: Request,
+    seconds: float = Query(10.0, gt=0, le=60, description="采样时长（秒）"),
+    interval_ms: float = Query(10.0, ge=1, le=1000, description="采样间隔（毫秒）"),
+):
+    """
+    对所有线程（事件循环、推理线程池、日志线程等）做调用栈采样，返回折叠栈文本
+
+    用法: curl -H "X-Debug-Token: $DEBUG_TOKEN" "http://localhost:8000/debug/profile?seconds=30" > out.folded
+          flamegraph.pl out.folded > out.svg
+    """
+    require_debug_token(request)
+    if STACK_SAMPLER.busy:
+        raise HTTPException(status_code=409, detail="已有采样正在进行")
+    try:
+        counts = await asyncio.to_thread(STACK_SAMPLER.sample, seconds, interval_ms / 1000.0)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(render_collapsed(counts), headers={"X-Worker-PID": str(os.getpid())})
+
+
+@app.get("/debug/profile/requests")
+async def list_request_profiles(request: Request):
+    """最近剖析过的请求"""
+    require_debug_token(request)
+    return {"success": True, "pid": os.getpid(), "profiles": REQUEST_PROFILER.list()}
+
+
+@app.get("/debug/profile/requests/{request_id}")
+async def get_request_profile(
+    request: Request,
+    request_id: str,
+    sort: str = Query("cumulative", description="pstats排序键：cumulative/tottime/ncalls等"),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """单个请求的cProfile报告（文本）"""
+    require_debug_token(request)
+    try:
+        report = REQUEST_PROFILER.report(request_id, sort, limit)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"无效的排序键: {sort}")
+    if report is None:
+        # 多worker时剖析结果只在处理该请求的worker中，请求落到其他worker时重试
+        raise HTTPException(status_code=404, detail=f"worker {os.getpid()} 中没有该请求的剖析结果"
+                                                    f"（多worker时只保存在处理该请求的worker中，见X-Worker-PID）")
+    return PlainTextResponse(report, headers={"X-Worker-PID": str(os.getpid())})
+
+
+@app.get("/debug/traces")
+async def get_traces(
+    request: Request,
+    limit: int = Query(10, ge=1, le=100, description="返回的追踪数"),
+    name: Optional[str] = Query(None, description="只返回名称（方法和路径）包含该字符串的追踪"),
+):
+    """
+    最近的请求追踪中耗时最长的若干个，span按父子关系组织为树（span属性含请求路径、后端地址等，需要调试令牌）
+
+    追踪缓冲区属于每个worker进程，结果只包含处理本次调试请求的worker（pid字段）中的追踪
+    """
+    require_debug_token(request)
+    return {"success": True, "pid": os.getpid(), **TRACER.get_stats(), "traces": TRACER.slowest(limit, name)}
 
 
 @app.get("/api/health")
 async def health_check():
-    """健康检查"""
-    return {"status": "healthy", "message": "QuQu Backend is running"}
+    """健康检查（进程存活），附带结构化的初始化进度"""
+    return {
+        "status": "healthy",
+        "message": "QuQu Backend is running",
+        "initialization": get_initialization_progress(),
+    }
+
+
+@app.get("/api/ready")
+async def readiness_check():
+    """
+    就绪检查
+
+    模型加载并预热完成前返回503，负载均衡器只应向返回200的实例分发流量。
+    /api/health 只表示进程存活。
+    """
+    global funasr_server
+
+    if not funasr_server:
+        return JSONResponse(status_code=503, content={"ready": False, "error": "FunASR未初始化"})
+
+    readiness = await asyncio.to_thread(funasr_server.get_readiness)
+    return JSONResponse(status_code=200 if readiness.get("ready") else 503, content=readiness)
 
 
 @app.get("/api/hotwords")
@@ -920,20 +2045,101 @@ async def reload_hotwords():
 
 # ==================== 主程序 ====================
 
+def _spawn_model_host(socket_path: str) -> subprocess.Popen:
+    process = subprocess.Popen([
+        sys.executable,
+        str(Path(__file__).parent / "funasr_gpu.py"),
+        "--listen", socket_path,
+    ])
+    logger.info(f"模型宿主已启动: pid={process.pid}, socket={socket_path}")
+    return process
+
+
+def _stop_model_host(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def supervise_model_host(socket_path: str, stop: threading.Event, on_give_up,
+                         spawn=_spawn_model_host, poll_interval: float = 1.0):
+    """
+    启动模型宿主并在其意外退出（如显存/内存不足被杀）时重启，HTTP worker的客户端自动重连
+
+    连续MODEL_HOST_MAX_RESTARTS次在启动后MODEL_HOST_RESTART_WINDOW秒内退出时放弃重启，调用on_give_up
+    结束整个服务，交给容器/systemd的重启策略处理；stop置位后终止宿主并返回。
+    """
+    max_restarts = int(os.getenv("MODEL_HOST_MAX_RESTARTS", "5"))
+    restart_window = float(os.getenv("MODEL_HOST_RESTART_WINDOW", "600"))
+    restart_delay = float(os.getenv("MODEL_HOST_RESTART_DELAY", "2"))
+
+    failures = 0
+    while True:
+        process = spawn(socket_path)
+        started = time.monotonic()
+        while process.poll() is None and not stop.wait(poll_interval):
+            pass
+        if stop.is_set():
+            _stop_model_host(process)
+            return
+
+        failures = failures + 1 if time.monotonic() - started < restart_window else 1
+        if failures > max_restarts:
+            logger.error(f"模型宿主连续{failures}次在{restart_window:.0f}秒内退出，停止服务器")
+            on_give_up()
+            return
+        logger.error(f"模型宿主意外退出 (pid={process.pid}, exit code={process.returncode})，"
+                     f"{restart_delay:g}秒后重启")
+        if stop.wait(restart_delay):
+            return
+
+
 if __name__ == "__main__":
     # 获取配置
     host = os.getenv("SERVER_HOST", "0.0.0.0")
     port = int(os.getenv("SERVER_PORT", "8000"))
     workers = int(os.getenv("SERVER_WORKERS", "1"))
 
-    logger.info(f"启动服务器: {host}:{port}, workers={workers}")
+    # 部署模式：single 每个进程自己加载模型；split 多个HTTP worker共享一个模型宿主进程
+    server_mode = os.getenv("SERVER_MODE", "split" if workers > 1 else "single")
 
-    # 启动服务器
-    uvicorn.run(
-        "server:app",
-        host=host,
-        port=port,
-        workers=workers,
-        log_level="info",
-        access_log=True
-    )
+    logger.info(f"启动服务器: {host}:{port}, workers={workers}, mode={server_mode}")
+
+    model_host_stop = None
+    model_host_supervisor = None
+    model_host_failed = threading.Event()
+
+    def _give_up_model_host():
+        # uvicorn收到SIGTERM后正常关闭各worker，进程随后以非0状态退出
+        model_host_failed.set()
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    if server_mode == "split":
+        socket_path = os.getenv("MODEL_HOST_SOCKET", "/tmp/ququ_model_host.sock")
+        # uvicorn worker进程继承环境变量，在lifespan中连接模型宿主而不是各自加载模型
+        os.environ["MODEL_HOST_SOCKET"] = socket_path
+        model_host_stop = threading.Event()
+        model_host_supervisor = threading.Thread(
+            target=supervise_model_host, args=(socket_path, model_host_stop, _give_up_model_host),
+            name="model-host-supervisor", daemon=True,
+        )
+        model_host_supervisor.start()
+
+    try:
+        # 启动服务器
+        uvicorn.run(
+            "server:app",
+            host=host,
+            port=port,
+            workers=workers,
+            log_level="info",
+            access_log=True
+        )
+    finally:
+        if model_host_stop is not None:
+            model_host_stop.set()
+            model_host_supervisor.join(timeout=15)
+    if model_host_failed.is_set():
+        sys.exit(1)
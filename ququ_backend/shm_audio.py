@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享内存音频环形缓冲区
+前端把PCM写入共享内存，只把缓冲区引用（名称/偏移/帧数）通过IPC发给worker，
+worker直接在共享内存上构造numpy视图，音频不再经过文件系统或管道
+"""
+
+import os
+import threading
+from multiprocessing import shared_memory
+from typing import Dict, Any
+
+import numpy as np
+
+DEFAULT_RING_SIZE = int(os.getenv("FUNASR_SHM_RING_MB", "64")) * 1024 * 1024
+_ALIGNMENT = 64
+
+
+class SharedAudioRing:
+    """
+    单写者的共享内存环形缓冲区
+
+    区块在worker返回结果后由写者释放；释放可以乱序，
+    分配时只要与任何未释放区块重叠就视为缓冲区已满。
+    """
+
+    def __init__(self, size_bytes: int = DEFAULT_RING_SIZE):
+        self.size = size_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=size_bytes)
+        self.name = self.shm.name
+        self._head = 0
+        self._outstanding: Dict[int, int] = {}  # offset -> nbytes
+        self._lock = threading.Lock()
+
+    def _overlaps(self, start: int, nbytes: int) -> bool:
+        end = start + nbytes
+        for offset, length in self._outstanding.items():
+            if start < offset + length and offset < end:
+                return True
+        return False
+
+    def _allocate(self, nbytes: int) -> int:
+        """分配一个区块，返回偏移；空间不足抛出BufferError"""
+        if nbytes > self.size:
+            raise BufferError(f"数据({nbytes} bytes)超过共享内存缓冲区大小({self.size} bytes)")
+
+        with self._lock:
+            start = self._head
+            if start + nbytes > self.size:
+                start = 0
+            if self._overlaps(start, nbytes):
+                raise BufferError("共享内存缓冲区已满")
+            self._outstanding[start] = nbytes
+            self._head = (start + nbytes + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+            if self._head >= self.size:
+                self._head = 0
+        return start
+
+    def write(self, samples: np.ndarray, sample_rate: int) -> Dict[str, Any]:
+        """
+        写入一段音频
+
+        Args:
+            samples: 单声道音频，转换为float32（[-1, 1]）后写入
+            sample_rate: 采样率
+
+        Returns:
+            可JSON序列化的缓冲区引用
+
+        Raises:
+            BufferError: 缓冲区剩余空间不足
+        """
+        samples = np.ascontiguousarray(samples, dtype=np.float32).reshape(-1)
+        if samples.nbytes == 0:
+            raise ValueError("音频为空")
+        start = self._allocate(samples.nbytes)
+
+        view = np.ndarray(samples.shape, dtype=np.float32, buffer=self.shm.buf, offset=start)
+        view[:] = samples
+        del view
+
+        return {
+            "shm": self.name,
+            "offset": start,
+            "frames": int(samples.shape[0]),
+            "dtype": "float32",
+            "sample_rate": int(sample_rate),
+        }
+
+    def write_bytes(self, data: bytes) -> Dict[str, Any]:
+        """写入原始字节（如尚未按帧解析的PCM分块），引用的dtype为uint8"""
+        if not data:
+            raise ValueError("数据为空")
+        start = self._allocate(len(data))
+        self.shm.buf[start:start + len(data)] = data
+        return {"shm": self.name, "offset": start, "frames": len(data), "dtype": "uint8"}
+
+    def release(self, ref: Dict[str, Any]):
+        """worker处理完成后释放区块"""
+        with self._lock:
+            self._outstanding.pop(ref["offset"], None)
+
+    def close(self):
+        """关闭并删除共享内存"""
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# worker侧已附加的共享内存（按名称缓存，进程退出时随之释放）
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+_attach_lock = threading.Lock()
+
+
+def attach_audio(ref: Dict[str, Any]) -> np.ndarray:
+    """
+    在worker进程中按引用取得音频的零拷贝视图
+
+    视图直接指向写者的共享内存，写者在收到响应前不会复用该区块。
+    """
+    name = ref["shm"]
+    with _attach_lock:
+        shm = _attached.get(name)
+        if shm is None:
+            shm = shared_memory.SharedMemory(name=name)
+            # 共享内存归写者所有：避免resource_tracker在worker退出时将其unlink
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception:
+                pass
+            _attached[name] = shm
+
+    return np.ndarray(
+        (int(ref["frames"]),),
+        dtype=np.dtype(ref.get("dtype", "float32")),
+        buffer=shm.buf,
+        offset=int(ref["offset"]),
+    )
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+相同请求的合并执行（single-flight）
+同一个键的请求正在执行时，后到的请求不再重复执行，而是等待同一个结果。
+客户端在网络不稳时重试、或同一段音频同时调用优化和翻译接口时，GPU/LLM负载不会成倍增加
+"""
+
+import copy
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+from metrics import REGISTRY
+from cancellation import cancel_scope, record_cancelled
+
+logger = logging.getLogger(__name__)
+
+_executions = REGISTRY.counter(
+    "ququ_singleflight_executions_total",
+    "Requests that actually executed (not coalesced)",
+    ("kind",),
+)
+_coalesced = REGISTRY.counter(
+    "ququ_singleflight_coalesced_total",
+    "Duplicate concurrent requests that waited on an in-flight execution",
+    ("kind",),
+)
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 1
+
+
+class SingleFlight:
+    """
+    按键合并并发执行的协程
+
+    实际执行放在独立的Task中，发起请求的连接断开（协程被取消）不会影响其他等待者；
+    全部等待者都离开后取消执行（LLM请求随之中断，排队中的推理通过取消令牌放弃）。
+    """
+
+    def __init__(self, kind: str):
+        """
+        Args:
+            kind: 指标标签（如asr、llm）
+        """
+        self.kind = kind
+        self._inflight: Dict[str, _Flight] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]],
+                 release: Optional[Callable[[], None]] = None) -> Any:
+        """
+        执行func，或等待同一键上正在进行的执行；合并到已有执行的调用方得到结果的副本
+
+        Args:
+            release: 释放func所用资源（如临时文件）的函数。本次调用发起了执行时，在执行结束
+                （完成、失败或被取消）后调用，不随发起请求的连接提前释放；合并到已有执行时立即调用
+        """
+        flight = self._inflight.get(key)
+        if flight is not None:
+            if release is not None:
+                release()
+            _coalesced.inc(kind=self.kind)
+            logger.info(f"合并重复请求 ({self.kind})")
+            flight.waiters += 1
+            return copy.deepcopy(await self._wait(key, flight))
+
+        _executions.inc(kind=self.kind)
+        flight = _Flight(asyncio.ensure_future(self._run(func)))
+        self._inflight[key] = flight
+        flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        if release is not None:
+            flight.task.add_done_callback(lambda _: release())
+        return await self._wait(key, flight)
+
+    @staticmethod
+    async def _run(func: Callable[[], Awaitable[Any]]) -> Any:
+        # 取消令牌属于这次执行而不是发起它的请求
+        with cancel_scope("abandoned"):
+            return await func()
+
+    async def _wait(self, key: str, flight: _Flight) -> Any:
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # 之后到达的相同请求重新执行，不再合并到正在取消的执行上
+                self._forget(key, flight)
+                flight.task.cancel()
+                record_cancelled(self.kind)
+                logger.info(f"等待者都已离开，取消执行 ({self.kind})")
+            raise
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": len(self._inflight),
+            "executions": _executions.get(kind=self.kind),
+            "coalesced": _coalesced.get(kind=self.kind),
+        }
+
+
+def options_key(options: Dict[str, Any]) -> str:
+    return json.dumps(options, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def audio_fingerprint(audio) -> str:
+    """音频内容摘要：数组按采样数据计算，文件按文件内容计算"""
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(audio, np.ndarray):
+        digest.update(str(audio.dtype).encode())
+        digest.update(np.ascontiguousarray(audio).data)
+    else:
+        with open(audio, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可续传的SSE流
+流式接口的处理过程（ASR + LLM）作为独立的后台任务运行，产生的每个阶段事件按顺序编号保存在
+内存中（有上限，完成后保留SSE_STREAM_TTL秒）。连接只是事件的订阅者：每个事件带
+"id: <job_id>:<序号>"，断线后带Last-Event-ID重连（或按job_id访问/api/asr/streams/{job_id}），
+先补发错过的事件，再接着接收正在运行的任务的后续事件，不会重新占用GPU或LLM。
+空闲时定期发送SSE注释行作为心跳，避免代理因长时间无数据而断开连接。
+最后一个订阅者断开后等待SSE_CANCEL_GRACE秒，期间没有重新连接则取消任务，不再为无人接收的结果占用GPU和LLM。
+多个HTTP worker时事件同时写入共享的SQLite事件日志，重连落到其他worker时从日志中轮询读取
+"""
+
+import os
+import time
+import uuid
+import json
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+from cancellation import record_cancelled
+from job_store import _pid_alive
+
+logger = logging.getLogger(__name__)
+
+_subscriptions = REGISTRY.counter(
+    "ququ_sse_subscriptions_total",
+    "SSE stream subscriptions (new: started a job, resumed: reattached by Last-Event-ID or job id)",
+    ("kind",),
+)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS streams (
+    job_id TEXT PRIMARY KEY,
+    owner_pid INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    last_seen REAL
+);
+CREATE TABLE IF NOT EXISTS stream_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    chunk TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class StreamEventLog:
+    """
+    多个worker进程共享的SSE事件日志（SQLite）
+
+    运行任务的worker写入事件和完成标记；其他worker上的订阅者按序号轮询读取，
+    并记录最近一次读取的时间，运行任务的worker据此判断任务是否仍有订阅者
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # 首次使用时再连接：模块在fork出的worker中导入时不共享连接
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30,
+                                         isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def register(self, job_id: str):
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO streams (job_id, owner_pid, created_at) VALUES (?, ?, ?)",
+                (job_id, os.getpid(), time.time()),
+            )
+
+    def append(self, job_id: str, seq: int, chunk: str, max_events: int):
+        """追加一个事件，只保留最近max_events个"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO stream_events (job_id, seq, chunk) VALUES (?, ?, ?)",
+                         (job_id, seq, chunk))
+            conn.execute("DELETE FROM stream_events WHERE job_id = ? AND seq <= ?", (job_id, seq - max_events))
+
+    def finish(self, job_id: str):
+        with self._lock:
+            self._connection().execute("UPDATE streams SET finished_at = ? WHERE job_id = ?",
+                                       (time.time(), job_id))
+
+    def exists(self, job_id: str) -> bool:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT 1 FROM streams WHERE job_id = ?", (job_id,)
+            ).fetchone() is not None
+
+    def read(self, job_id: str, after: int) -> Optional[Dict[str, Any]]:
+        """
+        读取序号大于after的事件并记录本次读取时间
+
+        Returns:
+            {"events": [(序号, 事件文本), ...], "finished": 是否已完成, "owner_pid": 运行任务的进程}；
+            任务不存在（已过期）时返回None
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            try:
+                row = conn.execute("SELECT owner_pid, finished_at FROM streams WHERE job_id = ?",
+                                   (job_id,)).fetchone()
+                events: List[Tuple[int, str]] = conn.execute(
+                    "SELECT seq, chunk FROM stream_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                    (job_id, after),
+                ).fetchall()
+                conn.execute("UPDATE streams SET last_seen = ? WHERE job_id = ?", (now, job_id))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"events": events, "finished": row[1] is not None, "owner_pid": row[0]}
+
+    def seen_since(self, job_id: str, since: float) -> bool:
+        """其他worker上的订阅者在since之后是否读取过该任务"""
+        with self._lock:
+            row = self._connection().execute("SELECT last_seen FROM streams WHERE job_id = ?",
+                                             (job_id,)).fetchone()
+        return row is not None and row[0] is not None and row[0] >= since
+
+    def delete(self, job_id: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM stream_events WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM streams WHERE job_id = ?", (job_id,))
+
+    def expire(self, ttl: float):
+        """删除完成超过ttl秒的任务，以及运行它的进程已退出的任务"""
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                "SELECT job_id, owner_pid, finished_at FROM streams WHERE finished_at IS NULL OR finished_at < ?",
+                (time.time() - ttl,),
+            ).fetchall()
+            expired = [job_id for job_id, pid, finished_at in rows
+                       if finished_at is not None or not _pid_alive(pid)]
+            for job_id in expired:
+                conn.execute("DELETE FROM stream_events WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM streams WHERE job_id = ?", (job_id,))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class StreamJob:
+    """一个流式处理任务：后台任务产生的事件及其订阅者"""
+
+    def __init__(self, job_id: str, max_events: int, remote: bool = False):
+        self.job_id = job_id
+        # 任务在其他worker进程中运行，事件从共享事件日志读取
+        self.remote = remote
+        # (序号, SSE事件文本)；超过上限时丢弃最早的事件
+        self.events: deque = deque(maxlen=max_events)
+        self.last_seq = 0
+        self.done = False
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_handle: Optional[asyncio.TimerHandle] = None
+        self._changed = asyncio.Event()
+
+    def append(self, chunk: str):
+        self.last_seq += 1
+        self.events.append((self.last_seq, chunk))
+        self._notify()
+
+    def finish(self):
+        if not self.done:
+            self.done = True
+            self.finished_at = time.time()
+            self._notify()
+
+    def _notify(self):
+        # 唤醒当前所有订阅者，之后的等待使用新的Event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class StreamStore:
+    """
+    流式任务及其事件的短期存储
+
+    任务数超过上限时淘汰最早完成的任务；运行中的任务不会被淘汰。
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_jobs: Optional[int] = None,
+                 max_events: Optional[int] = None, heartbeat: Optional[float] = None,
+                 cancel_grace: Optional[float] = None, shared: Optional[StreamEventLog] = None,
+                 poll_interval: Optional[float] = None):
+        """
+        Args:
+            ttl: 任务完成后事件保留时长（秒），默认读取SSE_STREAM_TTL（300）
+            max_jobs: 保存的任务数上限，默认读取SSE_STREAM_MAX_JOBS（200）
+            max_events: 每个任务保存的事件数上限，默认读取SSE_STREAM_MAX_EVENTS（2000）
+            heartbeat: 无事件时发送心跳的间隔（秒），默认读取SSE_HEARTBEAT_INTERVAL（15）
+            cancel_grace: 没有订阅者后取消任务前的等待时间（秒），默认读取SSE_CANCEL_GRACE（30）；
+                0为立即取消，负数为不取消
+            shared: 多个worker共享的事件日志；默认在设置了SSE_STREAM_DB或SERVER_WORKERS>1时启用，
+                数据库位于SSE_STREAM_DB（默认JOB_DIR/streams.sqlite3）
+            poll_interval: 订阅其他worker上的任务时读取事件日志的间隔（秒），默认读取SSE_STREAM_POLL_INTERVAL（0.2）
+        """
+        self.ttl = ttl or float(os.getenv("SSE_STREAM_TTL", "300"))
+        self.max_jobs = max_jobs or int(os.getenv("SSE_STREAM_MAX_JOBS", "200"))
+        self.max_events = max_events or int(os.getenv("SSE_STREAM_MAX_EVENTS", "2000"))
+        self.heartbeat = heartbeat or float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))
+        self.cancel_grace = cancel_grace if cancel_grace is not None else float(os.getenv("SSE_CANCEL_GRACE", "30"))
+        self.poll_interval = poll_interval or float(os.getenv("SSE_STREAM_POLL_INTERVAL", "0.2"))
+        if shared is None and (os.getenv("SSE_STREAM_DB") or int(os.getenv("SERVER_WORKERS", "1")) > 1):
+            shared = StreamEventLog(os.getenv("SSE_STREAM_DB") or os.path.join(
+                os.getenv("JOB_DIR", "/tmp/ququ_jobs"), "streams.sqlite3"))
+        self.shared = shared
+        self._jobs: "OrderedDict[str, StreamJob]" = OrderedDict()
+
+        REGISTRY.gauge("ququ_sse_streams_running", "Streaming jobs still producing events",
+                       function=lambda: sum(1 for j in self._jobs.values() if not j.done))
+        REGISTRY.gauge("ququ_sse_streams_stored", "Streaming jobs kept for resumption",
+                       function=lambda: len(self._jobs))
+
+    def start(self, events: AsyncIterator[str]) -> StreamJob:
+        """
+        在后台任务中运行事件生成器并保存其事件
+
+        Args:
+            events: 产生SSE事件文本（"data: ...\\n\\n"）的异步生成器；
+                在调用方的上下文中创建任务，请求ID和追踪上下文随之继承
+        """
+        self._evict()
+        job = StreamJob(uuid.uuid4().hex[:16], self.max_events)
+        self._jobs[job.job_id] = job
+        if self.shared is not None:
+            self.shared.expire(self.ttl)
+            self.shared.register(job.job_id)
+        job.task = asyncio.create_task(self._produce(job, events))
+        _subscriptions.inc(kind="new")
+        return job
+
+    async def _produce(self, job: StreamJob, events: AsyncIterator[str]):
+        try:
+            async for chunk in events:
+                job.append(chunk)
+                if self.shared is not None:
+                    await asyncio.to_thread(self.shared.append, job.job_id, job.last_seq, chunk, self.max_events)
+        except asyncio.CancelledError:
+            # 之后在保存期内重新连接的客户端能看到任务为何中止
+            error = {"stage": "error", "error": "客户端已断开，处理已取消", "type": "cancelled"}
+            job.append(f"data: {json.dumps(error, ensure_ascii=False)}\n\n")
+            self._share_last_event(job)
+            raise
+        except Exception as e:
+            logger.error(f"流式任务 {job.job_id} 异常结束: {str(e)}")
+        finally:
+            job.finish()
+            if self.shared is not None:
+                self.shared.finish(job.job_id)
+
+    def _share_last_event(self, job: StreamJob):
+        if self.shared is not None and job.events:
+            self.shared.append(job.job_id, *job.events[-1], self.max_events)
+
+    def get(self, job_id: str) -> Optional[StreamJob]:
+        """按ID取任务；本进程中没有时查找共享事件日志（任务在其他worker中）；不存在或已过期时返回None"""
+        self._evict()
+        job = self._jobs.get(job_id)
+        if job is None and self.shared is not None and self.shared.exists(job_id):
+            job = StreamJob(job_id, self.max_events, remote=True)
+        return job
+
+    def resolve(self, last_event_id: Optional[str]) -> Optional[Tuple[StreamJob, int]]:
+        """
+        解析Last-Event-ID（"<job_id>:<序号>"）
+
+        Returns:
+            (任务, 已收到的最后序号)；格式不对或任务已过期时返回None
+        """
+        if not last_event_id:
+            return None
+        job_id, _, seq = last_event_id.strip().partition(":")
+        job = self.get(job_id)
+        if job is None:
+            return None
+        try:
+            return job, int(seq or 0)
+        except ValueError:
+            return job, 0
+
+    async def subscribe(self, job: StreamJob, after: int = 0, resumed: bool = False) -> AsyncIterator[str]:
+        """
+        订阅任务事件：先补发序号大于after的事件，再等待新事件，任务结束后返回
+
+        连接断开（生成器被关闭）只结束订阅；最后一个订阅者离开cancel_grace秒后仍无人重连才取消任务。
+        """
+        if resumed:
+            _subscriptions.inc(kind="resumed")
+            logger.info(f"流式任务 {job.job_id} 重新连接，从事件 {after} 之后继续")
+        if job.remote:
+            async for chunk in self._subscribe_remote(job, after):
+                yield chunk
+            return
+        if job.cancel_handle is not None:
+            job.cancel_handle.cancel()
+            job.cancel_handle = None
+        job.subscribers += 1
+        try:
+            while True:
+                # 先取等待对象再读事件，读取后追加的事件一定会唤醒本次等待
+                changed = job._changed
+                for seq, chunk in list(job.events):
+                    if seq > after:
+                        after = seq
+                        yield f"id: {job.job_id}:{seq}\n{chunk}"
+                if job.done:
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+        finally:
+            job.subscribers -= 1
+            if job.subscribers == 0 and not job.done and self.cancel_grace >= 0:
+                job.cancel_handle = asyncio.get_running_loop().call_later(
+                    self.cancel_grace, self._cancel_abandoned, job
+                )
+
+    async def _subscribe_remote(self, job: StreamJob, after: int) -> AsyncIterator[str]:
+        """订阅在其他worker中运行的任务：轮询共享事件日志，直到任务结束"""
+        idle = 0.0
+        while True:
+            state = await asyncio.to_thread(self.shared.read, job.job_id, after)
+            if state is None:
+                return
+            for seq, chunk in state["events"]:
+                after = seq
+                idle = 0.0
+                yield f"id: {job.job_id}:{seq}\n{chunk}"
+            if state["finished"]:
+                return
+            if not _pid_alive(state["owner_pid"]):
+                error = {"stage": "error", "error": "处理该任务的worker已退出", "type": "worker_exited"}
+                yield f"data: {json.dumps(error, ensure_ascii=False)}\n\n"
+                return
+            if idle >= self.heartbeat:
+                idle = 0.0
+                yield ": ping\n\n"
+            await asyncio.sleep(self.poll_interval)
+            idle += self.poll_interval
+
+    def _cancel_abandoned(self, job: StreamJob):
+        job.cancel_handle = None
+        # 其他worker上的订阅者定期读取事件日志：宽限期内读取过则继续等待
+        window = max(self.cancel_grace, self.poll_interval * 5)
+        if (self.shared is not None and not job.done
+                and self.shared.seen_since(job.job_id, time.time() - window)):
+            job.cancel_handle = asyncio.get_running_loop().call_later(window, self._cancel_abandoned, job)
+            return
+        if job.subscribers == 0 and not job.done and job.task is not None:
+            logger.info(f"流式任务 {job.job_id} 的客户端已断开{self.cancel_grace:.0f}秒未重连，取消处理")
+            record_cancelled("stream")
+            job.task.cancel()
+
+    def _evict(self):
+        now = time.time()
+        for job_id in [j.job_id for j in self._jobs.values() if j.done and now - j.finished_at > self.ttl]:
+            self._delete(job_id)
+        if len(self._jobs) > self.max_jobs:
+            finished = sorted((j for j in self._jobs.values() if j.done), key=lambda j: j.finished_at)
+            for job in finished[:len(self._jobs) - self.max_jobs]:
+                self._delete(job.job_id)
+
+    def _delete(self, job_id: str):
+        del self._jobs[job_id]
+        if self.shared is not None:
+            self.shared.delete(job_id)
+
+    async def stop(self):
+        """关闭服务时取消仍在运行的任务"""
+        tasks = [j.task for j in self._jobs.values() if j.task is not None and not j.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.shared is not None:
+            self.shared.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "stored": len(self._jobs),
+            "running": sum(1 for j in self._jobs.values() if not j.done),
+            "subscribers": sum(j.subscribers for j in self._jobs.values()),
+            "ttl": self.ttl,
+            "max_jobs": self.max_jobs,
+            "heartbeat": self.heartbeat,
+            "cancel_grace": self.cancel_grace,
+            "shared": self.shared.db_path if self.shared is not None else None,
+        }
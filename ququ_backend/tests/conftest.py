@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""pytest公共配置：服务模块平铺在ququ_backend目录下，按脚本方式导入"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""分块上传会话：分块边界对齐、优先级传递、会话命令、分离部署模式下跨worker共享"""
+
+import asyncio
+
+import numpy as np
+
+from asr_sessions import ASRSession
+
+
+class _Backend:
+    """记录调用的ASR后端：整段视为一个语音段"""
+
+    def __init__(self):
+        self.vad_priorities = []
+        self.transcribed = []
+
+    def detect_segments(self, samples, sample_rate=16000, priority="normal"):
+        self.vad_priorities.append(priority)
+        return [(0, len(samples))]
+
+    def transcribe_audio(self, audio, options=None):
+        self.transcribed.append((np.array(audio), dict(options)))
+        return {"success": True, "text": "好"}
+
+
+def _session(backend, **kwargs):
+    return ASRSession("s1", backend, scan_step_s=60, options={"priority": "interactive"}, **kwargs)
+
+
+def test_split_sample_is_kept_for_next_chunk():
+    backend = _Backend()
+    session = _session(backend)
+    data = np.arange(1, 8, dtype="<i2").tobytes()  # 7个采样点，14字节
+
+    # 在采样点中间切开：3 + 11字节
+    assert session.append(data[:3]) == 1
+    assert session.append(data[3:]) == 6
+    assert session.received_samples == 7
+    np.testing.assert_allclose(session.pending * 32768.0, np.arange(1, 8))
+
+
+def test_stereo_chunks_misaligned_to_frames():
+    backend = _Backend()
+    session = _session(backend, channels=2)
+    frames = np.array([[100, 300], [500, 700], [900, 1100]], dtype="<i2").tobytes()
+
+    for i in range(0, len(frames), 5):
+        session.append(frames[i:i + 5])
+    np.testing.assert_allclose(session.pending * 32768.0, [200, 600, 1000])
+
+
+def test_priority_reaches_vad_and_decode():
+    backend = _Backend()
+    session = _session(backend)
+    session.append(np.ones(1600, dtype="<i2").tobytes())
+
+    result = asyncio.run(session.finalize())
+    assert result["success"] and result["text"] == "好"
+    assert backend.vad_priorities == ["interactive"]
+    assert [opts["priority"] for _, opts in backend.transcribed] == ["interactive"]
+
+
+def test_manager_commands():
+    from asr_sessions import SessionManager
+
+    async def main():
+        manager = SessionManager(_Backend, max_sessions=1)
+        created = await manager.handle("create", options={"priority": "interactive"})
+        session_id = created["session_id"]
+        assert (await manager.handle("create"))["type"] == "session_limit"
+
+        status = await manager.handle("append", session_id=session_id, data=np.ones(800, dtype="<i2").tobytes())
+        assert status["success"] and status["received_seconds"] == 0.05
+        result = await manager.handle("finalize", session_id=session_id)
+        assert result["success"] and result["text"] == "好"
+        # finalize后会话已删除
+        assert (await manager.handle("status", session_id=session_id))["type"] == "not_found"
+
+    asyncio.run(main())
+
+
+def test_session_shared_across_workers_via_model_host():
+    import socket
+    import threading
+
+    from funasr_gpu import FunASRServer
+    from worker_client import FunASRWorkerClient
+
+    backend = _Backend()
+    host = FunASRServer()
+    host.detect_segments = backend.detect_segments
+    host.transcribe_audio = backend.transcribe_audio
+
+    clients = []
+    for _ in range(2):
+        host_sock, client_sock = socket.socketpair()
+        threading.Thread(target=host._serve_framed,
+                         args=(host_sock.makefile("rb"), host_sock.makefile("wb"), {"success": True}),
+                         kwargs={"owns_process": False}, daemon=True).start()
+        client = FunASRWorkerClient(client_sock.makefile("rb"), client_sock.makefile("wb"),
+                                    ring_size=64 * 1024, sock=client_sock)
+        client.wait_ready(5)
+        clients.append(client)
+
+    try:
+        first, second = clients
+        session_id = first.session_command("create", options={"use_punc": False})["session_id"]
+        data = np.arange(1, 1601, dtype="<i2").tobytes()
+        # 分块落到不同的worker上，且在采样点中间切开
+        assert first.session_command("append", session_id=session_id, data=data[:1001])["success"]
+        status = second.session_command("append", session_id=session_id, data=data[1001:])
+        assert status["received_seconds"] == 0.1
+
+        result = second.session_command("finalize", session_id=session_id)
+        assert result["success"] and result["text"] == "好"
+        np.testing.assert_allclose(backend.transcribed[0][0] * 32768.0, np.arange(1, 1601))
+        assert first.session_command("status", session_id=session_id)["type"] == "not_found"
+    finally:
+        for client in clients:
+            client.close(timeout=1)
+
+
+def test_session_endpoints(monkeypatch):
+    import types
+
+    from fastapi.testclient import TestClient
+
+    import server
+    from asr_sessions import SessionManager
+
+    monkeypatch.setattr(server, "funasr_server", types.SimpleNamespace(initialized=True))
+    monkeypatch.setattr(server, "asr_sessions", SessionManager(_Backend))
+    client = TestClient(server.app)
+
+    session_id = client.post("/api/asr/sessions", json={"use_punc": False}).json()["session_id"]
+    response = client.post(f"/api/asr/sessions/{session_id}/chunks", content=np.ones(1600, dtype="<i2").tobytes())
+    assert response.status_code == 200 and response.json()["chunks"] == 1
+    assert client.get(f"/api/asr/sessions/{session_id}").json()["received_seconds"] == 0.1
+
+    response = client.post(f"/api/asr/sessions/{session_id}/finalize")
+    assert response.status_code == 200 and response.json()["text"] == "好"
+    assert client.get(f"/api/asr/sessions/{session_id}").status_code == 404
+    assert client.delete("/api/asr/sessions/missing").status_code == 404
+
+
+class _FlakyBackend(_Backend):
+    """前failures次转录失败"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def transcribe_audio(self, audio, options=None):
+        if self.failures > 0:
+            self.failures -= 1
+            return {"success": False, "error": "CUDA error"}
+        return super().transcribe_audio(audio, options)
+
+
+def test_transient_decode_failure_is_retried():
+    backend = _FlakyBackend(failures=1)
+    session = _session(backend, max_retries=2)
+    session.append(np.ones(1600, dtype="<i2").tobytes())
+
+    result = asyncio.run(session.finalize())
+    assert result["success"] and result["text"] == "好"
+    assert session.error is None and session.failures == 0
+
+
+def test_session_fails_after_retries_and_rejects_chunks():
+    from asr_sessions import SessionManager
+
+    async def main():
+        manager = SessionManager(lambda: _FlakyBackend(failures=100))
+        session_id = (await manager.handle("create", scan_step_s=0.1, max_segment_s=0.05, max_retries=1))["session_id"]
+        session = manager.get(session_id)
+        chunk = np.ones(1600, dtype="<i2").tobytes()
+
+        for _ in range(2):
+            assert (await manager.handle("append", session_id=session_id, data=chunk))["success"]
+            await session._task
+        # 连续失败超过重试次数：缓冲区释放，之后的分块返回错误
+        assert session.failed and session.pending.size == 0
+        result = await manager.handle("append", session_id=session_id, data=chunk)
+        assert result["type"] == "session_failed" and "CUDA error" in result["error"]
+        assert (await manager.handle("finalize", session_id=session_id))["type"] == "transcription_error"
+
+    asyncio.run(main())
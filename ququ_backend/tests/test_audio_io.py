@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""原始PCM解析"""
+
+import numpy as np
+import pytest
+
+from audio_io import pcm_bytes_to_array, pcm_frame_size
+
+
+def test_frame_size():
+    assert pcm_frame_size("s16le", 1) == 2
+    assert pcm_frame_size("s32le", 2) == 8
+    with pytest.raises(ValueError):
+        pcm_frame_size("u8", 1)
+
+
+def test_s16le_scaling():
+    data = np.array([0, 16384, -32768], dtype="<i2").tobytes()
+    np.testing.assert_allclose(pcm_bytes_to_array(data), [0.0, 0.5, -1.0])
+
+
+def test_trailing_partial_frame_is_ignored():
+    data = np.array([100, 200], dtype="<i2").tobytes()
+    assert len(pcm_bytes_to_array(data + b"\x01")) == 2
+    # 立体声：不足一帧（两个声道）的尾部也不参与解析
+    stereo = np.array([1000, 3000, 5000], dtype="<i2").tobytes()
+    samples = pcm_bytes_to_array(stereo, "s16le", 2)
+    np.testing.assert_allclose(samples, [2000 / 32768.0])
+
+
+def test_f32le_passthrough():
+    values = np.array([0.25, -0.75], dtype="<f4")
+    np.testing.assert_array_equal(pcm_bytes_to_array(values.tobytes(), "f32le"), values)
+
+
+def test_iter_audio_windows_array():
+    from audio_io import iter_audio_windows
+
+    audio = np.arange(25, dtype=np.float32)
+    windows = list(iter_audio_windows(audio, window_s=1.0, sample_rate=10, target_sr=10))
+    assert [len(w) for w, _ in windows] == [10, 10, 5]
+    assert [last for _, last in windows] == [False, False, True]
+    np.testing.assert_array_equal(np.concatenate([w for w, _ in windows]), audio)
+
+
+def test_iter_audio_windows_wav_file(tmp_path):
+    import wave
+
+    from audio_io import iter_audio_windows, probe_duration
+
+    samples = (np.arange(40000) % 100).astype("<i2")
+    path = tmp_path / "stereo.wav"
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(16000)
+        f.writeframes(np.repeat(samples, 2).tobytes())
+
+    assert probe_duration(str(path)) == 2.5
+    windows = list(iter_audio_windows(str(path), window_s=1.0))
+    assert [len(w) for w, _ in windows] == [16000, 16000, 8000]
+    assert windows[-1][1] and not windows[0][1]
+    np.testing.assert_allclose(np.concatenate([w for w, _ in windows]) * 32768.0, samples)
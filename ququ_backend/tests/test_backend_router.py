@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""GPU繁忙时溢出到CPU后端"""
+
+import types
+
+from backend_router import OverflowRouter
+
+
+def _backend(name, initialized=True):
+    return types.SimpleNamespace(name=name, initialized=initialized)
+
+
+def test_overflow_only_when_primary_is_full():
+    router = OverflowRouter(_backend("gpu"), _backend("cpu"), primary_max_inflight=1, overflow_max_inflight=1)
+    with router.route() as first:
+        assert first.name == "gpu"
+        with router.route() as second:
+            assert second.name == "cpu"
+            # 两个后端都满时仍排给主后端
+            with router.route() as third:
+                assert third.name == "gpu"
+    assert router.get_stats()["inflight"] == {"primary": 0, "overflow": 0}
+    assert router.get_stats()["routed"] == {"primary": 2, "overflow": 1}
+
+
+def test_overflow_not_used_until_initialized():
+    router = OverflowRouter(_backend("gpu"), _backend("cpu", initialized=False), primary_max_inflight=1)
+    with router.route():
+        with router.route() as second:
+            assert second.name == "gpu"
+    assert not router.get_stats()["overflow_ready"]
+
+
+def test_detect_segments_passes_priority():
+    calls = []
+    primary = _backend("gpu")
+    primary.detect_segments = lambda samples, sample_rate, priority: calls.append(priority) or []
+    OverflowRouter(primary).detect_segments([0.0], 16000, priority="interactive")
+    assert calls == ["interactive"]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""后台初始化：进度阶段、失败状态、健康检查中的进度"""
+
+import asyncio
+import threading
+import types
+
+import pytest
+from fastapi.testclient import TestClient
+
+from funasr_gpu import FunASRServer
+
+
+@pytest.fixture
+def funasr(monkeypatch):
+    monkeypatch.setenv("FUNASR_PRELOAD_MODELS", "asr")
+    monkeypatch.setenv("FUNASR_WARMUP", "0")
+    s = FunASRServer()
+    s.imports = []
+    s._import_dependencies = lambda: s.imports.append(True)
+    s._model_loaders = {name: (attr, lambda attr=attr: setattr(s, attr, types.SimpleNamespace()) or True)
+                        for name, (attr, _) in s._model_loaders.items()}
+    s.memory_manager = types.SimpleNamespace(start=lambda: None, release=lambda reason=None: None)
+    return s
+
+
+def test_initialize_reports_progress(funasr):
+    assert funasr.get_init_progress()["stage"] == "pending"
+    result = funasr.initialize()
+    assert result["success"] and result["ready"]
+
+    progress = funasr.get_init_progress()
+    assert progress["stage"] == "ready" and progress["error"] is None
+    assert progress["models"] == {"asr": "loaded", "vad": "pending", "punc": "pending"}
+    assert progress["elapsed"] >= 0
+
+
+def test_concurrent_initialize_runs_once(funasr):
+    threads = [threading.Thread(target=funasr.initialize) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert funasr.imports == [True]
+
+
+def test_failed_initialize_sets_failed_stage(funasr):
+    def missing():
+        raise ImportError("no module named funasr")
+
+    funasr._import_dependencies = missing
+    result = funasr.initialize()
+    assert result["type"] == "import_error"
+    progress = funasr.get_init_progress()
+    assert progress["stage"] == "failed" and progress["error"] == result["error"]
+
+
+def test_background_init_and_health(monkeypatch, funasr):
+    import server
+
+    monkeypatch.delenv("MODEL_HOST_SOCKET", raising=False)
+    monkeypatch.setattr(server, "funasr_server", funasr)
+    monkeypatch.setattr(server, "cpu_funasr_server", None)
+    monkeypatch.setattr(server, "ollama_client", types.SimpleNamespace(base_url="http://ollama"))
+    monkeypatch.setattr(server, "_startup_state", dict(server._startup_state, stage="starting",
+                                                       finished_at=None, error=None))
+
+    async def check_now(name):
+        return {"success": True}
+
+    monkeypatch.setattr(server.health_monitor, "check_now", check_now)
+
+    # 初始化完成前端口已可用，健康检查返回进度
+    client = TestClient(server.app)
+    initialization = client.get("/api/health").json()["initialization"]
+    assert initialization["stage"] == "starting"
+    assert initialization["funasr"]["stage"] == "pending"
+
+    asyncio.run(server._initialize_in_background())
+    initialization = client.get("/api/health").json()["initialization"]
+    assert initialization["stage"] == "ready"
+    assert initialization["funasr"]["stage"] == "ready"
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""客户端断开后的取消：令牌、调度器、SSE宽限期、端点装饰器"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException, Request
+
+from cancellation import CancelToken, InferenceCancelled, cancel_scope, current_token, use_token
+from inference_scheduler import InferenceScheduler
+from sse_store import StreamStore
+
+
+def test_token_callbacks_and_check():
+    token = CancelToken()
+    calls = []
+    token.add_callback(lambda: calls.append("a"))
+    removed = lambda: calls.append("removed")
+    token.add_callback(removed)
+    token.remove_callback(removed)
+    token.check()
+
+    token.cancel("gone")
+    token.cancel("again")
+    assert calls == ["a"] and token.reason == "gone"
+    # 已取消时注册的回调立即执行
+    token.add_callback(lambda: calls.append("late"))
+    assert calls == ["a", "late"]
+    with pytest.raises(InferenceCancelled, match="gone"):
+        token.check()
+
+
+def test_cancel_scope_cancels_token_on_task_cancel():
+    async def main():
+        tokens = []
+
+        async def work():
+            with cancel_scope("abandoned") as token:
+                tokens.append(token)
+                await asyncio.sleep(10)
+
+        task = asyncio.ensure_future(work())
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert tokens[0].cancelled and tokens[0].reason == "abandoned"
+        assert current_token() is None
+
+    asyncio.run(main())
+
+
+def test_scheduler_drops_cancelled_waiter():
+    scheduler = InferenceScheduler()
+    token = CancelToken()
+    outcome = []
+
+    def wait():
+        with use_token(token):
+            try:
+                with scheduler.slot("batch"):
+                    outcome.append("ran")
+            except InferenceCancelled:
+                outcome.append("cancelled")
+
+    with scheduler.slot("interactive"):
+        thread = threading.Thread(target=wait)
+        thread.start()
+        while scheduler.get_stats()["waiting"]["batch"] == 0:
+            time.sleep(0.005)
+        token.cancel("client gone")
+        thread.join(5)
+
+    assert outcome == ["cancelled"]
+    stats = scheduler.get_stats()
+    assert stats["cancelled"]["batch"] == 1
+    assert stats["waiting"]["batch"] == 0
+
+
+async def _slow_events(count):
+    for n in range(count):
+        await asyncio.sleep(0.05)
+        yield f"data: {n}\n\n"
+
+
+def test_stream_cancelled_after_grace_without_subscribers():
+    async def main():
+        store = StreamStore(cancel_grace=0.02)
+        job = store.start(_slow_events(100))
+        subscription = store.subscribe(job)
+        await subscription.__anext__()
+        await subscription.aclose()
+
+        await asyncio.wait_for(asyncio.gather(job.task, return_exceptions=True), 1)
+        assert job.task.cancelled() and job.done
+        assert '"type": "cancelled"' in job.events[-1][1]
+
+    asyncio.run(main())
+
+
+def test_reconnect_within_grace_keeps_stream_running():
+    async def main():
+        store = StreamStore(cancel_grace=0.1)
+        job = store.start(_slow_events(4))
+        first = store.subscribe(job)
+        await first.__anext__()
+        await first.aclose()
+
+        await asyncio.sleep(0.02)
+        chunks = [chunk async for chunk in store.subscribe(job, after=1, resumed=True)]
+        assert not job.task.cancelled()
+        assert chunks[-1].endswith("data: 3\n\n")
+
+    asyncio.run(main())
+
+
+def _request(disconnect_after):
+    """请求体已送达，disconnect_after秒后客户端断开"""
+    started = time.monotonic()
+    sent = []
+
+    async def receive():
+        if not sent:
+            sent.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        if time.monotonic() - started >= disconnect_after:
+            return {"type": "http.disconnect"}
+        # is_disconnected在已取消的作用域中等待，这里不能挂起
+        return {}
+
+    scope = {"type": "http", "method": "POST", "path": "/api/test", "headers": [], "query_string": b""}
+    return Request(scope, receive)
+
+
+def test_cancel_on_disconnect(monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "DISCONNECT_POLL_INTERVAL", 0.01)
+    cancelled = []
+
+    @server.cancel_on_disconnect
+    async def endpoint(request: Request):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    @server.cancel_on_disconnect
+    async def quick(request: Request):
+        return {"success": True}
+
+    async def main():
+        with pytest.raises(HTTPException) as exc:
+            await endpoint(request=_request(0.03))
+        assert exc.value.status_code == 499
+        assert cancelled == [True]
+        assert await quick(request=_request(10)) == {"success": True}
+
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""调试接口的令牌认证"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture
+def client():
+    # 不进入lifespan：调试接口不依赖模型和Ollama
+    return TestClient(server.app)
+
+
+def test_traces_disabled_without_debug_token(client, monkeypatch):
+    monkeypatch.delenv("DEBUG_TOKEN", raising=False)
+    assert client.get("/debug/traces").status_code == 404
+
+
+def test_traces_require_valid_token(client, monkeypatch):
+    monkeypatch.setenv("DEBUG_TOKEN", "secret")
+    assert client.get("/debug/traces").status_code == 401
+    assert client.get("/debug/traces", headers={"X-Debug-Token": "wrong"}).status_code == 401
+
+    response = client.get("/debug/traces", headers={"X-Debug-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json()["success"]
+
+
+def test_token_accepted_only_from_headers(client, monkeypatch):
+    monkeypatch.setenv("DEBUG_TOKEN", "secret")
+    assert client.get("/debug/profile/requests?token=secret").status_code == 401
+    response = client.get("/debug/profile/requests", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+
+
+def test_debug_token_valid(monkeypatch):
+    from profiler import debug_token_valid
+
+    monkeypatch.delenv("DEBUG_TOKEN", raising=False)
+    assert debug_token_valid({"x-debug-token": "secret"}) is None
+
+    monkeypatch.setenv("DEBUG_TOKEN", "secret")
+    assert debug_token_valid({"x-debug-token": "secret"}) is True
+    assert debug_token_valid({"authorization": "bearer secret"}) is True
+    assert debug_token_valid({"x-debug-token": "secre"}) is False
+    assert debug_token_valid({"x-debug-token": "密钥"}) is False
+    assert debug_token_valid({}) is False
+
+
+def test_debug_results_name_the_worker(client, monkeypatch):
+    import os
+
+    monkeypatch.setenv("DEBUG_TOKEN", "secret")
+    headers = {"X-Debug-Token": "secret"}
+    # 追踪和剖析结果属于各自的worker进程，响应中给出PID
+    assert client.get("/debug/traces", headers=headers).json()["pid"] == os.getpid()
+    assert client.get("/debug/profile/requests", headers=headers).json()["pid"] == os.getpid()
+
+    response = client.get("/api/hotwords", headers={**headers, "X-Profile": "1"})
+    assert response.headers["X-Profile"].startswith("/debug/profile/requests/")
+    assert response.headers["X-Worker-PID"] == str(os.getpid())
+
+    response = client.get("/debug/profile/requests/missing", headers=headers)
+    assert response.status_code == 404 and str(os.getpid()) in response.json()["detail"]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""GPU可用性由模型进程给出，API进程不导入torch"""
+
+import sys
+import types
+
+from funasr_gpu import FunASRServer
+
+
+def _server():
+    return FunASRServer.__new__(FunASRServer)
+
+
+def test_gpu_info_without_torch(monkeypatch):
+    monkeypatch.delitem(sys.modules, "torch", raising=False)
+    assert _server().get_gpu_info() == {"available": False, "torch_loaded": False}
+    assert "torch" not in sys.modules
+
+
+def test_gpu_info_from_loaded_torch(monkeypatch):
+    cuda = types.SimpleNamespace(is_available=lambda: True, device_count=lambda: 2,
+                                 get_device_name=lambda index: "Test GPU")
+    monkeypatch.setitem(sys.modules, "torch", types.SimpleNamespace(cuda=cuda))
+    assert _server().get_gpu_info() == {"available": True, "torch_loaded": True,
+                                        "device_count": 2, "device_name": "Test GPU"}
+
+
+def test_status_reads_gpu_from_funasr_snapshot(monkeypatch):
+    import asyncio
+    import server
+
+    monkeypatch.delitem(sys.modules, "torch", raising=False)
+    monkeypatch.setattr(server.health_monitor, "snapshot",
+                        lambda name: {"gpu": {"available": True}} if name == "funasr" else {})
+    status = asyncio.run(server.get_status())
+    assert status["gpu_available"] is True
+    assert "torch" not in sys.modules
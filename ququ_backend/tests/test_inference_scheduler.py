@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""推理调度：优先级类别、短作业优先、老化"""
+
+import threading
+import time
+
+from inference_scheduler import InferenceScheduler
+
+
+def _wait_for_waiters(scheduler, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while sum(scheduler.get_stats()["waiting"].values()) < count:
+        assert time.monotonic() < deadline, "等待者未全部入队"
+        time.sleep(0.005)
+
+
+def _run_queued(scheduler, requests, before_release=None):
+    """先占住执行权，让requests全部排队后再放行，返回执行顺序"""
+    order = []
+    threads = []
+    with scheduler.slot("interactive"):
+        for name, priority, expected in requests:
+            def run(name=name, priority=priority, expected=expected):
+                with scheduler.slot(priority, expected):
+                    order.append(name)
+
+            thread = threading.Thread(target=run)
+            thread.start()
+            threads.append(thread)
+            # 逐个入队，保证序号与列表顺序一致
+            _wait_for_waiters(scheduler, len(threads))
+        if before_release is not None:
+            before_release()
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def test_priority_class_then_shortest_first():
+    scheduler = InferenceScheduler(aging_seconds=600)
+    order = _run_queued(scheduler, [
+        ("batch", "batch", 1.0),
+        ("normal-long", "normal", 30.0),
+        ("normal-short", "normal", 2.0),
+        ("interactive", "interactive", 5.0),
+        ("unknown", "bogus", 1.0),  # 未知类别按normal处理
+    ])
+    assert order == ["interactive", "unknown", "normal-short", "normal-long", "batch"]
+
+
+def test_same_class_and_duration_is_fifo():
+    scheduler = InferenceScheduler(aging_seconds=600)
+    order = _run_queued(scheduler, [(str(i), "normal", 1.0) for i in range(4)])
+    assert order == ["0", "1", "2", "3"]
+
+
+def test_aging_promotes_long_waiting_batch():
+    scheduler = InferenceScheduler(aging_seconds=10)
+
+    def age_batch():
+        # 让batch等待者看起来已等待25秒：提升两级，与interactive同级且序号更小
+        with scheduler._cond:
+            for waiter in scheduler._waiters:
+                if waiter.rank == 2:
+                    waiter.enqueued -= 25
+
+    order = _run_queued(scheduler, [
+        ("batch", "batch", 1.0),
+        ("interactive", "interactive", 1.0),
+    ], before_release=age_batch)
+    assert order == ["batch", "interactive"]
+
+
+def test_stats_count_grants():
+    scheduler = InferenceScheduler()
+    with scheduler.slot("batch"):
+        assert scheduler.get_stats()["busy"]
+    stats = scheduler.get_stats()
+    assert not stats["busy"]
+    assert stats["granted"]["batch"] == 1
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""帧协议与共享内存音频环形缓冲区"""
+
+import io
+import struct
+
+import numpy as np
+import pytest
+
+from ipc_protocol import FRAME_HEADER, FrameError, encode_frame, read_frame, write_frame
+from shm_audio import SharedAudioRing, attach_audio
+
+
+def test_frames_round_trip_in_order():
+    stream = io.BytesIO()
+    write_frame(stream, 1, {"action": "transcribe", "text": "你好"})
+    write_frame(stream, 7, {})
+    stream.seek(0)
+
+    assert read_frame(stream) == (1, {"action": "transcribe", "text": "你好"})
+    assert read_frame(stream) == (7, {})
+    assert read_frame(stream) is None
+
+
+def test_stream_ending_inside_frame_is_an_error():
+    data = encode_frame(3, {"action": "status"})
+    with pytest.raises(FrameError):
+        read_frame(io.BytesIO(data[:-2]))
+    with pytest.raises(FrameError):
+        read_frame(io.BytesIO(data[:FRAME_HEADER.size - 1]))
+
+
+def test_oversized_and_invalid_frames_are_rejected():
+    with pytest.raises(FrameError):
+        read_frame(io.BytesIO(struct.pack("!II", 1 << 30, 1)))
+    body = b"{not json"
+    with pytest.raises(FrameError):
+        read_frame(io.BytesIO(FRAME_HEADER.pack(len(body), 1) + body))
+
+
+def test_ring_passes_audio_without_copy_through_reference():
+    ring = SharedAudioRing(1024 * 1024)
+    try:
+        samples = np.linspace(-1, 1, 16000, dtype=np.float32)
+        ref = ring.write(samples, 16000)
+        assert ref["sample_rate"] == 16000
+        np.testing.assert_array_equal(attach_audio(ref), samples)
+        ring.release(ref)
+    finally:
+        ring.close()
+
+
+def test_ring_reports_full_until_blocks_are_released():
+    ring = SharedAudioRing(64 * 1024)
+    try:
+        block = np.zeros(6000, dtype=np.float32)  # 24000字节
+        first = ring.write(block, 16000)
+        ring.write(block, 16000)
+        with pytest.raises(BufferError):
+            ring.write(block, 16000)
+        ring.release(first)
+        ring.write(block, 16000)
+    finally:
+        ring.close()
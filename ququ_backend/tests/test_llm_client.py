@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""LLM客户端：截断的回复、停止序列"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from llm_client import OllamaClient
+
+
+@pytest.fixture
+def client():
+    return OllamaClient(base_urls=["http://a:11434", "http://b:11434"], model="qwen2.5:7b")
+
+
+def _response(body):
+    return httpx.Response(200, json=body)
+
+
+def test_parse_response_native(client):
+    backend = client.pool.backends[0]
+    ok = _response({"message": {"content": " 你好。 "}, "done_reason": "stop"})
+    assert OllamaClient._parse_response(backend, ok, native=True) == {"success": True, "content": "你好。"}
+
+    cut = _response({"message": {"content": "你好"}, "done_reason": "length"})
+    assert OllamaClient._parse_response(backend, cut, native=True) == {
+        "success": False, "error": "truncated", "type": "truncated"}
+
+
+def test_parse_response_openai(client):
+    backend = client.pool.backends[0]
+    cut = _response({"choices": [{"message": {"content": "hello"}, "finish_reason": "length"}]})
+    result = OllamaClient._parse_response(backend, cut, native=False)
+    assert not result["success"] and result["error"] == "truncated"
+
+
+def test_truncation_is_not_retried_or_counted_as_failure(client):
+    calls = []
+
+    async def request_chat(backend, payload, deadline=None):
+        calls.append(backend)
+        return {"success": False, "error": "truncated", "type": "truncated"}
+
+    client._request_chat = request_chat
+    result = asyncio.run(client._post_chat({"messages": [], "temperature": 0.3, "num_predict": 8, "stop": []}))
+
+    assert result["type"] == "truncated"
+    assert len(calls) == 1
+    assert calls[0].consecutive_failures == 0 and calls[0].healthy
+
+
+def _capture_chat(client, result):
+    captured = {}
+
+    async def chat(**kwargs):
+        captured.update(kwargs)
+        return result
+
+    client._chat = chat
+    return captured
+
+
+def test_generic_optimize_keeps_paragraphs(client):
+    captured = _capture_chat(client, {"success": True, "content": "第一段。\n\n第二段。"})
+    result = asyncio.run(client.optimize_text("第一段\n\n第二段"))
+    assert captured["stop"] is None
+    assert result["optimized_text"] == "第一段。\n\n第二段。"
+
+
+def test_asr_post_processing_stops_at_paragraph(client):
+    captured = _capture_chat(client, {"success": True, "content": "你好。"})
+    asyncio.run(client.optimize_text("你好", single_utterance=True))
+    assert captured["stop"] == ["\n\n"]
+
+    # 自定义提示词的输出格式未知，不加停止序列
+    asyncio.run(client.optimize_text("你好", mode="custom", custom_prompt="改写", single_utterance=True))
+    assert captured["stop"] is None
+
+
+def test_truncated_optimization_falls_back_to_recognized_text(client, monkeypatch):
+    import server
+
+    _capture_chat(client, {"success": False, "error": "truncated", "type": "truncated"})
+    result = asyncio.run(client.optimize_text("你好"))
+    assert not result["success"] and result["original_text"] == "你好"
+
+    monkeypatch.setattr(server, "ollama_client", client)
+    assert asyncio.run(server.optimize_recognized_text("你好", "optimize", "")) == "你好"
+
+
+def test_coalesced_calls_keep_their_own_deadlines(client):
+    import time
+
+    calls = []
+
+    async def post_chat(payload, deadline=None):
+        # 请求需要0.3秒，超过调用方的截止时间则失败
+        calls.append(deadline)
+        duration = 0.3 if deadline is None else min(0.3, deadline - time.monotonic())
+        await asyncio.sleep(max(duration, 0))
+        if duration < 0.3:
+            return {"success": False, "error": "超过请求截止时间", "type": "deadline"}
+        return {"success": True, "content": "好"}
+
+    client._post_chat = post_chat
+
+    async def main():
+        messages = [{"role": "user", "content": "你好"}]
+        # 发起者预算短：合并进来的调用不继承它的截止时间失败，按自己的预算重新执行
+        short, long = await asyncio.gather(client._chat(messages, 8, timeout=0.1),
+                                           client._chat(messages, 8, timeout=2))
+        assert short["type"] == "deadline" and long["success"]
+        assert len(calls) == 2
+
+        # 发起者预算长：合并进来的调用按自己的截止时间返回，不等到执行结束
+        started = time.monotonic()
+        long_task = asyncio.ensure_future(client._chat(messages, 8, timeout=2))
+        await asyncio.sleep(0.01)
+        short = await client._chat(messages, 8, timeout=0.1)
+        assert short["type"] == "deadline" and time.monotonic() - started < 0.25
+        assert (await long_task)["success"] and len(calls) == 3
+
+    asyncio.run(main())
+
+
+def test_reasoning_model_gets_reasoning_budget(client):
+    reasoning = OllamaClient(base_urls=["http://a:11434"], model="gpt-oss:20b")
+    payload = {"messages": [], "temperature": 0.3, "num_predict": reasoning._predict_limit("你好", 512), "stop": []}
+
+    # 推理token计入输出上限：在按输入长度估计的上限之外另加推理预算
+    assert client._predict_limit("你好", 512) == 35
+    assert payload["num_predict"] == 35 + 1024
+    assert reasoning._native_payload(payload)["think"] == "low"
+    assert reasoning._openai_payload(payload)["reasoning_effort"] == "low"
+
+    assert client._native_payload(payload)["think"] is False
+    assert "reasoning_effort" not in client._openai_payload(payload)
+
+
+def test_reasoning_models_are_configurable(monkeypatch):
+    monkeypatch.setenv("OLLAMA_REASONING_MODELS", "gpt-oss,magistral")
+    monkeypatch.setenv("OLLAMA_REASONING_TOKENS", "2048")
+    assert OllamaClient(base_urls=["http://a:11434"], model="magistral:24b")._predict_limit("你好", 512) == 35 + 2048
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""LLM并发控制：名额上限、优先级、排队超时和队列上限"""
+
+import asyncio
+
+import pytest
+
+from llm_governor import LLMBusyError, LLMGovernor
+
+
+async def _hold(governor, priority, order, release):
+    async with governor.slot(priority):
+        order.append(priority)
+        await release.wait()
+
+
+def test_waiters_are_served_by_priority():
+    async def main():
+        governor = LLMGovernor(max_inflight=1, queue_timeout=5)
+        order = []
+        release = asyncio.Event()
+        release.set()
+
+        async with governor.slot("interactive"):
+            tasks = [asyncio.ensure_future(_hold(governor, p, order, release))
+                     for p in ("batch", "normal", "interactive")]
+            await asyncio.sleep(0.01)
+            assert governor.get_stats()["waiting"] == 3
+        await asyncio.gather(*tasks)
+
+        assert order == ["interactive", "normal", "batch"]
+        assert governor.get_stats()["inflight"] == 0
+
+    asyncio.run(main())
+
+
+def test_queue_timeout_and_full_queue():
+    async def main():
+        governor = LLMGovernor(max_inflight=1, queue_timeout=5, max_queue=1)
+        async with governor.slot():
+            with pytest.raises(LLMBusyError) as exc:
+                async with governor.slot(timeout=0.01):
+                    pass
+            assert exc.value.reason == "timeout"
+
+            waiter = asyncio.ensure_future(governor.slot().__aenter__())
+            await asyncio.sleep(0)
+            with pytest.raises(LLMBusyError) as exc:
+                async with governor.slot():
+                    pass
+            assert exc.value.reason == "queue_full"
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+
+        stats = governor.get_stats()
+        assert stats["inflight"] == 0 and stats["waiting"] == 0
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def main():
+        governor = LLMGovernor(max_inflight=1, queue_timeout=5)
+        async with governor.slot():
+            waiter = asyncio.ensure_future(governor.slot().__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+
+        # 被取消的等待者不占名额，之后的请求可以立即执行
+        async with governor.slot(timeout=0.01):
+            assert governor.get_stats()["inflight"] == 1
+        assert governor.get_stats()["inflight"] == 0
+
+    asyncio.run(main())
+
+
+def test_limit_is_divided_across_workers(monkeypatch):
+    monkeypatch.setenv("SERVER_WORKERS", "4")
+    governor = LLMGovernor(max_inflight=8)
+    stats = governor.get_stats()
+    assert stats["max_inflight"] == 2
+    assert stats["total_max_inflight"] == 8 and stats["workers"] == 4
+
+    # 上限小于worker数时每个worker仍保留1个名额
+    assert LLMGovernor(max_inflight=2, workers=4).max_inflight == 1
+    assert LLMGovernor(max_inflight=3, workers=1).max_inflight == 3
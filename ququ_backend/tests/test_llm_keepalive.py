@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Ollama模型保活：加载、续期、非Ollama后端跳过、活动窗口"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import llm_keepalive
+from llm_keepalive import ModelKeepAlive
+from llm_pool import LLMBackendPool
+
+
+class FakeOllama:
+    """模拟/api/ps与/api/generate：generate后模型驻留"""
+
+    def __init__(self, resident=False, ollama=True):
+        self.resident = resident
+        self.ollama = ollama
+        self.generates = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if not self.ollama:
+            return httpx.Response(404)
+        if request.url.path == "/api/ps":
+            models = [{"name": "qwen3:8b", "expires_at": "later", "size_vram": 123}] if self.resident else []
+            return httpx.Response(200, json={"models": models})
+        if request.url.path == "/api/generate":
+            self.generates.append(request.content)
+            self.resident = True
+            return httpx.Response(200, json={"done": True})
+        return httpx.Response(404)
+
+
+@pytest.fixture
+def ollama(monkeypatch):
+    fake = FakeOllama()
+    client_cls = httpx.AsyncClient
+    monkeypatch.setattr(
+        llm_keepalive.httpx, "AsyncClient",
+        lambda **kwargs: client_cls(transport=httpx.MockTransport(fake.handler), **kwargs),
+    )
+    return fake
+
+
+def _keepalive(**kwargs):
+    pool = LLMBackendPool(["http://ollama:11434/v1"])
+    return ModelKeepAlive(pool, "qwen3:8b", "10m", **kwargs)
+
+
+def test_loads_evicted_model(ollama):
+    keepalive = _keepalive()
+    backend = keepalive.pool.backends[0]
+    asyncio.run(keepalive.refresh(backend))
+
+    state = keepalive.get_stats()["backends"][0]
+    assert len(ollama.generates) == 1
+    assert state["resident"] is True and state["last_load_at"] is not None
+    assert state["size_vram"] == 123 and state["error"] is None
+
+
+def test_resident_model_is_pinged_not_reloaded(ollama):
+    ollama.resident = True
+    keepalive = _keepalive()
+    asyncio.run(keepalive.refresh(keepalive.pool.backends[0]))
+
+    state = keepalive.get_stats()["backends"][0]
+    assert len(ollama.generates) == 1
+    assert state["last_ping_at"] is not None and state["last_load_at"] is None
+
+
+def test_status_only_refresh_does_not_load(ollama):
+    keepalive = _keepalive()
+    asyncio.run(keepalive.refresh(keepalive.pool.backends[0], ping=False))
+
+    assert ollama.generates == []
+    assert keepalive.get_stats()["backends"][0]["resident"] is False
+
+
+def test_non_ollama_backend_is_skipped(ollama):
+    ollama.ollama = False
+    keepalive = _keepalive()
+    backend = keepalive.pool.backends[0]
+    asyncio.run(keepalive.refresh(backend))
+
+    # /api/ps不存在：认定为OpenAI兼容后端，之后不再检查
+    assert backend.api == "openai"
+    assert keepalive.get_stats()["backends"][0]["resident"] is None
+    ollama.ollama = True
+    asyncio.run(keepalive.refresh(backend))
+    assert ollama.generates == []
+
+
+def test_idle_beyond_activity_window_only_checks_status(ollama, monkeypatch):
+    monkeypatch.setenv("OLLAMA_PRELOAD", "0")
+    keepalive = _keepalive(interval=0.01, activity_window=0.5)
+    keepalive.last_activity = time.monotonic() - 1
+
+    async def main():
+        keepalive.start()
+        await asyncio.sleep(0.05)
+        assert ollama.generates == []
+        # 有新请求后恢复保活
+        keepalive.touch()
+        await asyncio.sleep(0.05)
+        await keepalive.stop()
+
+    asyncio.run(main())
+    assert ollama.generates
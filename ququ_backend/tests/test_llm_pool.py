@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""LLM后端池：选择评分、失败惩罚、模型探测"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import llm_pool
+from llm_pool import LLMBackendPool, model_listed
+
+
+def _pool(n=2, **kwargs):
+    return LLMBackendPool([f"http://host{i}:11434" for i in range(n)], failure_penalty=10, **kwargs)
+
+
+def test_unsampled_backend_uses_pool_median():
+    pool = _pool(3)
+    slow, fast, new = pool.backends
+    for backend, latency in ((slow, 4.0), (fast, 2.0)):
+        pool.begin(backend)
+        pool.end(backend, latency, True)
+
+    assert pool.prior_latency() == pytest.approx(3.0)
+    # 新后端按中位数3秒估计，不再按0秒抢走全部流量
+    assert pool.pick() is fast
+    pool.begin(fast)
+    pool.begin(fast)
+    assert pool.pick() is new
+
+
+def test_failures_raise_score():
+    pool = _pool(2)
+    good, failing = pool.backends
+    pool.begin(good)
+    pool.end(good, 1.0, True)
+    # 立即失败（如连接被拒）不会让后端显得更快
+    pool.begin(failing)
+    pool.end(failing, 0.01, False, "connection refused")
+
+    assert failing.ewma >= 10
+    assert len(failing.latencies) == 0
+    assert pool.pick() is good
+
+
+def test_cancelled_request_is_not_recorded():
+    pool = _pool(1)
+    backend = pool.backends[0]
+    pool.begin(backend)
+    pool.end(backend, 0.5, None)
+    assert backend.outstanding == 0 and backend.ewma is None
+
+
+def test_failure_threshold_marks_unhealthy():
+    pool = LLMBackendPool(["http://a", "http://b"], failure_threshold=2)
+    backend = pool.backends[0]
+    for _ in range(2):
+        pool.begin(backend)
+        pool.end(backend, 0.1, False, "boom")
+    assert not backend.healthy
+    assert pool.pick() is pool.backends[1]
+
+
+def test_model_listed():
+    assert model_listed("qwen2.5:7b", ["qwen2.5:7b"])
+    assert model_listed("qwen2.5", ["qwen2.5:latest"])
+    assert not model_listed("qwen2.5:7b", ["qwen2.5:14b", None])
+
+
+def _mock_models(monkeypatch, models):
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, json={"data": models}))
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(llm_pool.httpx, "AsyncClient",
+                        lambda **kwargs: real_client(transport=transport, **kwargs))
+
+
+def test_probe_requires_configured_model(monkeypatch):
+    _mock_models(monkeypatch, [{"id": "other:7b"}])
+    pool = _pool(1, model="qwen2.5:7b")
+    result = asyncio.run(pool.probe(pool.backends[0]))
+
+    assert not result["success"] and "qwen2.5:7b" in result["error"]
+    assert not pool.backends[0].healthy
+
+
+def test_probe_restores_backend_with_model(monkeypatch):
+    _mock_models(monkeypatch, [{"id": "qwen2.5:7b"}])
+    pool = _pool(1, model="qwen2.5:7b")
+    backend = pool.backends[0]
+    backend.healthy = False
+
+    result = asyncio.run(pool.probe(backend))
+    assert result["success"] and result["models"] == [{"id": "qwen2.5:7b"}]
+    assert backend.healthy
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""日志文件路径"""
+
+import os
+
+from logging_setup import per_process_log_file
+
+
+def test_per_process_log_file():
+    pid = os.getpid()
+    assert per_process_log_file("/tmp/ququ_backend.log") == f"/tmp/ququ_backend.{pid}.log"
+    assert per_process_log_file("/var/log/ququ") == f"/var/log/ququ.{pid}"
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""水位线触发的内存清理"""
+
+import time
+
+from memory_manager import MemoryManager
+
+MB = 1024 ** 2
+
+
+def _sample(rss_mb=100, available_mb=8000, reserved_mb=None, allocated_mb=0):
+    cuda = None
+    if reserved_mb is not None:
+        cuda = {"reserved": reserved_mb * MB, "allocated": allocated_mb * MB, "alloc_retries": 0, "ooms": 0}
+    return {"rss_bytes": rss_mb * MB, "available_bytes": available_mb * MB, "cuda": cuda, "sampled_at": 0}
+
+
+def _manager(**kwargs):
+    options = {"rss_high_mb": 1000, "available_low_mb": 500, "cuda_cached_high_mb": 1000, "cooldown": 60}
+    options.update(kwargs)
+    return MemoryManager(interval=1, **options)
+
+
+def test_pressure_watermarks():
+    manager = _manager()
+    assert manager._pressure(_sample()) == {"host": None, "cuda": None}
+    assert "RSS" in manager._pressure(_sample(rss_mb=2000))["host"]
+    assert "可用内存" in manager._pressure(_sample(available_mb=100))["host"]
+    # 只有保留但未分配的部分计入CUDA缓存
+    assert manager._pressure(_sample(reserved_mb=3000, allocated_mb=2500))["cuda"] is None
+    assert "CUDA缓存" in manager._pressure(_sample(reserved_mb=3000, allocated_mb=500))["cuda"]
+
+
+def test_disabled_watermarks():
+    manager = _manager(rss_high_mb=0, available_low_mb=0, cuda_cached_high_mb=0)
+    assert manager._pressure(_sample(rss_mb=10 ** 6, available_mb=1, reserved_mb=10 ** 6)) == {
+        "host": None, "cuda": None}
+
+
+def test_check_cleans_up_once_per_cooldown(monkeypatch):
+    manager = _manager()
+    releases = []
+    monkeypatch.setattr(manager, "sample", lambda: _sample(available_mb=100))
+
+    def release(host=True, cuda=True, reason="manual"):
+        releases.append((host, cuda))
+        manager._last_cleanup["host"] = time.time()
+        return {"seconds": 0, "rss_freed_mb": 0, "cuda_freed_mb": None}
+
+    monkeypatch.setattr(manager, "release", release)
+    manager.check()
+    manager.check()
+    assert releases == [(True, False)]
+
+
+def test_release_records_cleanup():
+    manager = _manager()
+    info = manager.release(cuda=False, reason="test")
+    assert info["reason"] == "test" and info["gc_collected"] is not None
+    stats = manager.get_stats()
+    assert stats["cleanups"] == {"host": 1, "cuda": 0}
+    assert stats["last_cleanup"]["reason"] == "test"
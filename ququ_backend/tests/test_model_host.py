@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""模型宿主的帧协议主循环：控制命令、取消、断线重连、宿主重启"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from funasr_gpu import FunASRServer
+from inference_scheduler import InferenceScheduler
+from cancellation import InferenceCancelled, current_token
+from worker_client import FunASRWorkerClient, ModelHostTimeout
+
+
+class _Host:
+    """不加载模型的FunASRServer：transcribe在调度器上等待，可由测试放行"""
+
+    def __init__(self, monkeypatch, worker_threads="1"):
+        monkeypatch.setenv("FUNASR_WORKER_THREADS", worker_threads)
+        self.server = FunASRServer.__new__(FunASRServer)
+        self.server.running = True
+        self.server.scheduler = InferenceScheduler()
+        self.server.handle_command = self.handle_command
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.cancelled = threading.Event()
+
+        host_sock, client_sock = socket.socketpair()
+        self._socks = (host_sock, client_sock)
+        threading.Thread(
+            target=self.server._serve_framed,
+            args=(host_sock.makefile("rb"), host_sock.makefile("wb"), {"success": True}),
+            daemon=True,
+        ).start()
+        self.client = FunASRWorkerClient(client_sock.makefile("rb"), client_sock.makefile("wb"),
+                                         ring_size=64 * 1024, sock=client_sock)
+        self.client.wait_ready(5)
+
+    def handle_command(self, command):
+        action = command.get("action")
+        if action == "block":
+            token = current_token()
+            if token is not None:
+                token.add_callback(self.cancelled.set)
+            self.started.set()
+            self.release.wait(5)
+            return {"success": True}
+        if action == "transcribe":
+            try:
+                with self.server.scheduler.slot("interactive"):
+                    return {"success": True, "text": "ok"}
+            except InferenceCancelled as e:
+                return {"success": False, "error": str(e), "type": "cancelled"}
+        return {"success": True, "action": action}
+
+    def close(self):
+        self.release.set()
+        self.client.close()
+        for s in self._socks:
+            s.close()
+
+
+@pytest.fixture
+def host(monkeypatch):
+    h = _Host(monkeypatch)
+    yield h
+    h.close()
+
+
+def test_control_commands_are_not_queued_behind_inference(host):
+    blocked = host.client.submit({"action": "block"})
+    assert host.started.wait(5)
+
+    # 唯一的推理线程被占用，状态查询仍然立即返回
+    assert host.client.call({"action": "status"}, timeout=2) == {"success": True, "action": "status"}
+    assert not blocked.done()
+
+    host.release.set()
+    assert blocked.result(timeout=5)["success"]
+
+
+def test_call_times_out_and_cancels_on_host(host):
+    with pytest.raises(ModelHostTimeout, match="block"):
+        host.client.call({"action": "block"}, timeout=0.2)
+    assert host.cancelled.wait(5)
+
+    # 超时的请求不影响之后的调用
+    host.release.set()
+    assert host.client.call({"action": "status"}, timeout=2)["success"]
+
+
+def test_cancel_reaches_queued_inference_on_host(host):
+    from cancellation import CancelToken, use_token
+
+    token = CancelToken()
+    # 测试线程占住宿主的执行权，transcribe在调度器中排队
+    with host.server.scheduler.slot("interactive"):
+        with use_token(token):
+            future = host.client.submit({"action": "transcribe"})
+        while host.server.scheduler.get_stats()["waiting"]["interactive"] == 0:
+            time.sleep(0.005)
+        token.cancel("client gone")
+        result = future.result(timeout=5)
+
+    assert result["type"] == "cancelled"
+    assert host.server.scheduler.get_stats()["cancelled"]["interactive"] == 1
+
+
+def _listen(path, conns):
+    """模拟模型宿主：接受连接后服务帧协议，conns记录宿主一侧的套接字"""
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(4)
+    server = FunASRServer.__new__(FunASRServer)
+    server.running = True
+    server.scheduler = InferenceScheduler()
+    server.handle_command = lambda command: {"success": True, "action": command.get("action")}
+
+    def accept():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            conns.append(conn)
+            threading.Thread(target=server._serve_framed,
+                             args=(conn.makefile("rb"), conn.makefile("wb"), {"success": True}),
+                             kwargs={"owns_process": False}, daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return listener
+
+
+def test_client_reconnects_after_host_restart(monkeypatch):
+    import tempfile
+
+    import worker_client
+
+    monkeypatch.setattr(worker_client, "RECONNECT_INTERVAL", 0.01)
+    path = tempfile.mkdtemp(dir="/tmp") + "/host.sock"
+    conns = []
+    listener = _listen(path, conns)
+    client = FunASRWorkerClient.connect(path, timeout=5, ring_size=64 * 1024)
+    try:
+        client.wait_ready(5)
+        assert client.initialized
+
+        # 宿主进程退出：连接断开，客户端不可用
+        conns[0].shutdown(socket.SHUT_RDWR)
+        deadline = time.monotonic() + 5
+        while client.reconnects == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # 新宿主接受了重连，收到初始化结果后恢复可用
+        while not client.initialized and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert client.reconnects == 1 and len(conns) == 2
+        assert client.call({"action": "status"}, timeout=2) == {"success": True, "action": "status"}
+    finally:
+        client.close(timeout=1)
+        listener.close()
+
+
+class _Process:
+    def __init__(self, alive):
+        self.alive = alive
+        self.pid = 0
+        self.returncode = None if alive else -9
+        self.terminated = False
+
+    def poll(self):
+        return None if self.alive else self.returncode
+
+    def terminate(self):
+        self.terminated = True
+        self.alive = False
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+
+def test_supervisor_restarts_crashed_host_then_gives_up(monkeypatch):
+    import server
+
+    monkeypatch.setenv("MODEL_HOST_MAX_RESTARTS", "2")
+    monkeypatch.setenv("MODEL_HOST_RESTART_DELAY", "0")
+    spawned, gave_up = [], []
+
+    def spawn(path):
+        spawned.append(_Process(alive=False))
+        return spawned[-1]
+
+    server.supervise_model_host("/tmp/x.sock", threading.Event(), lambda: gave_up.append(True),
+                                spawn=spawn, poll_interval=0.01)
+    assert len(spawned) == 3 and gave_up == [True]
+
+
+def test_supervisor_stops_host_on_shutdown(monkeypatch):
+    import server
+
+    stop = threading.Event()
+    spawned = []
+
+    def spawn(path):
+        spawned.append(_Process(alive=True))
+        return spawned[-1]
+
+    supervisor = threading.Thread(target=server.supervise_model_host, args=("/tmp/x.sock", stop, lambda: None),
+                                  kwargs={"spawn": spawn, "poll_interval": 0.01})
+    supervisor.start()
+    time.sleep(0.05)
+    stop.set()
+    supervisor.join(5)
+    assert len(spawned) == 1 and spawned[0].terminated
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""按模型懒加载、手动卸载和空闲回收"""
+
+import threading
+import time
+import types
+
+import pytest
+
+from funasr_gpu import FunASRServer
+
+
+def _fake_loader(server, name, attr):
+    def load():
+        if name in server.broken:
+            return False
+        server.created.append(name)
+        setattr(server, attr, types.SimpleNamespace(name=name))
+        return True
+
+    return load
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv("FUNASR_MODEL_IDLE_TTL", "0")
+    s = FunASRServer()
+    s.created = []
+    s.broken = set()
+    s.releases = []
+    s._model_loaders = {name: (attr, _fake_loader(s, name, attr))
+                        for name, (attr, _) in s._model_loaders.items()}
+    s._release_memory = lambda: s.releases.append(True)
+    return s
+
+
+def test_model_loaded_on_first_use_only(server):
+    assert server.asr_model is None
+    model = server._ensure_model("asr")
+    assert server._ensure_model("asr") is model
+    assert server.created == ["asr"]
+
+    state = server.get_model_states()["asr"]
+    assert state["loaded"] and state["load_count"] == 1
+    assert server.init_progress["models"] == {"asr": "loaded", "vad": "pending", "punc": "pending"}
+    assert [e["event"] for e in server.model_events] == ["loaded"]
+
+
+def test_concurrent_first_use_loads_once(server):
+    barrier = threading.Barrier(4)
+
+    def use():
+        barrier.wait()
+        server._ensure_model("vad")
+
+    threads = [threading.Thread(target=use) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert server.created == ["vad"]
+
+
+def test_failed_load_returns_none(server):
+    server.broken.add("punc")
+    assert server._ensure_model("punc") is None
+    assert server.init_progress["models"]["punc"] == "failed"
+    assert server.model_events[-1]["event"] == "load_failed"
+
+
+def test_unload_releases_memory_and_reloads_on_demand(server):
+    server._ensure_model("asr")
+    assert server.unload_model("asr", reason="test")
+    assert not server.unload_model("asr")
+    assert server.asr_model is None
+    assert server.releases == [True]
+    assert server.model_events[-1]["reason"] == "test"
+
+    server._ensure_model("asr")
+    assert server.created == ["asr", "asr"]
+    assert server.get_model_states()["asr"]["unload_count"] == 1
+
+
+def test_unload_command(server):
+    server._ensure_model("asr")
+    result = server.handle_command({"action": "unload", "models": ["asr", "vad", "bogus"]})
+    assert result == {"success": True, "unloaded": ["asr"]}
+
+
+def test_idle_reaper_unloads_only_idle_models(server):
+    server.model_idle_ttl = 0.05
+    server._ensure_model("asr")
+    server._ensure_model("vad")
+    server._model_info["asr"]["last_used"] = time.time() - 10
+    server._model_info["vad"]["last_used"] = time.time() + 60
+    server._start_idle_reaper()
+    try:
+        deadline = time.time() + 5
+        while server.asr_model is not None and time.time() < deadline:
+            time.sleep(0.05)
+        assert server.asr_model is None and server.vad_model is not None
+    finally:
+        server._reaper_stop.set()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""原始PCM请求体"""
+
+import asyncio
+import io
+import wave
+
+import numpy as np
+import pytest
+from fastapi import HTTPException, Request
+
+from server import read_pcm_body
+
+
+def _request(body, headers=None):
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    raw_headers = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": raw_headers, "query_string": b""}
+    return Request(scope, receive)
+
+
+def _read(body, headers=None, **kwargs):
+    return asyncio.run(read_pcm_body(_request(body, headers), **kwargs))
+
+
+def test_defaults_to_16k_mono_s16le():
+    samples, sample_rate = _read(np.array([0, 16384], dtype="<i2").tobytes())
+    assert sample_rate == 16000
+    np.testing.assert_allclose(samples, [0.0, 0.5])
+
+
+def test_headers_and_query_parameters():
+    body = np.array([0.5, -0.5, 0.25, 0.25], dtype="<f4").tobytes()
+    headers = {"X-Sample-Rate": "8000", "X-Audio-Format": "f32le", "X-Channels": "2"}
+    samples, sample_rate = _read(body, headers)
+    assert sample_rate == 8000
+    np.testing.assert_allclose(samples, [0.0, 0.25])
+
+    # 查询参数优先于请求头
+    _, sample_rate = _read(body, headers, sample_rate=48000)
+    assert sample_rate == 48000
+
+
+def test_wav_body_is_decoded():
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(22050)
+        f.writeframes(np.array([0, -32768], dtype="<i2").tobytes())
+    samples, sample_rate = _read(buffer.getvalue())
+    assert sample_rate == 22050
+    np.testing.assert_allclose(samples, [0.0, -1.0])
+
+
+@pytest.mark.parametrize("body, headers", [
+    (b"", {}),
+    (b"\x00\x00", {"X-Audio-Format": "mp3"}),
+    (b"\x00\x00", {"X-Sample-Rate": "abc"}),
+    (b"\x00\x00", {"X-Channels": "0"}),
+])
+def test_invalid_requests(body, headers):
+    with pytest.raises(HTTPException) as exc:
+        _read(body, headers)
+    assert exc.value.status_code == 400
+
+
+def _float_wav(samples, sample_rate=16000):
+    """IEEE float（格式码3）WAV，标准库wave不支持"""
+    import struct
+
+    data = np.asarray(samples, dtype="<f4").tobytes()
+    fmt = struct.pack("<HHIIHH", 3, 1, sample_rate, sample_rate * 4, 4, 32)
+    chunks = b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(data)) + data
+    return b"RIFF" + struct.pack("<I", 4 + len(chunks)) + b"WAVE" + chunks
+
+
+def _pcm24_wav():
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(3)
+        f.setframerate(16000)
+        f.writeframes(b"\x00\x00\x40" * 4)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("body", [_float_wav([0.5, -0.5]), _pcm24_wav()])
+def test_undecodable_wav_is_rejected(monkeypatch, body):
+    import sys
+
+    # 没有soundfile时不能把文件头当作s16le采样点解析
+    monkeypatch.setitem(sys.modules, "soundfile", None)
+    with pytest.raises(HTTPException) as exc:
+        _read(body)
+    assert exc.value.status_code == 400 and "WAV" in exc.value.detail
+
+
+def test_float_wav_decoded_with_soundfile(monkeypatch):
+    import sys
+    import types
+
+    def read(file, dtype, always_2d):
+        return np.array([[0.5], [-0.5]], dtype=np.float32), 16000
+
+    monkeypatch.setitem(sys.modules, "soundfile", types.SimpleNamespace(read=read))
+    samples, sample_rate = _read(_float_wav([0.5, -0.5]))
+    assert sample_rate == 16000
+    np.testing.assert_allclose(samples, [0.5, -0.5])
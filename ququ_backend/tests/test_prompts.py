@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""提示词模板：静态前缀逐字节相同，可变内容在末尾"""
+
+import os
+
+import pytest
+
+from prompts import asr_translation_messages, correction_messages, translation_messages
+
+
+def _prefix_before(messages, variable):
+    content = messages[-1]["content"]
+    return content[:content.index(variable)]
+
+
+@pytest.mark.parametrize("mode", ["optimize", "format", "punctuate"])
+def test_correction_prefix_is_stable(mode):
+    a = correction_messages("第一段识别文本", mode)
+    b = correction_messages("完全不同的另一段", mode)
+    assert a[0] == b[0]
+    assert _prefix_before(a, "第一段识别文本") == _prefix_before(b, "完全不同的另一段")
+    assert a[-1]["content"].endswith("第一段识别文本")
+
+
+def test_hotwords_follow_static_prefix():
+    plain = correction_messages("文本", "optimize")[-1]["content"]
+    with_hotwords = correction_messages("文本", "optimize", hotwords_context="乾文 → Qwen")[-1]["content"]
+    static = os.path.commonprefix([plain, with_hotwords])
+    # 热词表出现在共同前缀之后，不影响前缀的KV缓存复用
+    assert "乾文 → Qwen" not in static
+    assert len(static) > len(plain) * 0.8
+
+
+def test_translation_prefixes_are_stable():
+    a = asr_translation_messages("你好", "英文")[-1]["content"]
+    b = asr_translation_messages("再见", "日文")[-1]["content"]
+    assert os.path.commonprefix([a, b]).endswith("【目标语言】")
+
+    a = translation_messages("你好", "中文", "英文")[-1]["content"]
+    b = translation_messages("再见", "英文", "中文")[-1]["content"]
+    assert os.path.commonprefix([a, b]).endswith("源语言：")
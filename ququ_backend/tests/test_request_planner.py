@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""按截止时间规划请求：跳过顺序、估计更新、LLM超时"""
+
+import pytest
+
+from request_planner import RequestPlanner
+
+
+@pytest.fixture
+def planner(monkeypatch):
+    monkeypatch.setenv("PLANNER_SAFETY_MS", "100")
+    return RequestPlanner()
+
+
+def test_no_deadline_keeps_all_stages(planner):
+    plan = planner.plan(None, 10.0, use_llm=True)
+    assert plan.use_vad and plan.use_punc and plan.use_llm
+    assert plan.remaining() is None and plan.llm_timeout() is None
+    assert plan.annotate({"text": "x"}) == {"text": "x"}
+
+
+def test_optional_stages_are_dropped_in_order(planner):
+    # 10秒音频：overhead 0.05 + asr 0.5 + vad 0.1 + punc 0.05 + llm 2.0（先验）
+    assert planner.plan(3000, 10.0, use_llm=True).skipped_stages == []
+    assert planner.plan(1000, 10.0, use_llm=True).skipped_stages == ["llm"]
+    assert planner.plan(750, 10.0, use_llm=True).skipped_stages == ["llm", "punc"]
+    assert planner.plan(600, 10.0, use_llm=True).skipped_stages == ["llm", "punc", "vad"]
+    # 只剩ASR仍超出预算时照常执行
+    assert planner.plan(100, 10.0, use_llm=True).skipped_stages == ["llm", "punc", "vad"]
+
+
+def test_long_audio_keeps_vad(planner):
+    plan = planner.plan(100, 60.0)
+    assert plan.use_vad and plan.skipped_stages == ["punc"]
+
+
+def test_observations_update_estimates(planner):
+    planner.observe_asr(10.0, {"vad": 0.2, "asr": 1.0, "punc": 0.1}, wall_seconds=1.5)
+    assert planner.estimate("asr", 1.0) == pytest.approx(0.1)
+    assert planner.estimate("overhead", 10.0) == pytest.approx(0.2)
+
+    planner.observe_llm(0.5)
+    planner.observe_llm(1.5)
+    assert planner.estimate("llm", 0.0) == pytest.approx(0.2 * 1.5 + 0.8 * 0.5)
+
+
+def test_llm_rechecked_against_remaining_budget(planner):
+    planner.observe_llm(0.5)
+    plan = planner.plan(5000, 1.0, use_llm=True)
+    assert plan.allow_llm()
+    assert plan.llm_timeout() == pytest.approx(4.9, abs=0.05)
+
+    # ASR耗尽了预算：LLM在调用前被跳过
+    plan.deadline = plan.started + 0.3
+    assert not plan.allow_llm()
+    assert plan.annotate({})["skipped_stages"] == ["llm"]
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""合并执行：发起者/等待者失败、取消和资源释放"""
+
+import asyncio
+import os
+
+import pytest
+
+from cancellation import current_token
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_execute_once():
+    async def main():
+        flight = SingleFlight("test")
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"text": "ok"}
+
+        results = await asyncio.gather(*(flight.do("k", work) for _ in range(3)))
+        assert calls == [1]
+        assert results == [{"text": "ok"}] * 3
+        # 等待者拿到的是副本
+        assert results[1] is not results[0]
+        assert flight.get_stats()["inflight"] == 0
+
+    asyncio.run(main())
+
+
+def test_follower_gets_result_after_leader_cancelled():
+    async def main():
+        flight = SingleFlight("test")
+        released = []
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.ensure_future(flight.do("k", work, lambda: released.append("leader")))
+        await started.wait()
+        follower = asyncio.ensure_future(flight.do("k", work, lambda: released.append("follower")))
+        await asyncio.sleep(0)
+        # 等待者合并时立即释放自己的资源，发起者的资源随执行保留
+        assert released == ["follower"]
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert released == ["follower"]
+
+        assert await follower == "done"
+        assert released == ["follower", "leader"]
+
+    asyncio.run(main())
+
+
+def test_leader_failure_propagates_to_followers():
+    async def main():
+        flight = SingleFlight("test")
+        released = []
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(
+            flight.do("k", work, lambda: released.append(1)),
+            flight.do("k", work),
+            return_exceptions=True,
+        )
+        assert [str(r) for r in results] == ["boom", "boom"]
+        assert released == [1]
+
+        # 失败的执行不会留在表中，之后的请求重新执行
+        async def ok():
+            return "ok"
+
+        assert await flight.do("k", ok) == "ok"
+
+    asyncio.run(main())
+
+
+def test_execution_cancelled_when_all_waiters_leave():
+    async def main():
+        flight = SingleFlight("test")
+        tokens = []
+        released = []
+        started = asyncio.Event()
+
+        async def work():
+            tokens.append(current_token())
+            started.set()
+            await asyncio.sleep(10)
+
+        waiters = [asyncio.ensure_future(flight.do("k", work, lambda: released.append(1))),
+                   asyncio.ensure_future(flight.do("k", work))]
+        await started.wait()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        assert tokens[0].cancelled and tokens[0].reason == "abandoned"
+        assert released == [1]
+        assert flight.get_stats()["inflight"] == 0
+
+    asyncio.run(main())
+
+
+def test_shared_audio_survives_leader_cleanup(tmp_path):
+    from server import share_audio
+
+    original = tmp_path / "audio.wav"
+    original.write_bytes(b"RIFF....")
+    owned, release = share_audio(str(original))
+
+    # 发起请求的处理函数清理了自己的临时文件，合并执行仍能读取
+    original.unlink()
+    with open(owned, "rb") as f:
+        assert f.read() == b"RIFF...."
+    release()
+    assert not os.path.exists(owned)
+    assert not os.path.exists(os.path.dirname(owned))
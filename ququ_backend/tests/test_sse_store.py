@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""可续传SSE流：补发、续传、心跳、过期"""
+
+import asyncio
+
+from sse_store import StreamStore
+
+
+def _event(n):
+    return f"data: {n}\n\n"
+
+
+async def _events(count, gate=None):
+    for n in range(1, count + 1):
+        if gate is not None:
+            await gate.get()
+        yield _event(n)
+
+
+async def _collect(iterator):
+    return [chunk async for chunk in iterator]
+
+
+def test_subscriber_receives_numbered_events():
+    async def main():
+        store = StreamStore(cancel_grace=-1)
+        job = store.start(_events(3))
+        chunks = await _collect(store.subscribe(job))
+        assert chunks == [f"id: {job.job_id}:{n}\n{_event(n)}" for n in (1, 2, 3)]
+        assert job.done
+
+    asyncio.run(main())
+
+
+def test_resume_replays_only_missed_events():
+    async def main():
+        store = StreamStore(cancel_grace=-1)
+        job = store.start(_events(4))
+        await job.task
+
+        resolved = store.resolve(f"{job.job_id}:2")
+        assert resolved == (job, 2)
+        chunks = await _collect(store.subscribe(*resolved, resumed=True))
+        assert chunks == [f"id: {job.job_id}:{n}\n{_event(n)}" for n in (3, 4)]
+
+    asyncio.run(main())
+
+
+def test_resolve_rejects_unknown_or_malformed_ids():
+    async def main():
+        store = StreamStore(cancel_grace=-1)
+        job = store.start(_events(1))
+        assert store.resolve(None) is None
+        assert store.resolve("missing:1") is None
+        assert store.resolve(f"{job.job_id}:abc") == (job, 0)
+        await job.task
+
+    asyncio.run(main())
+
+
+def test_reconnect_continues_running_job():
+    async def main():
+        store = StreamStore(cancel_grace=-1)
+        gate = asyncio.Queue()
+        job = store.start(_events(3, gate))
+
+        # 第一个连接收到事件1后断开
+        gate.put_nowait(None)
+        first = store.subscribe(job)
+        assert (await first.__anext__()).endswith(_event(1))
+        await first.aclose()
+        assert job.subscribers == 0 and not job.done
+
+        # 断开期间产生事件2，重连后先补发再继续接收事件3
+        gate.put_nowait(None)
+        await asyncio.sleep(0.01)
+        second = store.subscribe(job, after=1, resumed=True)
+        assert (await second.__anext__()).endswith(_event(2))
+        gate.put_nowait(None)
+        assert (await second.__anext__()).endswith(_event(3))
+        assert [chunk async for chunk in second] == []
+        assert job.done
+
+    asyncio.run(main())
+
+
+def test_heartbeat_while_idle():
+    async def main():
+        store = StreamStore(heartbeat=0.01, cancel_grace=-1)
+        gate = asyncio.Queue()
+        job = store.start(_events(1, gate))
+        subscription = store.subscribe(job)
+        assert await subscription.__anext__() == ": ping\n\n"
+        gate.put_nowait(None)
+        chunks = await _collect(subscription)
+        assert chunks[-1].endswith(_event(1))
+
+    asyncio.run(main())
+
+
+def test_finished_jobs_expire_after_ttl():
+    async def main():
+        store = StreamStore(ttl=0.01, cancel_grace=-1)
+        job = store.start(_events(1))
+        await job.task
+        assert store.get(job.job_id) is job
+        await asyncio.sleep(0.02)
+        assert store.get(job.job_id) is None
+
+    asyncio.run(main())
+
+
+def test_running_jobs_are_not_evicted():
+    async def main():
+        store = StreamStore(max_jobs=1, cancel_grace=-1)
+        gate = asyncio.Queue()
+        running = store.start(_events(1, gate))
+        finished = store.start(_events(1))
+        await finished.task
+        store.start(_events(1))
+        # 超过上限时只淘汰已完成的任务
+        assert store.get(running.job_id) is running
+        assert store.get(finished.job_id) is None
+        await store.stop()
+
+    asyncio.run(main())
+
+
+def test_resume_endpoint_unknown_job():
+    from fastapi.testclient import TestClient
+    import server
+
+    response = TestClient(server.app).get("/api/asr/streams/missing")
+    assert response.status_code == 404
+
+
+def _shared_stores(tmp_path, **kwargs):
+    """共享同一事件日志的两个StreamStore，模拟两个HTTP worker"""
+    from sse_store import StreamEventLog
+
+    log = StreamEventLog(str(tmp_path / "streams.sqlite3"))
+    return [StreamStore(shared=log, poll_interval=0.01, **kwargs) for _ in range(2)]
+
+
+def test_resume_on_another_worker(tmp_path):
+    async def main():
+        owner, other = _shared_stores(tmp_path, cancel_grace=-1)
+        gate = asyncio.Queue()
+        job = owner.start(_events(3, gate))
+        gate.put_nowait(None)
+        gate.put_nowait(None)
+        await asyncio.sleep(0.05)
+
+        # 带Last-Event-ID重连到另一个worker：不重新执行，从共享日志补发并继续接收
+        remote, after = other.resolve(f"{job.job_id}:1")
+        assert remote.remote and after == 1
+        subscription = other.subscribe(remote, after, resumed=True)
+        assert await subscription.__anext__() == f"id: {job.job_id}:2\n{_event(2)}"
+        gate.put_nowait(None)
+        assert [chunk async for chunk in subscription] == [f"id: {job.job_id}:3\n{_event(3)}"]
+        assert other.get("missing") is None
+        await owner.stop()
+
+    asyncio.run(main())
+
+
+def test_remote_subscriber_keeps_job_alive(tmp_path):
+    async def main():
+        owner, other = _shared_stores(tmp_path, cancel_grace=0.05)
+        gate = asyncio.Queue()
+        job = owner.start(_events(2, gate))
+
+        # 原连接断开后客户端重连到另一个worker：宽限期过后任务仍在运行
+        first = owner.subscribe(job)
+        gate.put_nowait(None)
+        await first.__anext__()
+        await first.aclose()
+        subscription = other.subscribe(other.get(job.job_id), 1, resumed=True)
+        reader = asyncio.ensure_future(_collect(subscription))
+        await asyncio.sleep(0.2)
+        assert not job.task.done()
+
+        gate.put_nowait(None)
+        assert await reader == [f"id: {job.job_id}:2\n{_event(2)}"]
+        await job.task
+
+    asyncio.run(main())
+
+
+def test_remote_subscriber_stops_when_owner_exits(tmp_path):
+    async def main():
+        _, other = _shared_stores(tmp_path, cancel_grace=-1)
+        other.shared.register("orphan")
+        other.shared._connection().execute("UPDATE streams SET owner_pid = ? WHERE job_id = ?", (2 ** 22 + 1, "orphan"))
+        chunks = await _collect(other.subscribe(other.get("orphan"), 0, resumed=True))
+        assert len(chunks) == 1 and "worker_exited" in chunks[0]
+
+    asyncio.run(main())
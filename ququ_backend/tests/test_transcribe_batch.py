@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""批量转录：长音频单独转录，批处理按总时长分组"""
+
+import wave
+
+import pytest
+
+from funasr_gpu import FunASRServer
+from inference_scheduler import InferenceScheduler
+
+
+def _wav(path, seconds, sample_rate=1000):
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(b"\x00\x00" * int(seconds * sample_rate))
+    return str(path)
+
+
+class _Model:
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, input, **kwargs):
+        self.calls.append(list(input))
+        return [{"text": f"batch:{i}"} for i in range(len(input))]
+
+
+@pytest.fixture
+def server():
+    s = FunASRServer.__new__(FunASRServer)
+    s.initialized = True
+    s.backend = "pytorch"
+    s.scheduler = InferenceScheduler()
+    s.long_audio_seconds = 120
+    s.batch_max_seconds = 100
+    s.transcription_count = 0
+    s.total_audio_duration = 0.0
+    s.model = _Model()
+    s._ensure_model = lambda name: s.model
+    s.single = []
+
+    def transcribe_audio(audio, options=None):
+        s.single.append(audio)
+        return {"success": True, "text": "single"}
+
+    s.transcribe_audio = transcribe_audio
+    return s
+
+
+def test_long_audio_is_not_batched(server, tmp_path):
+    short = _wav(tmp_path / "short.wav", 10)
+    long = _wav(tmp_path / "long.wav", 200)
+
+    results = server.transcribe_batch([long, short], {"use_punc": False})
+
+    assert server.single == [long]
+    assert server.model.calls == [[short]]
+    assert [r["text"] for r in results] == ["single", "batch:0"]
+    assert results[1]["duration"] == pytest.approx(10)
+
+
+def test_batches_are_capped_by_total_duration(server, tmp_path):
+    paths = [_wav(tmp_path / f"{i}.wav", 40) for i in range(5)]
+    missing = str(tmp_path / "missing.wav")
+
+    results = server.transcribe_batch(paths[:2] + [missing] + paths[2:], {"use_punc": False})
+
+    assert server.model.calls == [paths[0:2], paths[2:4], paths[4:5]]
+    assert len(results) == 6
+    assert not results[2]["success"] and "不存在" in results[2]["error"]
+    assert all(r["success"] for i, r in enumerate(results) if i != 2)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""模型预热与就绪检查"""
+
+import types
+
+import pytest
+from fastapi.testclient import TestClient
+
+from funasr_gpu import FunASRServer
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv("FUNASR_WARMUP_SECONDS", "1,2")
+    s = FunASRServer()
+    s.asr_model = s.vad_model = s.punc_model = object()
+    s.initialized = True
+    s.runs = []
+
+    def run_stages(audio, options, input_kwargs):
+        s.runs.append((len(audio), options["use_vad"]))
+        return {"timings": {"asr": 0.01}}
+
+    s._run_stages = run_stages
+    s._restore_punctuation = lambda text: (text, {"punc": 0.01})
+    return s
+
+
+def test_warmup_runs_each_length_cold_and_warm(server):
+    stats = server.warmup()
+    assert server.runs == [(16000, True)] * 2 + [(32000, True)] * 2
+    assert set(stats["lengths"]) == {"1s", "2s"}
+    assert set(stats["lengths"]["1s"]) == {"cold", "warm"}
+    assert stats["punc"]["warm"] == {"punc": 0.01}
+    assert server.get_readiness()["ready"] and server.init_progress["stage"] == "ready"
+
+
+def test_warmup_failure_keeps_server_not_ready(server):
+    def fail(audio, options, input_kwargs):
+        raise RuntimeError("CUDA error")
+
+    server._run_stages = fail
+    stats = server.warmup()
+    assert stats["error"] == "CUDA error"
+    assert not server.ready
+    assert server.init_progress["stage"] == "failed"
+
+
+def test_warmup_disabled_marks_ready(server):
+    server.warmup_enabled = False
+    server.warmup()
+    assert server.ready and server.runs == []
+
+
+def test_synthetic_audio_is_deterministic():
+    a = FunASRServer._synthetic_audio(0.5)
+    assert len(a) == 8000 and a.dtype.name == "float32"
+    assert (a == FunASRServer._synthetic_audio(0.5)).all()
+    assert 0.05 < abs(a).max() <= 1.0
+
+
+def test_ready_endpoint(monkeypatch):
+    import server as app_server
+
+    client = TestClient(app_server.app)
+    monkeypatch.setattr(app_server, "funasr_server", None)
+    assert client.get("/api/ready").status_code == 503
+
+    readiness = {"ready": False, "initialized": True, "warmup": {}}
+    monkeypatch.setattr(app_server, "funasr_server",
+                        types.SimpleNamespace(get_readiness=lambda: readiness))
+    assert client.get("/api/ready").status_code == 503
+    readiness["ready"] = True
+    response = client.get("/api/ready")
+    assert response.status_code == 200 and response.json()["ready"] is True
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程内请求追踪
+每个HTTP请求一个根span，各阶段（音频解码、ASR排队与推理、LLM排队与请求）为子span，当前span保存在
+contextvar中，asyncio任务和asyncio.to_thread自动继承。追踪上下文随IPC命令传到模型宿主，
+宿主中的span随响应带回并挂到本进程的追踪树上；调用LLM时以W3C traceparent请求头传递。
+完成的追踪保存在内存环形缓冲区中（/debug/traces按耗时返回最慢的若干个），可选写入OTLP JSON文件
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from logging_setup import request_id_var
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return f"{random.getrandbits(nbytes * 8):0{nbytes * 2}x}"
+
+
+class _Trace:
+    """一棵追踪树在本进程中的所有span"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List["Span"] = []
+        self.remote_spans: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    def add(self, span: "Span"):
+        with self.lock:
+            self.spans.append(span)
+
+    def span_dicts(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [s.to_dict() for s in self.spans] + list(self.remote_spans)
+
+
+class Span:
+    """一个计时阶段"""
+
+    __slots__ = ("name", "trace", "span_id", "parent_id", "start", "end", "attributes", "status",
+                 "_started", "_token")
+
+    def __init__(self, name: str, trace: _Trace, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self.status = "ok"
+        self._token: Optional[contextvars.Token] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    @property
+    def duration(self) -> float:
+        if self.end is None:
+            return time.perf_counter() - self._started
+        return self.end - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def error(self, message: str):
+        self.status = "error"
+        self.attributes["error"] = message
+
+    def finish(self):
+        if self.end is None:
+            self.end = self.start + (time.perf_counter() - self._started)
+            self.trace.add(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round(self.duration * 1000, 2),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """
+    当前span的子span；不在追踪中的请求（如健康检查、后台任务）时不做任何事，返回None
+
+    with块中抛出的异常记为span的错误状态后继续抛出。
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace, parent.span_id, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        child.finish()
+
+
+def inject() -> Optional[Dict[str, Any]]:
+    """当前追踪上下文，随IPC命令发送；不在追踪中时返回None"""
+    current = _current_span.get()
+    if current is None:
+        return None
+    return {"trace_id": current.trace_id, "span_id": current.span_id, "request_id": request_id_var.get()}
+
+
+def traceparent() -> Optional[str]:
+    """W3C traceparent请求头的值"""
+    current = _current_span.get()
+    if current is None:
+        return None
+    return f"00-{current.trace_id}-{current.span_id}-01"
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Dict[str, str]]:
+    """解析客户端传入的traceparent请求头，格式不对时返回None"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return {"trace_id": parts[1], "span_id": parts[2]}
+
+
+def attach_remote(parent: Optional[Span], spans: Optional[List[Dict[str, Any]]]):
+    """把模型宿主随响应带回的span并入本进程的追踪树"""
+    if parent is None or not spans:
+        return
+    with parent.trace.lock:
+        parent.trace.remote_spans.extend(spans)
+
+
+class OTLPFileExporter:
+    """
+    以OTLP/JSON格式（每行一个ExportTraceServiceRequest）把完成的追踪追加写入本地文件
+
+    写文件在后台线程中进行；可直接用OpenTelemetry Collector的otlpjsonfile接收器读取。
+    """
+
+    def __init__(self, path: str, service_name: str = "ququ-backend"):
+        self.path = path
+        self.service_name = service_name
+        self._queue: queue.Queue = queue.Queue(maxsize=1000)
+        self._dropped = 0
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, spans: List[Dict[str, Any]]):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self._dropped += 1
+
+    @staticmethod
+    def _attribute(key: str, value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def _encode(self, spans: List[Dict[str, Any]]) -> str:
+        otlp_spans = []
+        for s in spans:
+            end = s["end"] if s["end"] is not None else s["start"] + s["duration_ms"] / 1000
+            otlp_span = {
+                "traceId": s["trace_id"],
+                "spanId": s["span_id"],
+                "name": s["name"],
+                "kind": 2 if s["parent_id"] is None else 1,  # SERVER / INTERNAL
+                "startTimeUnixNano": str(int(s["start"] * 1e9)),
+                "endTimeUnixNano": str(int(end * 1e9)),
+                "attributes": [self._attribute(k, v) for k, v in s["attributes"].items() if v is not None],
+                "status": {"code": 2 if s["status"] == "error" else 1},
+            }
+            if s["parent_id"]:
+                otlp_span["parentSpanId"] = s["parent_id"]
+            otlp_spans.append(otlp_span)
+        return json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [self._attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": "ququ.tracing"}, "spans": otlp_spans}],
+            }]
+        }, ensure_ascii=False)
+
+    def _run(self):
+        while True:
+            spans = self._queue.get()
+            try:
+                line = self._encode(spans)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except Exception as e:
+                logger.warning(f"写入追踪文件失败: {str(e)}")
+
+
+class Tracer:
+    """根span的创建与完成追踪的保存"""
+
+    def __init__(self):
+        self.enabled = os.getenv("TRACING_ENABLED", "1") == "1"
+        self._traces: deque = deque(maxlen=int(os.getenv("TRACE_BUFFER_SIZE", "500")))
+        self._lock = threading.Lock()
+        export_file = os.getenv("TRACE_EXPORT_FILE")
+        self.exporter = OTLPFileExporter(export_file) if export_file and self.enabled else None
+
+    def start_root(self, name: str, parent: Optional[Dict[str, Any]] = None, **attributes) -> Optional[Span]:
+        """
+        开始一个本进程内的根span并设为当前span
+
+        Args:
+            parent: 上游追踪上下文（traceparent请求头或IPC命令中的trace），None时开始新的追踪
+        """
+        if not self.enabled:
+            return None
+        trace = _Trace(parent["trace_id"] if parent else _new_id(16))
+        root = Span(name, trace, parent["span_id"] if parent else None, attributes)
+        root._token = _current_span.set(root)
+        return root
+
+    def end_root(self, root: Optional[Span], record: bool = True) -> List[Dict[str, Any]]:
+        """
+        结束根span，返回这棵树在本进程中的全部span
+
+        Args:
+            record: 为True时保存到环形缓冲区并导出；模型宿主中的远程根span传False，span随响应返回
+        """
+        if root is None:
+            return []
+        if root._token is not None:
+            try:
+                _current_span.reset(root._token)
+            except ValueError:
+                # 流式响应在另一个上下文中结束，无需恢复
+                pass
+        root.finish()
+        spans = root.trace.span_dicts()
+        if record:
+            with self._lock:
+                self._traces.append({
+                    "trace_id": root.trace_id,
+                    "name": root.name,
+                    "start": root.start,
+                    "duration_ms": round(root.duration * 1000, 2),
+                    "status": root.status,
+                    "attributes": dict(root.attributes),
+                    "spans": spans,
+                })
+            if self.exporter is not None:
+                self.exporter.export(spans)
+        return spans
+
+    @contextmanager
+    def remote(self, name: str, carrier: Optional[Dict[str, Any]], **attributes) -> Iterator[List[Dict[str, Any]]]:
+        """
+        在模型宿主中处理带追踪上下文的命令：块内的span挂在调用方span之下，
+        退出时填入yield的列表，由调用方随响应带回。请求ID同时设置到日志上下文
+        """
+        collected: List[Dict[str, Any]] = []
+        if not carrier or not self.enabled:
+            yield collected
+            return
+        request_token = request_id_var.set(carrier.get("request_id"))
+        root = self.start_root(name, parent=carrier, **attributes)
+        try:
+            yield collected
+        except BaseException as e:
+            root.error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            collected.extend(self.end_root(root, record=False))
+            request_id_var.reset(request_token)
+
+    def slowest(self, limit: int = 10, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """最近的追踪中耗时最长的limit个，span组织为树"""
+        with self._lock:
+            traces = list(self._traces)
+        if name:
+            traces = [t for t in traces if name in t["name"]]
+        traces.sort(key=lambda t: t["duration_ms"], reverse=True)
+        return [dict(t, spans=build_tree(t["spans"])) for t in traces[:limit]]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count = len(self._traces)
+        return {
+            "enabled": self.enabled,
+            "buffered": count,
+            "buffer_size": self._traces.maxlen,
+            "export_file": self.exporter.path if self.exporter else None,
+        }
+
+
+def build_tree(spans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """按parent_id把span列表组织成树，children按开始时间排序；找不到父span的作为根"""
+    nodes = {s["span_id"]: dict(s, children=[]) for s in spans}
+    roots = []
+    for node in sorted(nodes.values(), key=lambda n: n["start"]):
+        parent = nodes.get(node["parent_id"])
+        if parent is not None:
+            parent["children"].append(node)
+        else:
+            roots.append(node)
+    return roots
+
+
+TRACER = Tracer()
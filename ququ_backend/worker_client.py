@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FunASR worker客户端
+通过帧协议与funasr_gpu.py worker（子进程或模型宿主）通信，音频经共享内存环形缓冲区零拷贝传递。
+对外提供与FunASRServer相同的transcribe_audio/check_status/get_performance_stats接口
+"""
+
+import os
+import sys
+import time
+import queue
+import socket
+import itertools
+import logging
+import subprocess
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from pathlib import Path
+from typing import Optional, Dict, Any, Callable, Tuple
+
+import numpy as np
+
+from ipc_protocol import read_frame, write_frame, FrameError, INIT_REQUEST_ID
+from shm_audio import SharedAudioRing
+from cancellation import current_token
+from inference_scheduler import DEFAULT_PRIORITY
+from audio_io import probe_duration
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# 控制命令（状态、统计、就绪检查）的等待上限（秒）
+CONTROL_TIMEOUT = float(os.getenv("MODEL_HOST_CONTROL_TIMEOUT", "10"))
+# 推理命令的等待上限：固定部分（含排队）+ 每秒音频的处理时间；时长未知时只用固定部分
+TRANSCRIBE_TIMEOUT = float(os.getenv("MODEL_HOST_TRANSCRIBE_TIMEOUT", "120"))
+TIMEOUT_PER_AUDIO_SECOND = float(os.getenv("MODEL_HOST_TIMEOUT_PER_AUDIO_SECOND", "1"))
+# 与模型宿主的连接断开后（宿主进程退出并被重启）重新连接的间隔（秒）
+RECONNECT_INTERVAL = float(os.getenv("MODEL_HOST_RECONNECT_INTERVAL", "1"))
+
+
+class ModelHostTimeout(TimeoutError):
+    """模型宿主在等待上限内没有回复"""
+
+
+def transcription_timeout(duration: Optional[float]) -> float:
+    """按音频时长（秒）计算推理命令的等待上限"""
+    return TRANSCRIBE_TIMEOUT + TIMEOUT_PER_AUDIO_SECOND * (duration or 0.0)
+
+
+class FunASRWorkerClient:
+    """funasr_gpu.py worker的帧协议客户端，线程安全"""
+
+    def __init__(self, reader, writer, process: Optional[subprocess.Popen] = None,
+                 ring_size: Optional[int] = None, sock: Optional[socket.socket] = None,
+                 socket_path: Optional[str] = None):
+        """
+        Args:
+            reader: worker响应的二进制输入流
+            writer: 发往worker的二进制输出流
+            process: 由本客户端启动的worker子进程（可选）
+            ring_size: 共享内存环形缓冲区大小（字节）
+            sock: 连接模型宿主时使用的套接字（可选）
+            socket_path: 模型宿主的套接字路径（可选），给出时连接断开后自动重连
+        """
+        self._reader = reader
+        self._writer = writer
+        self._process = process
+        self._sock = sock
+        self._socket_path = socket_path
+        self._shutting_down = False
+        self.reconnects = 0
+        self._ring = SharedAudioRing(ring_size) if ring_size else SharedAudioRing()
+        self._write_lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        # 流式命令：同一请求ID上的多条响应依次放入队列，直到done=True
+        self._streams: Dict[int, Tuple[queue.Queue, Optional[Callable[[], None]]]] = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count(INIT_REQUEST_ID + 1)
+        self._init_future: Future = Future()
+        self._pending[INIT_REQUEST_ID] = self._init_future
+        self.closed = False
+        self.init_result: Optional[Dict[str, Any]] = None
+        self._start_reader()
+
+    def _start_reader(self):
+        self._reader_thread = threading.Thread(
+            target=self._read_loop, name="funasr-ipc-reader", daemon=True
+        )
+        self._reader_thread.start()
+
+    @classmethod
+    def spawn(cls, damo_root: Optional[str] = None, python: str = sys.executable,
+              ring_size: Optional[int] = None) -> "FunASRWorkerClient":
+        """启动funasr_gpu.py子进程（帧协议）并返回客户端"""
+        script = Path(__file__).parent / "funasr_gpu.py"
+        cmd = [python, str(script), "--ipc", "framed"]
+        if damo_root:
+            cmd += ["--damo-root", damo_root]
+
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=str(script.parent),
+            env=os.environ.copy(),
+        )
+        logger.info(f"FunASR worker已启动: pid={process.pid}")
+        return cls(process.stdout, process.stdin, process=process, ring_size=ring_size)
+
+    @classmethod
+    def connect(cls, socket_path: str, timeout: float = 30.0,
+                ring_size: Optional[int] = None) -> "FunASRWorkerClient":
+        """
+        连接到模型宿主（funasr_gpu.py --listen）
+
+        宿主可能仍在启动，在timeout内重试连接。
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.2)
+
+        logger.info(f"已连接模型宿主: {socket_path}")
+        return cls(sock.makefile("rb"), sock.makefile("wb"), ring_size=ring_size, sock=sock,
+                   socket_path=socket_path)
+
+    # ==================== 底层收发 ====================
+
+    def _read_loop(self):
+        """读取worker响应并按请求ID完成对应的Future"""
+        try:
+            while True:
+                frame = read_frame(self._reader)
+                if frame is None:
+                    break
+                request_id, payload = frame
+                if request_id == INIT_REQUEST_ID:
+                    self.init_result = payload
+                with self._pending_lock:
+                    stream = self._streams.get(request_id)
+                    if stream is not None and payload.get("done", True):
+                        del self._streams[request_id]
+                    future = None if stream is not None else self._pending.pop(request_id, None)
+                if stream is not None:
+                    responses, on_done = stream
+                    responses.put(payload)
+                    if on_done is not None and payload.get("done", True):
+                        on_done()
+                    continue
+                if future is not None and not future.done():
+                    tracing.attach_remote(getattr(future, "trace_span", None), payload.pop("spans", None))
+                    future.set_result(payload)
+        except (FrameError, OSError, ValueError) as e:
+            logger.error(f"FunASR worker连接异常: {str(e)}")
+        finally:
+            self.closed = True
+            disconnected = {
+                "success": False,
+                "error": "FunASR worker连接已断开",
+                "type": "worker_disconnected",
+            }
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+                streams, self._streams = self._streams, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_result(disconnected)
+            for responses, on_done in streams.values():
+                responses.put({**disconnected, "event": "final", "done": True})
+                if on_done is not None:
+                    on_done()
+            if self._socket_path and not self._shutting_down:
+                threading.Thread(target=self._reconnect, name="funasr-ipc-reconnect", daemon=True).start()
+
+    def _reconnect(self):
+        """
+        模型宿主断开后按间隔重连
+
+        宿主进程退出后由server.py的父进程重启；重连成功后等待新宿主的初始化结果，
+        在此之前initialized为False，推理接口返回503。
+        """
+        logger.warning(f"与模型宿主的连接已断开，每{RECONNECT_INTERVAL:g}秒尝试重连: {self._socket_path}")
+        if self._sock is not None:
+            self._sock.close()
+        while not self._shutting_down:
+            time.sleep(RECONNECT_INTERVAL)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self._socket_path)
+            except OSError:
+                sock.close()
+                continue
+
+            with self._pending_lock:
+                self._init_future = Future()
+                self._pending[INIT_REQUEST_ID] = self._init_future
+            self.init_result = None
+            self._sock = sock
+            self._reader = sock.makefile("rb")
+            self._writer = sock.makefile("wb")
+            self.reconnects += 1
+            self.closed = False
+            self._start_reader()
+            logger.info(f"已重新连接模型宿主: {self._socket_path}（第{self.reconnects}次）")
+            return
+
+    def submit(self, command: Dict[str, Any]) -> Future:
+        """发送命令，返回在收到响应时完成的Future"""
+        future: Future = Future()
+        if self.closed:
+            future.set_result({"success": False, "error": "FunASR worker连接已断开",
+                               "type": "worker_disconnected"})
+            return future
+
+        # 追踪中的请求把追踪上下文随命令发送，模型宿主中的span在响应中带回
+        carrier = tracing.inject()
+        if carrier is not None:
+            command = dict(command, trace=carrier)
+            future.trace_span = tracing.current_span()
+
+        request_id = next(self._ids)
+        future.request_id = request_id
+        with self._pending_lock:
+            self._pending[request_id] = future
+        try:
+            with self._write_lock:
+                write_frame(self._writer, request_id, command)
+        except (OSError, ValueError) as e:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            future.set_result({"success": False, "error": f"发送命令失败: {str(e)}",
+                               "type": "worker_disconnected"})
+            return future
+
+        # 请求取消时通知worker放弃排队中的推理；仍等待worker的回复，共享内存区块在回复后才释放
+        token = current_token()
+        if token is not None:
+            cancel = lambda: self._send_cancel(request_id)
+            token.add_callback(cancel)
+            future.add_done_callback(lambda _: token.remove_callback(cancel))
+        return future
+
+    def _send_cancel(self, request_id: int):
+        """通知worker取消请求（worker不回复）"""
+        if self.closed:
+            return
+        try:
+            with self._write_lock:
+                write_frame(self._writer, next(self._ids), {"action": "cancel", "request_id": request_id})
+        except (OSError, ValueError):
+            pass
+
+    def call(self, command: Dict[str, Any], timeout: float = CONTROL_TIMEOUT) -> Dict[str, Any]:
+        """发送命令并等待响应，超时抛出ModelHostTimeout"""
+        return self._wait(self.submit(command), command, timeout)
+
+    def _wait(self, future: Future, command: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """
+        等待响应；超时时通知worker取消该请求并抛出ModelHostTimeout
+
+        Future仍保留在等待表中：worker之后回复时照常完成，共享内存区块在那时才释放
+        """
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            request_id = getattr(future, "request_id", None)
+            if request_id is not None:
+                self._send_cancel(request_id)
+            raise ModelHostTimeout(
+                f"模型宿主在{timeout:.0f}秒内未响应: {command.get('action')}"
+            ) from None
+
+    def stream(self, command: Dict[str, Any], on_done: Optional[Callable[[], None]] = None,
+               timeout: float = TRANSCRIBE_TIMEOUT):
+        """
+        发送流式命令，逐条产出响应直到done=True
+
+        Args:
+            on_done: 收到最后一条响应（或连接断开）时在读取线程中调用，调用方提前停止迭代也会执行
+            timeout: 相邻两条响应之间的等待上限（秒），超时通知worker取消并抛出ModelHostTimeout
+        """
+        if self.closed:
+            if on_done is not None:
+                on_done()
+            yield {"success": False, "error": "FunASR worker连接已断开",
+                   "type": "worker_disconnected", "event": "final", "done": True}
+            return
+
+        request_id = next(self._ids)
+        responses: queue.Queue = queue.Queue()
+        with self._pending_lock:
+            self._streams[request_id] = (responses, on_done)
+        try:
+            with self._write_lock:
+                write_frame(self._writer, request_id, command)
+        except (OSError, ValueError) as e:
+            with self._pending_lock:
+                self._streams.pop(request_id, None)
+            if on_done is not None:
+                on_done()
+            yield {"success": False, "error": f"发送命令失败: {str(e)}",
+                   "type": "worker_disconnected", "event": "final", "done": True}
+            return
+
+        token = current_token()
+        cancel = lambda: self._send_cancel(request_id)
+        if token is not None:
+            token.add_callback(cancel)
+        try:
+            while True:
+                try:
+                    payload = responses.get(timeout=timeout)
+                except queue.Empty:
+                    self._send_cancel(request_id)
+                    raise ModelHostTimeout(
+                        f"模型宿主在{timeout:.0f}秒内未响应: {command.get('action')}"
+                    ) from None
+                yield payload
+                if payload.get("done", True):
+                    break
+        finally:
+            if token is not None:
+                token.remove_callback(cancel)
+
+    def wait_ready(self, timeout: Optional[float] = 300) -> Dict[str, Any]:
+        """等待worker初始化结果"""
+        self.init_result = self._init_future.result(timeout=timeout)
+        return self.init_result
+
+    # ==================== FunASRServer兼容接口 ====================
+
+    @property
+    def initialized(self) -> bool:
+        return (
+            not self.closed
+            and self.init_result is not None
+            and self.init_result.get("success", False)
+        )
+
+    def transcribe_audio(self, audio, options=None) -> Dict[str, Any]:
+        """
+        转录音频
+
+        Args:
+            audio: 文件路径，或float32 numpy数组（采样率取options["sample_rate"]，默认16000）
+        """
+        options = dict(options or {})
+
+        try:
+            if not isinstance(audio, np.ndarray):
+                command = {"action": "transcribe", "audio_path": str(audio), "options": options}
+                return self.call(command, transcription_timeout(probe_duration(audio)))
+
+            sample_rate = options.pop("sample_rate", 16000)
+            try:
+                ref = self._ring.write(audio, sample_rate)
+            except BufferError as e:
+                return {"success": False, "error": str(e), "type": "buffer_full"}
+
+            command = {"action": "transcribe", "audio": ref, "options": options}
+            future = self.submit(command)
+            # 只有收到响应（worker已不再读取该区块）后才释放，等待超时也不提前复用
+            future.add_done_callback(lambda _: self._ring.release(ref))
+            return self._wait(future, command, transcription_timeout(len(audio) / float(sample_rate)))
+        except ModelHostTimeout as e:
+            logger.error(str(e))
+            return {"success": False, "error": str(e), "type": "timeout"}
+
+    def transcribe_batch(self, audios, options=None):
+        """批量转录多个音频文件，返回与输入等长的结果列表"""
+        total = sum(probe_duration(a) or 0.0 for a in audios)
+        try:
+            result = self.call({"action": "transcribe_batch", "audio_paths": [str(a) for a in audios],
+                                "options": dict(options or {})}, transcription_timeout(total))
+        except ModelHostTimeout as e:
+            logger.error(str(e))
+            result = {"success": False, "error": str(e), "type": "timeout"}
+        if "results" not in result:
+            return [result for _ in audios]
+        return result["results"]
+
+    def detect_segments(self, samples: np.ndarray, sample_rate: int = 16000,
+                        priority: str = DEFAULT_PRIORITY):
+        """VAD，返回[(开始采样点, 结束采样点), ...]；VAD不可用时返回None"""
+        try:
+            ref = self._ring.write(samples, sample_rate)
+        except BufferError as e:
+            raise RuntimeError(str(e))
+
+        command = {"action": "vad", "audio": ref, "priority": priority}
+        future = self.submit(command)
+        future.add_done_callback(lambda _: self._ring.release(ref))
+        try:
+            result = self._wait(future, command, transcription_timeout(len(samples) / float(sample_rate)))
+        except ModelHostTimeout as e:
+            raise RuntimeError(str(e))
+        if not result.get("success"):
+            raise RuntimeError(result.get("error", "VAD失败"))
+        segments = result.get("segments")
+        return None if segments is None else [tuple(seg) for seg in segments]
+
+    def transcribe_long_audio(self, audio, options=None):
+        """长音频分窗口转录（生成器），事件格式同FunASRServer.transcribe_long_audio"""
+        options = dict(options or {})
+
+        if not isinstance(audio, np.ndarray):
+            yield from self._stream_long({"action": "transcribe_long", "audio_path": str(audio),
+                                          "options": options})
+            return
+
+        sample_rate = options.pop("sample_rate", 16000)
+        try:
+            ref = self._ring.write(audio, sample_rate)
+        except BufferError as e:
+            yield {"success": False, "error": str(e), "type": "buffer_full", "event": "final"}
+            return
+
+        # 与transcribe_audio相同，worker发回最后一条响应后才释放共享内存区块
+        yield from self._stream_long({"action": "transcribe_long", "audio": ref, "options": options},
+                                     on_done=lambda: self._ring.release(ref))
+
+    def _stream_long(self, command: Dict[str, Any], on_done: Optional[Callable[[], None]] = None):
+        """流式长音频命令；相邻窗口结果的等待超时时以final错误事件结束"""
+        try:
+            yield from self.stream(command, on_done=on_done)
+        except ModelHostTimeout as e:
+            logger.error(str(e))
+            yield {"success": False, "error": str(e), "type": "timeout", "event": "final"}
+
+    def session_command(self, op: str, data: Optional[bytes] = None, **params) -> Dict[str, Any]:
+        """
+        在模型宿主中执行会话操作（见asr_sessions.SessionManager.handle）
+
+        会话保存在宿主中，同一会话的请求落到任意HTTP worker上都能找到；PCM分块经共享内存以原始字节传递。
+        """
+        command = {"action": f"session_{op}", **params}
+        timeout = TRANSCRIBE_TIMEOUT if op == "finalize" else CONTROL_TIMEOUT
+        try:
+            if not data:
+                return self.call(command, timeout)
+            try:
+                ref = self._ring.write_bytes(data)
+            except BufferError as e:
+                return {"success": False, "error": str(e), "type": "buffer_full"}
+            command["audio"] = ref
+            future = self.submit(command)
+            future.add_done_callback(lambda _: self._ring.release(ref))
+            return self._wait(future, command, timeout)
+        except ModelHostTimeout as e:
+            logger.error(str(e))
+            return {"success": False, "error": str(e), "type": "timeout"}
+
+    def check_status(self) -> Dict[str, Any]:
+        return self.call({"action": "status"})
+
+    def get_readiness(self) -> Dict[str, Any]:
+        if self.closed:
+            return {"ready": False, "initialized": False, "error": "FunASR worker连接已断开"}
+        result = self.call({"action": "readiness"})
+        result.pop("success", None)
+        return result
+
+    def get_performance_stats(self) -> Dict[str, Any]:
+        result = self.call({"action": "stats"})
+        return result.get("stats", {})
+
+    def close(self, timeout: float = 10.0):
+        """
+        关闭客户端并释放共享内存
+
+        自己启动的worker会被要求退出；连接的模型宿主只关闭本连接，宿主继续服务其他前端。
+        """
+        self._shutting_down = True
+        if not self.closed:
+            try:
+                self.call({"action": "exit"}, timeout=timeout)
+            except Exception:
+                pass
+        if self._process is not None:
+            try:
+                self._process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+        self._ring.close()